@@ -0,0 +1,454 @@
+"""Bulk maintenance CLI (direct Postgres, built on migrate.py's connection).
+
+Streams data with keyset-bounded `COPY` chunks and server-side cursors, so
+memory stays flat regardless of table size. Every job checkpoints its
+position in `maintenance_checkpoints` after each batch and resumes from there
+when re-run with the same arguments (use `--restart` to start over).
+
+Run:
+  python maintenance.py export users users.csv.gz
+  python maintenance.py import users users.csv.gz --on-conflict update
+  python maintenance.py recompute-levels --table all
+  python maintenance.py backfill-bitmaps
+"""
+import argparse
+import csv
+import datetime
+import decimal
+import functools
+import gzip
+import io
+import json
+import os
+import sys
+import time
+
+from psycopg2 import sql
+from psycopg2.extras import Json, execute_values
+
+from migrate import CREATE_MAINTENANCE_CHECKPOINTS_SQL, connect, get_db_url
+
+
+# Keyset (primary key) columns per table; chunks are bounded by these
+TABLE_KEYS = {
+    "users": ("id",),
+    "attendances": ("id",),
+    "chat_xp": ("chat_id", "user_id"),
+    "attendance_bitmaps": ("user_id",),
+    "xp_events": ("id",),
+    "xp_rollups": ("user_id", "granularity", "bucket"),
+}
+# tables whose `id` comes from a sequence that must follow imported ids
+SERIAL_TABLES = ("attendances", "xp_events")
+
+# Same curve as telegram_bot.db.calc_level_from_xp: isqrt(max(xp, 0) // 100) + 1
+# (`xp` is an integer column, so `/ 100` is integer division)
+LEVEL_SQL = "floor(sqrt((greatest({col}, 0) / 100)::numeric))::int + 1"
+
+
+class Progress:
+    def __init__(self, job, total=None):
+        self.job = job
+        self.total = total
+        self.done = 0
+        self.start = time.time()
+
+    def add(self, n):
+        self.done += n
+        elapsed = max(time.time() - self.start, 1e-6)
+        total = f"/{self.total}" if self.total else ""
+        print(f"{self.job}: {self.done}{total} rows ({self.done / elapsed:,.0f}/s)", end="\r", file=sys.stderr)
+
+    def finish(self):
+        print(file=sys.stderr)
+
+
+# --- checkpoints ---------------------------------------------------------------
+
+def _json_default(value):
+    # keyset positions can hold timestamp keys (e.g. xp_rollups.bucket); they are
+    # stored tagged so `load_checkpoint` can bind them with their original type
+    if isinstance(value, datetime.datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"$date": value.isoformat()}
+    if isinstance(value, decimal.Decimal):
+        return {"$decimal": str(value)}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+_dumps = functools.partial(json.dumps, default=_json_default)
+_TAGGED = {
+    "$datetime": datetime.datetime.fromisoformat,
+    "$date": datetime.date.fromisoformat,
+    "$decimal": decimal.Decimal,
+}
+
+
+def _decode_position(value):
+    """Undo `_json_default` on a stored position."""
+    if isinstance(value, list):
+        return [_decode_position(v) for v in value]
+    if isinstance(value, dict):
+        if len(value) == 1:
+            (tag, raw), = value.items()
+            if tag in _TAGGED:
+                return _TAGGED[tag](raw)
+        return {k: _decode_position(v) for k, v in value.items()}
+    return value
+
+
+def load_checkpoint(conn, job):
+    with conn.cursor() as cur:
+        cur.execute("SELECT position FROM maintenance_checkpoints WHERE job = %s", (job,))
+        row = cur.fetchone()
+    conn.commit()
+    return _decode_position(row[0]) if row else None
+
+
+def save_checkpoint(cur, job, position):
+    """Record `position` for `job` using `cur` (commit together with the batch)."""
+    cur.execute(
+        "INSERT INTO maintenance_checkpoints (job, position, updated_at) VALUES (%s, %s, now()) "
+        "ON CONFLICT (job) DO UPDATE SET position = EXCLUDED.position, updated_at = now()",
+        (job, Json(position, dumps=_dumps)),
+    )
+
+
+def clear_checkpoint(conn, job):
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM maintenance_checkpoints WHERE job = %s", (job,))
+    conn.commit()
+
+
+# --- keyset helpers --------------------------------------------------------------
+
+def _keys_sql(keys):
+    return sql.SQL("({})").format(sql.SQL(", ").join(map(sql.Identifier, keys)))
+
+
+def _params_sql(keys):
+    return sql.SQL("({})").format(sql.SQL(", ").join(sql.Placeholder() * len(keys)))
+
+
+def _range_where(keys, lo, hi):
+    """WHERE clause and params for `lo < keys <= hi` (either bound may be None)."""
+    parts, params = [], []
+    if lo is not None:
+        parts.append(sql.SQL("{} > {}").format(_keys_sql(keys), _params_sql(keys)))
+        params.extend(lo)
+    if hi is not None:
+        parts.append(sql.SQL("{} <= {}").format(_keys_sql(keys), _params_sql(keys)))
+        params.extend(hi)
+    if not parts:
+        return sql.SQL("TRUE"), params
+    return sql.SQL(" AND ").join(parts), params
+
+
+def next_boundary(cur, table, keys, lo, chunk):
+    """Key of the `chunk`-th row after `lo`, or None if fewer rows remain (index-only scan)."""
+    where, params = _range_where(keys, lo, None)
+    cur.execute(
+        sql.SQL("SELECT {k} FROM {t} WHERE {w} ORDER BY {k} OFFSET %s LIMIT 1").format(
+            k=sql.SQL(", ").join(map(sql.Identifier, keys)),
+            t=sql.Identifier(table),
+            w=where,
+        ),
+        params + [chunk - 1],
+    )
+    row = cur.fetchone()
+    return list(row) if row else None
+
+
+def table_columns(cur, table):
+    cur.execute(sql.SQL("SELECT * FROM {} LIMIT 0").format(sql.Identifier(table)))
+    return [d[0] for d in cur.description]
+
+
+def _open_text(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8", newline="")
+    return open(path, mode, encoding="utf-8", newline="")
+
+
+# --- jobs --------------------------------------------------------------------------
+
+def export_table(conn, table, out_path, chunk, restart):
+    """COPY `table` to CSV in keyset chunks; each chunk is appended (one gzip member for .gz)."""
+    keys = TABLE_KEYS[table]
+    job = f"export:{table}:{os.path.abspath(out_path)}"
+    pos = None if restart else load_checkpoint(conn, job)
+    cur = conn.cursor()
+    cols = table_columns(cur, table)
+
+    if pos is None:
+        with _open_text(out_path, "w") as f:
+            csv.writer(f).writerow(cols)
+        pos = {"after": None, "rows": 0, "offset": os.path.getsize(out_path)}
+    else:
+        # drop anything written after the last checkpointed chunk
+        with open(out_path, "r+b") as f:
+            f.truncate(pos["offset"])
+
+    progress = Progress(job)
+    progress.add(pos["rows"])
+    select_cols = sql.SQL(", ").join(map(sql.Identifier, cols))
+    order = sql.SQL(", ").join(map(sql.Identifier, keys))
+    while True:
+        hi = next_boundary(cur, table, keys, pos["after"], chunk)
+        where, params = _range_where(keys, pos["after"], hi)
+        query = sql.SQL("COPY (SELECT {c} FROM {t} WHERE {w} ORDER BY {o}) TO STDOUT WITH (FORMAT csv)").format(
+            c=select_cols, t=sql.Identifier(table), w=where, o=order
+        )
+        buf = io.BytesIO()
+        cur.copy_expert(cur.mogrify(query, params).decode(), buf)
+        data = buf.getvalue()
+        if out_path.endswith(".gz"):
+            data = gzip.compress(data)
+        with open(out_path, "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        rows = buf.getvalue().count(b"\n") if hi is None else chunk
+        progress.add(rows)
+        if hi is None:
+            break
+        pos = {"after": hi, "rows": pos["rows"] + rows, "offset": os.path.getsize(out_path)}
+        save_checkpoint(cur, job, pos)
+        conn.commit()
+    progress.finish()
+    clear_checkpoint(conn, job)
+
+
+def _iter_batches(reader, size):
+    batch = []
+    for row in reader:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def import_table(conn, table, in_path, batch_size, on_conflict, restart):
+    """Load a CSV (with header) into `table` via COPY into a temp stage and one INSERT per batch."""
+    keys = TABLE_KEYS[table]
+    job = f"import:{table}:{os.path.abspath(in_path)}"
+    pos = None if restart else load_checkpoint(conn, job)
+    done = pos["rows"] if pos else 0
+    cur = conn.cursor()
+    table_cols = set(table_columns(cur, table))
+
+    with _open_text(in_path, "r") as f:
+        reader = csv.reader(f)
+        cols = next(reader)
+        unknown = [c for c in cols if c not in table_cols]
+        if unknown or not set(keys) <= set(cols):
+            raise SystemExit(f"{in_path}: columns {unknown or cols} do not match table {table}")
+
+        cur.execute(
+            sql.SQL("CREATE TEMP TABLE maint_stage (LIKE {} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS").format(
+                sql.Identifier(table)
+            )
+        )
+        conn.commit()
+        col_list = sql.SQL(", ").join(map(sql.Identifier, cols))
+        if on_conflict == "update" and set(cols) - set(keys):
+            action = sql.SQL("DO UPDATE SET {}").format(
+                sql.SQL(", ").join(
+                    sql.SQL("{c} = EXCLUDED.{c}").format(c=sql.Identifier(c)) for c in cols if c not in keys
+                )
+            )
+        else:
+            action = sql.SQL("DO NOTHING")
+        copy_sql = sql.SQL("COPY maint_stage ({}) FROM STDIN WITH (FORMAT csv)").format(col_list).as_string(conn)
+        insert_sql = sql.SQL("INSERT INTO {t} ({c}) SELECT {c} FROM maint_stage ON CONFLICT {k} {a}").format(
+            t=sql.Identifier(table), c=col_list, k=_keys_sql(keys), a=action
+        )
+
+        # skip rows already imported by an earlier run
+        for _ in range(done):
+            next(reader, None)
+        progress = Progress(job)
+        progress.add(done)
+        for batch in _iter_batches(reader, batch_size):
+            buf = io.StringIO()
+            csv.writer(buf).writerows(batch)
+            buf.seek(0)
+            cur.copy_expert(copy_sql, buf)
+            cur.execute(insert_sql)
+            done += len(batch)
+            save_checkpoint(cur, job, {"rows": done})
+            conn.commit()
+            progress.add(len(batch))
+        progress.finish()
+
+    if table in SERIAL_TABLES and "id" in cols:
+        cur.execute(
+            sql.SQL("SELECT setval(pg_get_serial_sequence(%s, 'id'), GREATEST((SELECT max(id) FROM {}), 1))").format(
+                sql.Identifier(table)
+            ),
+            (table,),
+        )
+        conn.commit()
+    clear_checkpoint(conn, job)
+
+
+def recompute_levels(conn, table, batch_size, restart):
+    """Set `level` from `xp` with one UPDATE per keyset chunk (only rows whose level changes)."""
+    keys = TABLE_KEYS[table]
+    job = f"recompute-levels:{table}"
+    pos = None if restart else load_checkpoint(conn, job)
+    lo = pos["after"] if pos else None
+    level = sql.SQL(LEVEL_SQL.format(col="xp"))
+    cur = conn.cursor()
+    progress = Progress(job)
+    changed = 0
+    while True:
+        hi = next_boundary(cur, table, keys, lo, batch_size)
+        where, params = _range_where(keys, lo, hi)
+        cur.execute(
+            sql.SQL("UPDATE {t} SET level = {lv} WHERE {w} AND level IS DISTINCT FROM {lv}").format(
+                t=sql.Identifier(table), lv=level, w=where
+            ),
+            params,
+        )
+        changed += cur.rowcount
+        if hi is None:
+            conn.commit()
+            break
+        save_checkpoint(cur, job, {"after": hi})
+        conn.commit()
+        progress.add(batch_size)
+        lo = hi
+    progress.finish()
+    clear_checkpoint(conn, job)
+    print(f"{job}: {changed} rows updated")
+
+
+def backfill_bitmaps(conn, write_conn, batch_size, restart):
+    """Rebuild `attendance_bitmaps` from `attendances` with one server-side cursor pass."""
+    from telegram_bot.services.attendance_bitmap import AttendanceBitmap
+
+    job = "backfill-bitmaps"
+    pos = None if restart else load_checkpoint(write_conn, job)
+    after = pos["after"] if pos else None
+
+    read = conn.cursor(name="maint_attendances")
+    read.itersize = 10000
+    # KST epoch day, matching telegram_bot.services.attendance_bitmap.ts_to_epoch_day
+    query = (
+        "SELECT user_id, ((ts AT TIME ZONE 'Asia/Seoul')::date - DATE '1970-01-01') AS day "
+        "FROM attendances {} ORDER BY user_id"
+    )
+    if after is None:
+        read.execute(query.format(""))
+    else:
+        read.execute(query.format("WHERE user_id > %s"), (after,))
+
+    wcur = write_conn.cursor()
+    progress = Progress(job)
+    pending = []
+
+    def _flush(last_uid):
+        execute_values(
+            wcur,
+            "INSERT INTO attendance_bitmaps (user_id, anchor_day, bits, updated_at) VALUES %s "
+            "ON CONFLICT (user_id) DO UPDATE SET anchor_day = EXCLUDED.anchor_day, bits = EXCLUDED.bits, "
+            "updated_at = EXCLUDED.updated_at",
+            pending,
+            template="(%s, %s, %s, now())",
+        )
+        save_checkpoint(wcur, job, {"after": last_uid})
+        write_conn.commit()
+        progress.add(len(pending))
+        pending.clear()
+
+    cur_uid, bm = None, None
+    for uid, day in read:
+        if uid != cur_uid:
+            if bm is not None:
+                pending.append((cur_uid, bm.anchor, bm.encode()))
+                if len(pending) >= batch_size:
+                    _flush(cur_uid)
+            cur_uid, bm = uid, AttendanceBitmap(day)
+        bm.set(day)
+    if bm is not None:
+        pending.append((cur_uid, bm.anchor, bm.encode()))
+    if pending:
+        _flush(cur_uid)
+    read.close()
+    conn.commit()
+    progress.finish()
+    clear_checkpoint(write_conn, job)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--restart", action="store_true", help="ignore any saved checkpoint for the job")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("export", help="export a table to CSV (.gz for gzip)")
+    p.add_argument("table", choices=sorted(TABLE_KEYS))
+    p.add_argument("out")
+    p.add_argument("--chunk", type=int, default=100_000)
+
+    p = sub.add_parser("import", help="import a CSV with header into a table")
+    p.add_argument("table", choices=sorted(TABLE_KEYS))
+    p.add_argument("path")
+    p.add_argument("--batch", type=int, default=50_000)
+    p.add_argument("--on-conflict", choices=("skip", "update"), default="skip")
+
+    p = sub.add_parser("recompute-levels", help="recompute level from xp with the current curve")
+    p.add_argument("--table", choices=("users", "chat_xp", "all"), default="all")
+    p.add_argument("--batch", type=int, default=50_000)
+
+    p = sub.add_parser("backfill-bitmaps", help="rebuild attendance_bitmaps from attendances")
+    p.add_argument("--batch", type=int, default=1_000)
+
+    args = parser.parse_args(argv)
+
+    db_url = get_db_url()
+    if not db_url:
+        print("DATABASE_URL or SUPABASE_URL not set. Set it in your .env or environment.")
+        return 2
+    conn = connect(db_url)
+    if conn is None:
+        return 1
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(CREATE_MAINTENANCE_CHECKPOINTS_SQL)
+        conn.commit()
+
+        if args.command == "export":
+            export_table(conn, args.table, args.out, args.chunk, args.restart)
+        elif args.command == "import":
+            import_table(conn, args.table, args.path, args.batch, args.on_conflict, args.restart)
+        elif args.command == "recompute-levels":
+            tables = ("users", "chat_xp") if args.table == "all" else (args.table,)
+            for table in tables:
+                recompute_levels(conn, table, args.batch, args.restart)
+        elif args.command == "backfill-bitmaps":
+            write_conn = connect(db_url)
+            if write_conn is None:
+                return 1
+            try:
+                backfill_bitmaps(conn, write_conn, args.batch, args.restart)
+            finally:
+                write_conn.close()
+        return 0
+    except KeyboardInterrupt:
+        print("\n중단됨: 다시 실행하면 마지막 체크포인트부터 이어서 진행합니다.")
+        return 130
+    except Exception as e:
+        conn.rollback()
+        print(f"작업 실패: {e}")
+        return 1
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
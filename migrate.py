@@ -40,31 +40,189 @@ ALTER_USERS_SQL = """
 ALTER TABLE users ADD COLUMN IF NOT EXISTS xp integer DEFAULT 0;
 ALTER TABLE users ADD COLUMN IF NOT EXISTS level integer DEFAULT 1;
 CREATE INDEX IF NOT EXISTS idx_users_xp ON users (xp DESC);
+CREATE INDEX IF NOT EXISTS idx_users_xp_id ON users (xp DESC, id);
 ALTER TABLE users ADD COLUMN IF NOT EXISTS last_xp_at timestamptz;
 """
 
 
-def main() -> int:
+# Per-chat XP ledger; the composite index backs per-chat leaderboards
+CREATE_CHAT_XP_SQL = """
+CREATE TABLE IF NOT EXISTS chat_xp (
+  chat_id bigint NOT NULL,
+  user_id bigint NOT NULL,
+  xp integer NOT NULL DEFAULT 0,
+  level integer NOT NULL DEFAULT 1,
+  updated_at timestamptz,
+  PRIMARY KEY (chat_id, user_id)
+);
+CREATE INDEX IF NOT EXISTS idx_chat_xp_chat_xp ON chat_xp (chat_id, xp DESC, user_id);
+"""
+
+
+# Per-user attendance day bitmap: bit i set <=> attended on KST epoch day
+# anchor_day + i. `bits` is the little-endian bitmap, base64 encoded.
+CREATE_ATTENDANCE_BITMAPS_SQL = """
+CREATE TABLE IF NOT EXISTS attendance_bitmaps (
+  user_id bigint PRIMARY KEY,
+  anchor_day integer NOT NULL,
+  bits text NOT NULL,
+  updated_at timestamptz NOT NULL DEFAULT now()
+);
+"""
+
+
+# Append-only XP event log plus hourly/daily (KST) rollups. `record_xp_events`
+# inserts a batch of events and folds them into the rollups in one statement.
+CREATE_XP_EVENTS_SQL = """
+CREATE TABLE IF NOT EXISTS xp_events (
+  id bigserial PRIMARY KEY,
+  user_id bigint NOT NULL,
+  chat_id bigint,
+  amount integer NOT NULL,
+  source text NOT NULL DEFAULT 'message',
+  ts timestamptz NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_xp_events_ts ON xp_events (ts);
+CREATE TABLE IF NOT EXISTS xp_rollups (
+  user_id bigint NOT NULL,
+  granularity char(1) NOT NULL,
+  bucket timestamptz NOT NULL,
+  amount bigint NOT NULL DEFAULT 0,
+  events integer NOT NULL DEFAULT 0,
+  PRIMARY KEY (user_id, granularity, bucket)
+);
+CREATE OR REPLACE FUNCTION record_xp_events(events jsonb) RETURNS void
+LANGUAGE sql AS $$
+  WITH ev AS (
+    INSERT INTO xp_events (user_id, chat_id, amount, source, ts)
+    SELECT (e->>'user_id')::bigint,
+           (e->>'chat_id')::bigint,
+           (e->>'amount')::integer,
+           coalesce(e->>'source', 'message'),
+           coalesce((e->>'ts')::timestamptz, now())
+    FROM jsonb_array_elements(events) AS e
+    RETURNING user_id, amount, ts
+  ), buckets AS (
+    SELECT user_id, 'h' AS g, date_trunc('hour', ts) AS bucket, amount FROM ev
+    UNION ALL
+    SELECT user_id, 'd', date_trunc('day', ts AT TIME ZONE 'Asia/Seoul') AT TIME ZONE 'Asia/Seoul', amount FROM ev
+  )
+  INSERT INTO xp_rollups (user_id, granularity, bucket, amount, events)
+  SELECT user_id, g, bucket, sum(amount), count(*) FROM buckets GROUP BY user_id, g, bucket
+  ON CONFLICT (user_id, granularity, bucket) DO UPDATE
+    SET amount = xp_rollups.amount + EXCLUDED.amount,
+        events = xp_rollups.events + EXCLUDED.events;
+$$;
+"""
+
+
+# Per chat / KST day activity counters written by the stats service. `hll` is a
+# base64 HyperLogLog register array, `top` a Space-Saving [[user_id, count, error]] list.
+CREATE_CHAT_DAILY_STATS_SQL = """
+CREATE TABLE IF NOT EXISTS chat_daily_stats (
+  chat_id bigint NOT NULL,
+  day date NOT NULL,
+  messages integer NOT NULL DEFAULT 0,
+  attendances integer NOT NULL DEFAULT 0,
+  hll text,
+  top jsonb,
+  updated_at timestamptz NOT NULL DEFAULT now(),
+  PRIMARY KEY (chat_id, day)
+);
+"""
+
+
+# Resume positions for `maintenance.py` jobs, written in the same transaction
+# as each batch so a resumed job never applies a batch twice.
+CREATE_MAINTENANCE_CHECKPOINTS_SQL = """
+CREATE TABLE IF NOT EXISTS maintenance_checkpoints (
+  job text PRIMARY KEY,
+  position jsonb NOT NULL,
+  updated_at timestamptz NOT NULL DEFAULT now()
+);
+"""
+
+
+# One row per KST day: the global ranking (top N users) at midnight as a
+# base64, zlib-compressed int64 array of interleaved (user_id, xp) pairs in rank
+# order. Written and pruned by the bot's leaderboard snapshot job.
+CREATE_LEADERBOARD_SNAPSHOTS_SQL = """
+CREATE TABLE IF NOT EXISTS leaderboard_snapshots (
+  day date PRIMARY KEY,
+  users integer NOT NULL,
+  complete boolean NOT NULL DEFAULT true,
+  data text NOT NULL,
+  created_at timestamptz NOT NULL DEFAULT now()
+);
+"""
+
+
+# One row per admin /broadcast. `after_id` is the resume position: every
+# recipient with an id up to it has been handled. The bot checkpoints it with
+# the counters every few seconds and resumes `running` broadcasts on startup.
+CREATE_BROADCASTS_SQL = """
+CREATE TABLE IF NOT EXISTS broadcasts (
+  id bigserial PRIMARY KEY,
+  text text NOT NULL,
+  created_by bigint NOT NULL,
+  status text NOT NULL DEFAULT 'running',
+  after_id bigint NOT NULL DEFAULT 0,
+  sent integer NOT NULL DEFAULT 0,
+  blocked integer NOT NULL DEFAULT 0,
+  skipped integer NOT NULL DEFAULT 0,
+  failed integer NOT NULL DEFAULT 0,
+  progress_chat_id bigint,
+  progress_message_id bigint,
+  created_at timestamptz NOT NULL DEFAULT now(),
+  updated_at timestamptz NOT NULL DEFAULT now()
+);
+"""
+
+
+# Users the bot can no longer message (blocked the bot, deactivated, chat not
+# found). Broadcasts skip them; delete a row to include the user again.
+CREATE_BLOCKED_USERS_SQL = """
+CREATE TABLE IF NOT EXISTS blocked_users (
+  user_id bigint PRIMARY KEY,
+  reason text,
+  blocked_at timestamptz NOT NULL DEFAULT now()
+);
+"""
+
+
+def get_db_url():
     # Prefer DATABASE_URL for local postgres, but allow SUPABASE_URL for backwards compatibility
-    db_url = os.getenv("DATABASE_URL") or os.getenv("SUPABASE_URL")
-    if not db_url:
-        print("DATABASE_URL or SUPABASE_URL not set. Set it in your .env or environment.")
-        return 2
+    return os.getenv("DATABASE_URL") or os.getenv("SUPABASE_URL")
+
 
+def connect(db_url, timeout=30):
+    """Open a psycopg2 connection, waiting up to `timeout` seconds for the DB.
+
+    Returns None (after printing the error) if the DB stays unreachable.
+    """
     # Wait for DB to be available (useful when Postgres takes a moment to start)
     start = time.time()
-    timeout = 30
     while True:
         try:
-            conn = psycopg2.connect(db_url)
-            break
+            return psycopg2.connect(db_url)
         except Exception as e:
             if time.time() - start > timeout:
                 print(f"DB connection timed out after {timeout}s: {e}")
-                return 1
+                return None
             print("Waiting for DB to be available...", end="\r")
             time.sleep(1)
 
+
+def main() -> int:
+    db_url = get_db_url()
+    if not db_url:
+        print("DATABASE_URL or SUPABASE_URL not set. Set it in your .env or environment.")
+        return 2
+
+    conn = connect(db_url)
+    if conn is None:
+        return 1
+
     try:
         conn.autocommit = True
         cur = conn.cursor()
@@ -72,7 +230,15 @@ def main() -> int:
         cur.execute(CREATE_ATTENDANCES_SQL)
         cur.execute(CREATE_ATT_IDX_SQL)
         cur.execute(ALTER_USERS_SQL)
-        print("마이그레이션 완료: users 및 attendances 테이블이 생성되었거나 이미 존재합니다.")
+        cur.execute(CREATE_CHAT_XP_SQL)
+        cur.execute(CREATE_XP_EVENTS_SQL)
+        cur.execute(CREATE_ATTENDANCE_BITMAPS_SQL)
+        cur.execute(CREATE_CHAT_DAILY_STATS_SQL)
+        cur.execute(CREATE_MAINTENANCE_CHECKPOINTS_SQL)
+        cur.execute(CREATE_LEADERBOARD_SNAPSHOTS_SQL)
+        cur.execute(CREATE_BROADCASTS_SQL)
+        cur.execute(CREATE_BLOCKED_USERS_SQL)
+        print("마이그레이션 완료: 필요한 테이블이 생성되었거나 이미 존재합니다.")
         cur.close()
         conn.close()
         return 0
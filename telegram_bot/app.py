@@ -2,24 +2,30 @@
 
 import os
 import asyncio
+import logging
 from dotenv import load_dotenv
 
+from telegram import Update
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
+    InlineQueryHandler,
+    TypeHandler,
     filters,
 )
 
-from .handlers import core as core_handlers
-from .handlers import attendance as attendance_handlers
-from .handlers import profile as profile_handlers
-from .handlers import on_message as on_message_handlers
-from .handlers import weather as weather_handlers
-from .handlers import fortune as fortune_handlers
+from . import commands
+from . import handlers  # registers command metadata; handler modules load lazily
+from .commands import lazy_callback
+from .services import membership
+from .services import rank_history
+from .services import stats_service
 from .services import xp_service
 from .services import weather_service
+from . import db
+from . import snapshot
 
 
 def build_app():
@@ -32,57 +38,125 @@ def build_app():
 
     app = ApplicationBuilder().token(token).build()
 
-    # Core command handlers
-    app.add_handler(CommandHandler("start", core_handlers.start))
-    app.add_handler(CommandHandler("help", core_handlers.help_command))
-    app.add_handler(CommandHandler("ping", core_handlers.ping))
-    app.add_handler(CommandHandler("register", profile_handlers.register))
-    app.add_handler(CommandHandler("me", profile_handlers.me))
-    app.add_handler(CommandHandler("xp", profile_handlers.xp))
-    app.add_handler(CommandHandler("leaderboard", profile_handlers.leaderboard))
-    app.add_handler(CommandHandler("attend", attendance_handlers.attend))
-    app.add_handler(CommandHandler("attendance", attendance_handlers.attendance))
-    app.add_handler(CommandHandler("streak", attendance_handlers.streak))
-    app.add_handler(CommandHandler("fortune", fortune_handlers.fortune))
-
-    # XP awarding for normal messages
+    # Duplicate updates (redelivered or refetched) are dropped before anything else runs
+    app.add_handler(TypeHandler(Update, lazy_callback("dedup", "dedup_guard")), group=-2)
+
+    # Flood control runs before every other handler and can stop dispatch
+    app.add_handler(TypeHandler(Update, lazy_callback("flood", "flood_guard")), group=-1)
+
+    # Command handlers from the registry
+    for spec in commands.all_commands():
+        app.add_handler(CommandHandler(spec.name, lazy_callback(spec.module, spec.attr)))
+
+    # Attendance history pagination (must precede the weather catch-all callback)
     app.add_handler(
-        MessageHandler(filters.TEXT & ~filters.COMMAND, on_message_handlers.on_message)
-    )
+        CallbackQueryHandler(lazy_callback("attendance", "history_page_button"), pattern=r"^ATT:")
+    )
 
+    # Leaderboard pagination
+    app.add_handler(
+        CallbackQueryHandler(lazy_callback("profile", "leaderboard_page_button"), pattern=r"^LB:")
+    )
+
     # Weather handlers
-    app.add_handler(CommandHandler("weather", weather_handlers.weather_cmd))
-    app.add_handler(CallbackQueryHandler(weather_handlers.button_handler))
+    app.add_handler(CallbackQueryHandler(lazy_callback("weather", "button_handler")))
+    app.add_handler(
+        MessageHandler(filters.TEXT & ~filters.COMMAND, lazy_callback("weather", "add_location"))
+    )
+    # shared locations (not live-location edits): weather by geohash cell
+    app.add_handler(
+        MessageHandler(filters.LOCATION & filters.UpdateType.MESSAGE, lazy_callback("weather", "location_handler"))
+    )
+
+    # Inline mode; non-blocking so the per-user debounce does not hold up other updates
+    app.add_handler(InlineQueryHandler(lazy_callback("inline", "inline_query"), block=False))
+
+    # XP awarding for normal messages; a separate group so it runs alongside
+    # the weather text handler instead of shadowing it
     app.add_handler(
-        MessageHandler(filters.TEXT & ~filters.COMMAND, weather_handlers.add_location)
+        MessageHandler(filters.TEXT & ~filters.COMMAND, lazy_callback("on_message", "on_message")),
+        group=1,
     )
 
     return app
 
 
+async def _warm_up(app) -> None:
+    """Warm the DB client, HTTP pool and DNS and publish the command menu in parallel."""
+    results = await asyncio.gather(
+        db.warm_up(),
+        weather_service.warm_up(),
+        app.bot.set_my_commands(commands.bot_commands()),
+        return_exceptions=True,
+    )
+    for name, res in zip(("db", "weather", "commands"), results):
+        if isinstance(res, Exception):
+            logging.warning("warm-up step %s failed: %s", name, res)
+
+
 async def post_init_cb(app):
     """Called after the application starts and the event loop is running."""
+    from .handlers import admin as admin_handlers
+    from .handlers import level_up as level_up_handlers
+    from .handlers import stats as stats_handlers
+
+    # restore caches and unflushed XP from the previous run before warming up
+    revalidation_plan = await snapshot.load()
+    await _warm_up(app)
+
     xp_task = app.create_task(
         xp_service.start_background_flush(interval_seconds=2.0)
     )
 
     # Store task reference in an officially supported container
     app.bot_data["xp_task"] = xp_task
+    app.bot_data["xp_compaction_task"] = app.create_task(
+        xp_service.start_background_compaction()
+    )
+    app.bot_data["level_up_task"] = app.create_task(
+        level_up_handlers.run_level_up_notifier(app.bot)
+    )
+    app.bot_data["snapshot_task"] = app.create_task(snapshot.revalidate(revalidation_plan))
+    app.bot_data["membership_task"] = app.create_task(membership.load_until_ready())
+    app.bot_data["stats_task"] = app.create_task(stats_service.start_background_flush())
+    app.bot_data["stats_digest_task"] = app.create_task(stats_handlers.run_daily_digest(app.bot))
+    app.bot_data["rank_snapshot_task"] = app.create_task(rank_history.run_daily_snapshots())
+    app.bot_data["broadcast_task"] = app.create_task(admin_handlers.resume_broadcast(app))
+    admin_handlers.install_signal_handler(app)
 
 
 async def post_shutdown_cb(app):
     """Gracefully shut down background tasks and services."""
-    # Cancel XP background task
-    xp_task = app.bot_data.get("xp_task")
-    if xp_task:
-        xp_task.cancel()
-        try:
-            await xp_task
-        except asyncio.CancelledError:
-            pass
+    # Cancel XP background tasks
+    for key in (
+        "xp_task",
+        "xp_compaction_task",
+        "level_up_task",
+        "snapshot_task",
+        "membership_task",
+        "stats_task",
+        "stats_digest_task",
+        "rank_snapshot_task",
+        "broadcast_task",
+        "profile_task",
+    ):
+        task = app.bot_data.get(key)
+        if task:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
 
     # Flush remaining XP data
     await xp_service.flush_pending()
+    try:
+        await stats_service.flush()
+    except Exception as e:
+        logging.warning("final stats flush failed: %s", e)
+    # persist caches and anything the final flush could not write
+    await snapshot.save()
+    db.shutdown_executor()
 
     # Close weather service resources
     await weather_service.close_client()
@@ -0,0 +1,81 @@
+"""Declarative command registry.
+
+Handler packages register `CommandSpec` entries describing each command
+(name, handler location, help text). The application wires handlers from the
+registry using lazy callbacks, so a handler module — and whatever it imports —
+is only loaded the first time one of its commands is used. `/help` and the
+Telegram command menu (`setMyCommands`) are generated from the same entries.
+"""
+from __future__ import annotations
+
+import importlib
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+_HANDLER_PACKAGE = "telegram_bot.handlers"
+
+
+@dataclass(frozen=True)
+class CommandSpec:
+    name: str
+    module: str
+    attr: str
+    description: str
+    emoji: str = "•"
+    usage: str = ""
+    # extra help lines shown under the command in /help
+    details: tuple[str, ...] = field(default_factory=tuple)
+    # hidden commands are routed but left out of /help and the command menu
+    hidden: bool = False
+    # flood-control tokens charged per use; reflects backend cost (DB/API calls)
+    cost: float = 1.0
+
+    def help_line(self) -> str:
+        usage = f" {self.usage}" if self.usage else ""
+        return f"{self.emoji} /{self.name}{usage} — {self.description}"
+
+
+_registry: dict[str, CommandSpec] = {}
+
+
+def register(*specs: CommandSpec) -> None:
+    for spec in specs:
+        _registry[spec.name] = spec
+
+
+def all_commands() -> list[CommandSpec]:
+    return list(_registry.values())
+
+
+def get(name: str) -> CommandSpec | None:
+    return _registry.get(name)
+
+
+def lazy_callback(module: str, attr: str) -> Callable[..., Awaitable[Any]]:
+    """Return a callback that imports `telegram_bot.handlers.<module>` on first call."""
+    target: Callable[..., Awaitable[Any]] | None = None
+
+    async def _callback(update, context):
+        nonlocal target
+        if target is None:
+            target = getattr(importlib.import_module(f"{_HANDLER_PACKAGE}.{module}"), attr)
+        return await target(update, context)
+
+    _callback.__name__ = attr
+    _callback.__qualname__ = f"{module}.{attr}"
+    return _callback
+
+
+def help_text() -> str:
+    lines: list[str] = []
+    for spec in _registry.values():
+        if spec.hidden:
+            continue
+        lines.append(spec.help_line())
+        lines.extend(spec.details)
+    return "\n".join(lines)
+
+
+def bot_commands() -> list[tuple[str, str]]:
+    """(command, description) pairs for `Bot.set_my_commands`."""
+    return [(s.name, s.description[:256]) for s in _registry.values() if not s.hidden]
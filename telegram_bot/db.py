@@ -2,23 +2,45 @@
 import os
 import asyncio
 import datetime
+import logging
 from datetime import timezone
 from typing import Optional, Any
 import math
 import threading
 import time
+from urllib.parse import urlparse
 
-from supabase import create_client
+from .executor import DeadlineExceeded, LaneExecutor
+from .models import AttendanceRow, LeaderboardEntry, UserRow, parse_ts
+from .resilience import CLOSED, CircuitBreaker
 
 _client = None
 
+# Dedicated executor for blocking Supabase calls. Interactive reads and
+# background writes (XP flushes, compaction, bulk rebuilds) get separate pools
+# so a backlog of writes cannot starve user-facing commands.
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+_executor: Optional[LaneExecutor] = None
+_executor_lock = threading.Lock()
+
+# Trips after repeated timeouts/connection errors so handlers fail fast with
+# `DatabaseUnavailable` instead of queueing behind a stalled backend.
+_breaker = CircuitBreaker("supabase", failure_threshold=5, reset_timeout=15.0)
+_hedge_stats = {"sent": 0, "won": 0}
+
+
+class DatabaseUnavailable(RuntimeError):
+    """The database is unreachable or too slow; the call was not (fully) made."""
+
+    def __init__(self, message: str = "데이터베이스에 일시적으로 연결할 수 없습니다. 잠시 후 다시 시도해 주세요."):
+        super().__init__(message)
+
 # simple in-process cache for user rows keyed by user_id
-_user_cache: dict[int, tuple[dict, float]] = {}
+_user_cache: dict[int, tuple[UserRow, float]] = {}
 # cache TTL seconds for user info; small value reduces stale data
 _USER_CACHE_TTL = 5.0
 _cache_lock = threading.Lock()
-_leaderboard_cache: dict[int, tuple[Any, float]] = {}
-_LEADERBOARD_CACHE_TTL = 3.0
 
 
 def _init_client():
@@ -28,11 +50,181 @@ def _init_client():
         key = os.getenv("SUPABASE_KEY")
         if not url or not key:
             raise RuntimeError("SUPABASE_URL or SUPABASE_KEY not set in environment")
-        _client = create_client(url, key)
+        # imported here so that importing this module stays cheap at startup
+        from supabase import ClientOptions, create_client
+
+        # the client's default HTTP timeout (120s) would pin an executor thread
+        # long after the caller has given up; keep it close to the lane deadlines
+        timeout = float(os.getenv("DB_HTTP_TIMEOUT_SEC", "10"))
+        _client = create_client(url, key, options=ClientOptions(postgrest_client_timeout=timeout))
     return _client
 
 
-def _cache_get(user_id: int) -> Optional[dict]:
+def _get_executor() -> LaneExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = LaneExecutor(
+                "db",
+                {
+                    INTERACTIVE: int(os.getenv("DB_INTERACTIVE_WORKERS", "8")),
+                    BACKGROUND: int(os.getenv("DB_BACKGROUND_WORKERS", "4")),
+                },
+                default_deadlines={
+                    INTERACTIVE: float(os.getenv("DB_INTERACTIVE_DEADLINE_SEC", "8")),
+                    BACKGROUND: float(os.getenv("DB_BACKGROUND_DEADLINE_SEC", "30")),
+                },
+            )
+        return _executor
+
+
+def _is_backend_failure(e: BaseException) -> bool:
+    """Timeouts and transport errors count against the breaker; query errors do not."""
+    if isinstance(e, (DeadlineExceeded, OSError)):
+        return True
+    return type(e).__module__.split(".")[0] in ("httpx", "httpcore")
+
+
+def _admit() -> bool:
+    """Pass the breaker or raise `DatabaseUnavailable`; True if this call is the half-open probe."""
+    # allowed while not closed means this call is the half-open probe
+    probe = _breaker.state != CLOSED
+    if not _breaker.allow():
+        raise DatabaseUnavailable()
+    return probe
+
+
+def _record_error(e: Exception, lane: str) -> Exception:
+    """Record a failed call on the breaker and return the exception to raise in its place."""
+    if not _is_backend_failure(e):
+        # the backend answered (e.g. a constraint error), so it is healthy
+        _breaker.record_success()
+        return e
+    _breaker.record_failure()
+    logging.warning("DB call failed on %s lane (breaker %s): %s: %s", lane, _breaker.state, type(e).__name__, e)
+    err = DatabaseUnavailable()
+    err.__cause__ = e
+    return err
+
+
+async def _run(fn, lane: str = INTERACTIVE, deadline: Optional[float] = None):
+    """Run a blocking `_sync` function on the DB executor lane.
+
+    Raises `DatabaseUnavailable` without running `fn` while the breaker is
+    open, and in place of deadline/transport errors.
+    """
+    probe = _admit()
+    try:
+        result = await _get_executor().run(fn, lane=lane, deadline=deadline)
+    except Exception as e:
+        raise _record_error(e, lane)
+    except BaseException:
+        # cancelled (e.g. shutdown): no outcome, but free the probe slot
+        if probe:
+            _breaker.release_probe()
+        raise
+    _breaker.record_success()
+    return result
+
+
+async def _run_hedged(fn, lane: str = INTERACTIVE, deadline: Optional[float] = None):
+    """Like `_run`, but send a second copy of `fn` if the first is slow.
+
+    Only for idempotent reads. The hedge is sent after `DB_HEDGE_AFTER_SEC`
+    (0 disables hedging), and not at all when the breaker is not closed or the
+    lane has no idle worker, so hedging cannot amplify an overload. The pair
+    is one outcome for the breaker: a success if either copy succeeds, one
+    failure if both fail.
+    """
+    delay = float(os.getenv("DB_HEDGE_AFTER_SEC", "0.5"))
+    if delay <= 0:
+        return await _run(fn, lane=lane, deadline=deadline)
+    probe = _admit()
+    executor = _get_executor()
+    first = asyncio.ensure_future(executor.run(fn, lane=lane, deadline=deadline))
+    second: Optional[asyncio.Future] = None
+    pending = {first}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if not done and _breaker.state == CLOSED and executor.idle(lane) > 0:
+            _hedge_stats["sent"] += 1
+            second = asyncio.ensure_future(executor.run(fn, lane=lane, deadline=deadline))
+            pending.add(second)
+        error: Optional[Exception] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                e = task.exception()
+                if e is None:
+                    if task is second:
+                        _hedge_stats["won"] += 1
+                    _breaker.record_success()
+                    return task.result()
+                # an answer from the backend outranks a transport failure of the other copy
+                if error is None or _is_backend_failure(error):
+                    error = e
+    except BaseException:
+        if probe:
+            _breaker.release_probe()
+        raise
+    finally:
+        for task in pending:
+            task.cancel()
+    raise _record_error(error, lane)
+
+
+def executor_stats() -> dict:
+    """Per-lane queue depth, wait time and execution time of the DB executor."""
+    return _get_executor().stats() if _executor is not None else {}
+
+
+def health() -> dict:
+    """Breaker state, hedging counters and executor stats for the metrics layer."""
+    return {
+        "breaker": _breaker.snapshot(),
+        "hedges": dict(_hedge_stats),
+        "executor": executor_stats(),
+    }
+
+
+def shutdown_executor() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
+
+
+async def warm_up() -> None:
+    """Create the client, resolve the Supabase host and open a connection.
+
+    Meant to run from `post_init` so the first user request does not pay for
+    client construction, DNS and the TLS handshake.
+    """
+    url = os.getenv("SUPABASE_URL")
+    host = urlparse(url).hostname if url else None
+    loop = asyncio.get_running_loop()
+
+    async def _dns():
+        if host:
+            await loop.getaddrinfo(host, 443)
+
+    def _sync():
+        client = _init_client()
+        return client.table("users").select("id").limit(1).execute()
+
+    await asyncio.gather(_dns(), _run(_sync))
+
+
+def _rows(res: Any) -> list[dict]:
+    """Extract the row list from a PostgREST response (dict or response object)."""
+    data = res.get("data") if isinstance(res, dict) else getattr(res, "data", None)
+    if isinstance(data, dict):
+        return [data]
+    return list(data or [])
+
+
+def _cache_get(user_id: int) -> Optional[UserRow]:
     now = time.time()
     with _cache_lock:
         entry = _user_cache.get(user_id)
@@ -45,7 +237,7 @@ def _cache_get(user_id: int) -> Optional[dict]:
         return data
 
 
-def _cache_set(user_id: int, data: dict) -> None:
+def _cache_set(user_id: int, data: UserRow) -> None:
     now = time.time()
     with _cache_lock:
         _user_cache[user_id] = (data, now + _USER_CACHE_TTL)
@@ -54,18 +246,45 @@ def _cache_set(user_id: int, data: dict) -> None:
 def _cache_invalidate(user_id: int) -> None:
     with _cache_lock:
         _user_cache.pop(user_id, None)
-    # also invalidate leaderboard caches
-    with _cache_lock:
-        _leaderboard_cache.clear()
 
 
+def export_cache() -> dict:
+    """Cached user rows with their remaining TTLs (for snapshots)."""
+    now = time.time()
+    with _cache_lock:
+        users = [[row.to_record(), exp - now] for row, exp in _user_cache.values()]
+    return {"users": users}
+
+
+def import_cache(data: dict, elapsed: float) -> dict:
+    """Restore entries from `export_cache` that are still fresh after `elapsed` seconds.
+
+    Returns the keys worth revalidating: every snapshotted user id, including
+    those whose entries had already expired.
+    """
+    now = time.time()
+    user_ids: list[int] = []
+    with _cache_lock:
+        for rec, ttl in data.get("users", []):
+            row = UserRow.from_record(rec)
+            user_ids.append(row.id)
+            if ttl - elapsed > 0:
+                _user_cache[row.id] = (row, now + ttl - elapsed)
+    return {"users": user_ids}
+
+
 def _now_kst_iso() -> str:
     # Return current time in KST as ISO string
     kst = datetime.timezone(datetime.timedelta(hours=9))
     return datetime.datetime.now(kst).isoformat()
 
 
-async def create_user(user_id: int, username: Optional[str]) -> Any:
+async def create_user(user_id: int, username: Optional[str]) -> Optional[UserRow]:
+    """Insert a new user row and return it.
+
+    If the user already exists the existing row is returned; other errors
+    reported in the response yield None.
+    """
     def _sync():
         client = _init_client()
         # Try insert with default xp/level. If duplicate key (user already exists),
@@ -90,128 +309,145 @@ async def create_user(user_id: int, username: Optional[str]) -> Any:
 
             if code == "23505":
                 # return existing user row
-                existing = client.table("users").select("*").eq("id", user_id).limit(1).execute()
-                # cache existing
-                data = existing.get("data") if isinstance(existing, dict) else getattr(existing, "data", None)
-                if isinstance(data, (list, tuple)) and data and isinstance(data[0], dict):
-                    _cache_set(user_id, data[0])
-                elif isinstance(data, dict):
-                    _cache_set(user_id, data)
-                return existing
-            # otherwise return the original response (propagate error to caller)
-            return res
+                existing = _rows(client.table("users").select("*").eq("id", user_id).limit(1).execute())
+                if not existing:
+                    return None
+                row = UserRow.from_record(existing[0])
+                _cache_set(user_id, row)
+                return row
+            # otherwise the insert failed
+            return None
 
         # success: cache initial user row
-        row = {"id": user_id, "username": username, "xp": 0, "level": 1, "last_xp_at": None}
+        row = UserRow(id=user_id, username=username)
         _cache_set(user_id, row)
-        return res
+        return row
 
-    return await asyncio.to_thread(_sync)
+    return await _run(_sync)
 
 
-async def get_user(user_id: int) -> Any:
+async def get_user(user_id: int) -> Optional[UserRow]:
     def _sync():
         client = _init_client()
         return client.table("users").select("*").eq("id", user_id).limit(1).execute()
 
-    return await asyncio.to_thread(_sync)
+    rows = _rows(await _run(_sync))
+    if not rows:
+        return None
+    row = UserRow.from_record(rows[0])
+    _cache_set(user_id, row)
+    return row
 
 
-async def record_attendance(user_id: int) -> Any:
+async def record_attendance(user_id: int) -> Optional[AttendanceRow]:
     def _sync():
         client = _init_client()
         return client.table("attendances").insert({"user_id": user_id}).execute()
 
-    return await asyncio.to_thread(_sync)
-
-
-async def get_attendance(user_id: int, limit: int = 30) -> Any:
-    def _sync():
-        client = _init_client()
-        return (
-            client.table("attendances").select("*").eq("user_id", user_id).order("ts", desc=True).limit(limit).execute()
-        )
-
-    return await asyncio.to_thread(_sync)
-
-
-async def attended_today(user_id: int) -> bool:
-    def _sync():
-        client = _init_client()
-        # Use KST for day boundaries
-        kst = datetime.timezone(datetime.timedelta(hours=9))
-        now = datetime.datetime.now(kst)
-        start_of_day = datetime.datetime(now.year, now.month, now.day, tzinfo=kst)
-        start_iso = start_of_day.isoformat()
-        res = (
-            client.table("attendances").select("id").eq("user_id", user_id).gte("ts", start_iso).limit(1).execute()
-        )
-        data = res.get("data") if isinstance(res, dict) else getattr(res, "data", None)
-        return bool(data)
-
-    return await asyncio.to_thread(_sync)
-
-
-async def get_streak(user_id: int, max_days: int = 365) -> int:
-    """Return the current consecutive attendance streak ending at the most recent attendance.
-
-    The streak is computed from the most recent attendance date backward counting
-    consecutive calendar days (UTC). If the user has no attendance records, returns 0.
-    """
-    from datetime import timedelta
-
-    def _sync():
-        client = _init_client()
-        # fetch recent attendance timestamps (limit to max_days records)
-        res = (
-            client.table("attendances")
-            .select("ts")
-            .eq("user_id", user_id)
-            .order("ts", desc=True)
-            .limit(max_days)
-            .execute()
-        )
-        return res
-
-    res = await asyncio.to_thread(_sync)
-    data = res.get("data") if isinstance(res, dict) else getattr(res, "data", None)
-    if not data:
-        return 0
-
-    # Parse timestamps to KST dates (unique)
-    dates = []
-    for row in data:
-        ts = row.get("ts") if isinstance(row, dict) else getattr(row, "ts", None)
-        if not ts:
-            continue
-        # Normalize ISO string that may end with Z
-        if isinstance(ts, str) and ts.endswith("Z"):
-            ts = ts.replace("Z", "+00:00")
-        try:
-            dt = datetime.datetime.fromisoformat(ts)
-        except Exception:
-            # skip unparsable
-            continue
-        # Convert to KST date
-        kst = datetime.timezone(datetime.timedelta(hours=9))
-        dt = dt.astimezone(kst).date()
-        if not dates or dates[-1] != dt:
-            dates.append(dt)
-
-    if not dates:
-        return 0
-
-    # dates is descending-ordered unique list of dates
-    streak = 1
-    for i in range(1, len(dates)):
-        if dates[i] == dates[i - 1] - timedelta(days=1):
-            streak += 1
-        else:
-            break
-
-    return streak
-
-
+    rows = _rows(await _run(_sync))
+    return AttendanceRow.from_record(rows[0], user_id=user_id) if rows else None
+
+
+def _attendance_rows(res: Any, user_id: Optional[int] = None) -> list[AttendanceRow]:
+    out = []
+    for r in _rows(res):
+        row = AttendanceRow.from_record(r, user_id=user_id)
+        if row is not None:
+            out.append(row)
+    return out
+
+
+async def get_attendance_page(
+    user_id: int,
+    limit: int,
+    before: Optional[tuple[str, Optional[int]]] = None,
+    after: Optional[tuple[str, Optional[int]]] = None,
+) -> list[AttendanceRow]:
+    """Keyset page of a user's attendance rows ordered by (ts, id), newest first.
+
+    `before` returns rows older than the (iso ts, id) cursor, `after` rows newer
+    than it; the id breaks ties between rows with the same timestamp (None
+    compares on ts alone). Both walk `idx_attendances_user_ts` so the cost does
+    not grow with the length of the history.
+    """
+    def _sync():
+        client = _init_client()
+        q = client.table("attendances").select("id, ts").eq("user_id", user_id)
+        cursor = after if after is not None else before
+        op = "gt" if after is not None else "lt"
+        if cursor is not None:
+            ts, row_id = cursor
+            if row_id is None:
+                q = q.filter("ts", op, ts)
+            else:
+                q = q.or_(f'ts.{op}."{ts}",and(ts.eq."{ts}",id.{op}.{row_id})')
+        desc = after is None
+        return q.order("ts", desc=desc).order("id", desc=desc).limit(limit).execute()
+
+    rows = _attendance_rows(await _run(_sync), user_id)
+    if after is not None:
+        rows.reverse()
+    return rows
+
+
+async def get_attendance_ts_after(user_id: int, after_iso: Optional[str], limit: int = 1000) -> list[datetime.datetime]:
+    """Return up to `limit` attendance timestamps for a user after `after_iso`, oldest first."""
+    def _sync():
+        client = _init_client()
+        q = client.table("attendances").select("ts").eq("user_id", user_id)
+        if after_iso is not None:
+            q = q.gt("ts", after_iso)
+        return q.order("ts").limit(limit).execute()
+
+    return [row.ts for row in _attendance_rows(await _run(_sync), user_id)]
+
+
+async def get_attendance_rows_after(after_user_id: int, after_id: int, limit: int = 1000) -> list[AttendanceRow]:
+    """Keyset page over the whole `attendances` table ordered by (user_id, id)."""
+    def _sync():
+        client = _init_client()
+        return (
+            client.table("attendances")
+            .select("id, user_id, ts")
+            .or_(f"user_id.gt.{after_user_id},and(user_id.eq.{after_user_id},id.gt.{after_id})")
+            .order("user_id")
+            .order("id")
+            .limit(limit)
+            .execute()
+        )
+
+    return _attendance_rows(await _run(_sync, lane=BACKGROUND))
+
+
+async def get_attendance_bitmap(user_id: int) -> Optional[dict]:
+    def _sync():
+        client = _init_client()
+        return (
+            client.table("attendance_bitmaps")
+            .select("anchor_day, bits, updated_at")
+            .eq("user_id", user_id)
+            .limit(1)
+            .execute()
+        )
+
+    rows = _rows(await _run(_sync))
+    return rows[0] if rows else None
+
+
+async def upsert_attendance_bitmaps(rows: list[dict], lane: str = INTERACTIVE) -> Any:
+    """Upsert rows of {user_id, anchor_day, bits} into `attendance_bitmaps`."""
+    if not rows:
+        return None
+    now_iso = datetime.datetime.now(timezone.utc).isoformat()
+
+    def _sync():
+        client = _init_client()
+        payload = [dict(r, updated_at=now_iso) for r in rows]
+        return client.table("attendance_bitmaps").upsert(payload, on_conflict="user_id").execute()
+
+    return await _run(_sync, lane=lane)
+
+
 def calc_level_from_xp(xp: int) -> int:
     """Compute level from total XP using simple quadratic curve.
 
@@ -237,81 +473,382 @@ def xp_for_level(level: int) -> int:
     return _xp_for_level(level)
 
 
-async def add_xp(user_id: int, amount: int) -> Any:
-    """Add XP to a user and update level if necessary.
+async def add_xp(user_id: int, amount: int) -> Optional[dict]:
+    """Add XP to a registered user and update level if necessary.
 
-    Returns the updated user row (as supabase response).
+    Returns a dict with old_xp, old_level, new_xp and new_level, or None if
+    the user has no row (users are only created by /register).
     """
     def _sync():
         client = _init_client()
         # get user
-        row = client.table("users").select("*").eq("id", user_id).limit(1).execute()
-        data = row.get("data") if isinstance(row, dict) else getattr(row, "data", None)
+        data = _rows(client.table("users").select("*").eq("id", user_id).limit(1).execute())
+        now = datetime.datetime.now(timezone.utc)
         if not data:
-            # create user with xp amount
-            new_xp = amount
-            new_level = calc_level_from_xp(new_xp)
-            res = client.table("users").insert({"id": user_id, "xp": new_xp, "level": new_level, "last_xp_at": datetime.datetime.now(timezone.utc).isoformat()}).execute()
-            # update cache
-            row = {"id": user_id, "xp": new_xp, "level": new_level, "last_xp_at": datetime.datetime.now(timezone.utc).isoformat()}
-            _cache_set(user_id, row)
-            return {"old_xp": 0, "old_level": 1, "new_xp": new_xp, "new_level": new_level, "res": res}
-
-        user = data[0]
-        cur_xp = user.get("xp", 0) if isinstance(user, dict) else getattr(user, "xp", 0)
-        cur_level = user.get("level", 1) if isinstance(user, dict) else getattr(user, "level", 1)
-        new_xp = (cur_xp or 0) + amount
+            return None
+
+        user = UserRow.from_record(data[0])
+        new_xp = user.xp + amount
         new_level = calc_level_from_xp(new_xp)
         # update
-        now_iso = datetime.datetime.now(timezone.utc).isoformat()
-        res = client.table("users").update({"xp": new_xp, "level": new_level, "last_xp_at": now_iso}).eq("id", user_id).execute()
+        client.table("users").update({"xp": new_xp, "level": new_level, "last_xp_at": now.isoformat()}).eq("id", user_id).execute()
         # update cache
-        row = {"id": user_id, "xp": new_xp, "level": new_level, "last_xp_at": now_iso}
-        _cache_set(user_id, row)
-        return {"old_xp": cur_xp or 0, "old_level": cur_level or 1, "new_xp": new_xp, "new_level": new_level, "res": res}
+        _cache_set(user_id, UserRow(id=user_id, username=user.username, xp=new_xp, level=new_level, last_xp_at=now))
+        return {"old_xp": user.xp, "old_level": user.level, "new_xp": new_xp, "new_level": new_level}
 
-    return await asyncio.to_thread(_sync)
+    return await _run(_sync, lane=BACKGROUND)
 
 
-async def get_leaderboard(limit: int = 10) -> Any:
-    # try leaderboard cache
-    now = time.time()
-    with _cache_lock:
-        e = _leaderboard_cache.get(limit)
-        if e and e[1] > now:
-            return e[0]
+async def add_chat_xp(chat_id: int, user_id: int, amount: int) -> dict:
+    """Add XP to a user's per-chat ledger row in `chat_xp`.
 
+    Returns a dict with the new totals so callers can update in-memory indexes
+    with absolute values (idempotent) rather than deltas.
+    """
     def _sync():
         client = _init_client()
-        return client.table("users").select("id, username, xp, level").order("xp", desc=True).limit(limit).execute()
+        row = (
+            client.table("chat_xp").select("xp, level").eq("chat_id", chat_id).eq("user_id", user_id).limit(1).execute()
+        )
+        data = _rows(row)
+        cur_xp = int(data[0].get("xp") or 0) if data else 0
+        cur_level = int(data[0].get("level") or 1) if data else 1
+        new_xp = cur_xp + amount
+        new_level = calc_level_from_xp(new_xp)
+        now_iso = datetime.datetime.now(timezone.utc).isoformat()
+        client.table("chat_xp").upsert(
+            {"chat_id": chat_id, "user_id": user_id, "xp": new_xp, "level": new_level, "updated_at": now_iso},
+            on_conflict="chat_id,user_id",
+        ).execute()
+        return {"chat_id": chat_id, "user_id": user_id, "old_xp": cur_xp, "old_level": cur_level, "new_xp": new_xp, "new_level": new_level}
+
+    return await _run(_sync, lane=BACKGROUND)
 
-    res = await asyncio.to_thread(_sync)
-    with _cache_lock:
-        _leaderboard_cache[limit] = (res, time.time() + _LEADERBOARD_CACHE_TTL)
-    return res
 
+async def get_chat_xp_rows(chat_id: int, page_size: int = 1000) -> list[tuple[int, int]]:
+    """Return every (user_id, xp) pair recorded for a chat.
 
-async def get_xp_info(user_id: int) -> dict:
-    # try cache first
+    Pages through PostgREST's row cap using the `idx_chat_xp_chat_xp` ordering.
+    """
+    def _sync():
+        client = _init_client()
+        out: list[tuple[int, int]] = []
+        start = 0
+        while True:
+            res = (
+                client.table("chat_xp")
+                .select("user_id, xp")
+                .eq("chat_id", chat_id)
+                .order("xp", desc=True)
+                .order("user_id")
+                .range(start, start + page_size - 1)
+                .execute()
+            )
+            data = _rows(res)
+            if not data:
+                break
+            for r in data:
+                out.append((int(r["user_id"]), int(r.get("xp") or 0)))
+            if len(data) < page_size:
+                break
+            start += page_size
+        return out
+
+    return await _run(_sync)
+
+
+async def get_user_ids_after(after_id: int, limit: int = 1000) -> list[int]:
+    """Registered user ids greater than `after_id`, ascending (keyset page, background lane)."""
+    def _sync():
+        client = _init_client()
+        return client.table("users").select("id").gt("id", after_id).order("id").limit(limit).execute()
+
+    return [int(r["id"]) for r in _rows(await _run(_sync, lane=BACKGROUND))]
+
+
+async def get_usernames(user_ids: list[int]) -> dict[int, Optional[str]]:
+    """Resolve usernames for a small set of user ids (cache first, then one query)."""
+    out: dict[int, Optional[str]] = {}
+    missing: list[int] = []
+    for uid in user_ids:
+        cached = _cache_get(uid)
+        if cached is not None:
+            out[uid] = cached.username
+        else:
+            missing.append(uid)
+    if not missing:
+        return out
+
+    def _sync():
+        client = _init_client()
+        return client.table("users").select("id, username").in_("id", missing).execute()
+
+    for r in _rows(await _run(_sync)):
+        out[int(r["id"])] = r.get("username")
+    return out
+
+
+async def prefetch_users(user_ids: list[int], chunk: int = 200) -> int:
+    """Load user rows into the cache in batched `in` queries (background lane)."""
+    loaded = 0
+    for i in range(0, len(user_ids), chunk):
+        ids = user_ids[i:i + chunk]
+
+        def _sync():
+            client = _init_client()
+            return client.table("users").select("id, username, xp, level, last_xp_at").in_("id", ids).execute()
+
+        for r in _rows(await _run(_sync, lane=BACKGROUND)):
+            _cache_set(int(r["id"]), UserRow.from_record(r))
+            loaded += 1
+    return loaded
+
+
+async def get_leaderboard_page(cursor: Optional[tuple[int, int]], direction: str, limit: int) -> list[LeaderboardEntry]:
+    """One keyset page of the global ranking ordered by (xp desc, id asc).
+
+    `cursor` is the (xp, id) of the row to page from: rows after it for
+    direction "next", rows before it for "prev" (returned in ranking order).
+    """
+    def _sync():
+        client = _init_client()
+        q = client.table("users").select("id, username, xp, level")
+        if cursor is not None:
+            xp, uid = cursor
+            if direction == "prev":
+                q = q.or_(f"xp.gt.{xp},and(xp.eq.{xp},id.lt.{uid})")
+            else:
+                q = q.or_(f"xp.lt.{xp},and(xp.eq.{xp},id.gt.{uid})")
+        backwards = direction == "prev"
+        return q.order("xp", desc=not backwards).order("id", desc=backwards).limit(limit).execute()
+
+    rows = [LeaderboardEntry.from_record(r) for r in _rows(await _run_hedged(_sync))]
+    if direction == "prev":
+        rows.reverse()
+    return rows
+
+
+async def get_ranking_chunk(cursor: Optional[tuple[int, int]], limit: int) -> list[tuple[int, int]]:
+    """(user_id, xp) pairs of the global ranking after `cursor` (keyset page, background lane)."""
+    def _sync():
+        client = _init_client()
+        q = client.table("users").select("id, xp")
+        if cursor is not None:
+            xp, uid = cursor
+            q = q.or_(f"xp.lt.{xp},and(xp.eq.{xp},id.gt.{uid})")
+        return q.order("xp", desc=True).order("id").limit(limit).execute()
+
+    return [(int(r["id"]), int(r.get("xp") or 0)) for r in _rows(await _run(_sync, lane=BACKGROUND))]
+
+
+async def count_users_ahead(xp: int, user_id: int) -> int:
+    """Number of users ranked above (xp, user_id) in the global ranking."""
+    def _sync():
+        client = _init_client()
+        return (
+            client.table("users")
+            .select("id", count="exact")
+            .or_(f"xp.gt.{xp},and(xp.eq.{xp},id.lt.{user_id})")
+            # only the count is needed
+            .limit(1)
+            .execute()
+        )
+
+    res = await _run_hedged(_sync)
+    return int(getattr(res, "count", None) or 0)
+
+
+async def get_xp_info(user_id: int) -> UserRow:
+    """Return the user's XP row (cache first). Unknown users get a level-1, 0 XP row."""
     cached = _cache_get(user_id)
-    if cached:
-        # convert to consistent shape
-        return {"id": cached.get("id"), "xp": cached.get("xp", 0), "level": cached.get("level", 1), "next_xp": _xp_for_level(cached.get("level", 1) + 1), "last_xp_at": cached.get("last_xp_at")}
+    if cached is not None:
+        return cached
 
     def _sync():
         client = _init_client()
         return client.table("users").select("id, username, xp, level, last_xp_at").eq("id", user_id).limit(1).execute()
 
-    res = await asyncio.to_thread(_sync)
-    data = res.get("data") if isinstance(res, dict) else getattr(res, "data", None)
-    if not data:
-        return {"id": user_id, "xp": 0, "level": 1, "next_xp": _xp_for_level(2), "last_xp_at": None}
-    user = data[0]
-    xp = user.get("xp", 0) if isinstance(user, dict) else getattr(user, "xp", 0)
-    level = user.get("level", 1) if isinstance(user, dict) else getattr(user, "level", 1)
-    last_xp_at = user.get("last_xp_at") if isinstance(user, dict) else getattr(user, "last_xp_at", None)
-    next_level = level + 1
-    next_xp = _xp_for_level(next_level)
-    return {"id": user_id, "xp": xp, "level": level, "next_xp": next_xp, "last_xp_at": last_xp_at}
+    rows = _rows(await _run_hedged(_sync))
+    if not rows:
+        return UserRow(id=user_id)
+    row = UserRow.from_record(rows[0])
+    _cache_set(user_id, row)
+    return row
+
+
+async def get_chat_daily_stats(chat_ids: list[int], days: list[str]) -> list[dict]:
+    """Stored `chat_daily_stats` rows for the given chats and ISO days (cross product)."""
+    def _sync():
+        client = _init_client()
+        return client.table("chat_daily_stats").select("*").in_("chat_id", chat_ids).in_("day", days).execute()
+
+    return _rows(await _run(_sync))
+
+
+async def upsert_chat_daily_stats(rows: list[dict]) -> Any:
+    """Write absolute per chat/day counters in one batch (background lane)."""
+    now_iso = datetime.datetime.now(timezone.utc).isoformat()
+
+    def _sync():
+        client = _init_client()
+        return (
+            client.table("chat_daily_stats")
+            .upsert([dict(r, updated_at=now_iso) for r in rows], on_conflict="chat_id,day")
+            .execute()
+        )
+
+    return await _run(_sync, lane=BACKGROUND)
+
+
+async def upsert_leaderboard_snapshot(day: str, users: int, complete: bool, data: str) -> Any:
+    def _sync():
+        client = _init_client()
+        return (
+            client.table("leaderboard_snapshots")
+            .upsert({"day": day, "users": users, "complete": complete, "data": data}, on_conflict="day")
+            .execute()
+        )
+
+    return await _run(_sync, lane=BACKGROUND)
+
+
+async def get_latest_leaderboard_snapshot() -> Optional[dict]:
+    """The most recent `leaderboard_snapshots` row, or None."""
+    def _sync():
+        client = _init_client()
+        return client.table("leaderboard_snapshots").select("*").order("day", desc=True).limit(1).execute()
+
+    rows = _rows(await _run(_sync, lane=BACKGROUND))
+    return rows[0] if rows else None
+
+
+async def delete_leaderboard_snapshots_before(day: str) -> Any:
+    def _sync():
+        client = _init_client()
+        return client.table("leaderboard_snapshots").delete().lt("day", day).execute()
+
+    return await _run(_sync, lane=BACKGROUND)
+
+
+async def count_users_after(after_id: int) -> int:
+    """Number of registered users with an id greater than `after_id`."""
+    def _sync():
+        client = _init_client()
+        return client.table("users").select("id", count="exact").gt("id", after_id).limit(1).execute()
+
+    res = await _run(_sync, lane=BACKGROUND)
+    return int(getattr(res, "count", None) or 0)
+
+
+async def create_broadcast(text: str, created_by: int) -> Optional[dict]:
+    def _sync():
+        client = _init_client()
+        return client.table("broadcasts").insert({"text": text, "created_by": created_by}).execute()
+
+    rows = _rows(await _run(_sync))
+    return rows[0] if rows else None
+
+
+async def get_running_broadcast() -> Optional[dict]:
+    """The oldest `broadcasts` row still marked running, or None."""
+    def _sync():
+        client = _init_client()
+        return client.table("broadcasts").select("*").eq("status", "running").order("id").limit(1).execute()
+
+    rows = _rows(await _run(_sync))
+    return rows[0] if rows else None
+
+
+async def update_broadcast(broadcast_id: int, fields: dict) -> Any:
+    now_iso = datetime.datetime.now(timezone.utc).isoformat()
+
+    def _sync():
+        client = _init_client()
+        return client.table("broadcasts").update(dict(fields, updated_at=now_iso)).eq("id", broadcast_id).execute()
+
+    return await _run(_sync, lane=BACKGROUND)
+
+
+async def get_blocked_user_ids(user_ids: list[int], chunk: int = 200) -> set[int]:
+    """The subset of `user_ids` recorded in `blocked_users` (batched `in` queries)."""
+    out: set[int] = set()
+    for i in range(0, len(user_ids), chunk):
+        ids = user_ids[i:i + chunk]
+
+        def _sync():
+            client = _init_client()
+            return client.table("blocked_users").select("user_id").in_("user_id", ids).execute()
+
+        out.update(int(r["user_id"]) for r in _rows(await _run(_sync, lane=BACKGROUND)))
+    return out
+
+
+async def mark_users_blocked(rows: list[dict]) -> Any:
+    """Upsert `blocked_users` rows (user_id, reason)."""
+    if not rows:
+        return None
+
+    def _sync():
+        client = _init_client()
+        return client.table("blocked_users").upsert(rows, on_conflict="user_id").execute()
+
+    return await _run(_sync, lane=BACKGROUND)
+
+
+async def record_xp_events(events: list[dict]) -> Any:
+    """Append a batch of XP events and fold them into `xp_rollups`.
+
+    Each event is a dict with user_id, chat_id, amount, source and ts (ISO).
+    Uses the `record_xp_events` SQL function so the insert and the rollup
+    increment happen in a single round trip.
+    """
+    if not events:
+        return None
+
+    def _sync():
+        client = _init_client()
+        return client.rpc("record_xp_events", {"events": events}).execute()
+
+    return await _run(_sync, lane=BACKGROUND)
 
 
+async def get_xp_rollups(user_id: int, granularity: str, since_iso: str, limit: int = 48) -> list[tuple[datetime.datetime, int]]:
+    """Return (bucket start, amount) rollup pairs for a user, oldest first.
+
+    `granularity` is "h" (hourly) or "d" (KST day).
+    """
+    def _sync():
+        client = _init_client()
+        return (
+            client.table("xp_rollups")
+            .select("bucket, amount")
+            .eq("user_id", user_id)
+            .eq("granularity", granularity)
+            .gte("bucket", since_iso)
+            .order("bucket")
+            .limit(limit)
+            .execute()
+        )
+
+    out = []
+    for r in _rows(await _run(_sync)):
+        bucket = parse_ts(r.get("bucket"))
+        if bucket is not None:
+            out.append((bucket, int(r.get("amount") or 0)))
+    return out
+
+
+async def prune_xp_events(before_iso: str, hourly_before_iso: Optional[str] = None) -> Any:
+    """Delete raw XP events older than `before_iso`.
+
+    Hourly rollups older than `hourly_before_iso` are dropped too; daily rollups
+    are kept since they are small and back long-range history.
+    """
+    def _sync():
+        client = _init_client()
+        res = client.table("xp_events").delete().lt("ts", before_iso).execute()
+        if hourly_before_iso:
+            client.table("xp_rollups").delete().eq("granularity", "h").lt("bucket", hourly_before_iso).execute()
+        return res
+
+    return await _run(_sync, lane=BACKGROUND)
@@ -0,0 +1,160 @@
+"""Bounded, laned thread-pool executor for blocking clients.
+
+`asyncio.to_thread` shares the loop's default executor with everything else.
+`LaneExecutor` instead gives each lane (e.g. interactive reads vs background
+writes) its own fixed-size pool so one kind of work cannot starve the other,
+applies per-call deadlines, and tracks queue wait time separately from
+execution time. It has no dependency on the DB layer and can wrap any
+blocking client.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a call does not finish (or start) within its deadline."""
+
+
+@dataclass(slots=True)
+class LaneStats:
+    submitted: int = 0
+    completed: int = 0
+    failed: int = 0
+    timed_out: int = 0
+    # calls submitted but not yet picked up by a worker
+    queued: int = 0
+    running: int = 0
+    wait_total: float = 0.0
+    wait_max: float = 0.0
+    exec_total: float = 0.0
+    exec_max: float = 0.0
+
+    def snapshot(self) -> dict:
+        started = max(self.completed + self.failed, 1)
+        return {
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "queued": self.queued,
+            "running": self.running,
+            "wait_avg_ms": round(1000 * self.wait_total / started, 2),
+            "wait_max_ms": round(1000 * self.wait_max, 2),
+            "exec_avg_ms": round(1000 * self.exec_total / started, 2),
+            "exec_max_ms": round(1000 * self.exec_max, 2),
+        }
+
+
+class LaneExecutor:
+    def __init__(self, name: str, lanes: dict[str, int], default_deadlines: Optional[dict[str, float]] = None):
+        self.name = name
+        self._pools = {
+            lane: ThreadPoolExecutor(max_workers=max(1, size), thread_name_prefix=f"{name}-{lane}")
+            for lane, size in lanes.items()
+        }
+        self._sizes = dict(lanes)
+        self._stats = {lane: LaneStats() for lane in lanes}
+        self._deadlines = dict(default_deadlines or {})
+        self._lock = threading.Lock()
+
+    async def run(self, fn: Callable[..., T], *args: Any, lane: str, deadline: Optional[float] = None) -> T:
+        """Run `fn(*args)` on `lane`'s pool.
+
+        `deadline` (seconds, default per lane) covers queue wait plus execution.
+        A call still queued when its deadline passes is skipped rather than run
+        late. Raises `DeadlineExceeded` on expiry.
+        """
+        pool = self._pools[lane]
+        stats = self._stats[lane]
+        if deadline is None:
+            deadline = self._deadlines.get(lane)
+        submitted = time.monotonic()
+        with self._lock:
+            stats.submitted += 1
+            stats.queued += 1
+        # `queued` is released exactly once: by the worker that picks the call
+        # up, or by the caller if it stops waiting first (timeout, cancellation)
+        picked = False
+        abandoned = False
+
+        def _call():
+            nonlocal picked
+            started = time.monotonic()
+            wait = started - submitted
+            with self._lock:
+                if abandoned:
+                    return None
+                picked = True
+                stats.queued -= 1
+                stats.wait_total += wait
+                stats.wait_max = max(stats.wait_max, wait)
+                if deadline is not None and wait >= deadline:
+                    stats.failed += 1
+                    raise DeadlineExceeded(f"{self.name}/{lane}: waited {wait:.2f}s in queue")
+                stats.running += 1
+            ok = False
+            try:
+                result = fn(*args)
+                ok = True
+                return result
+            finally:
+                elapsed = time.monotonic() - started
+                with self._lock:
+                    stats.running -= 1
+                    stats.exec_total += elapsed
+                    stats.exec_max = max(stats.exec_max, elapsed)
+                    if ok:
+                        stats.completed += 1
+                    else:
+                        stats.failed += 1
+
+        fut = asyncio.get_running_loop().run_in_executor(pool, _call)
+        try:
+            if deadline is None:
+                return await fut
+            return await asyncio.wait_for(fut, timeout=deadline)
+        except DeadlineExceeded:
+            with self._lock:
+                stats.timed_out += 1
+            raise
+        except asyncio.TimeoutError:
+            if not fut.cancelled():
+                # raised by `fn` itself, not our deadline
+                raise
+            with self._lock:
+                stats.timed_out += 1
+            raise DeadlineExceeded(f"{self.name}/{lane}: no result after {deadline:.2f}s") from None
+        finally:
+            with self._lock:
+                if not picked:
+                    abandoned = True
+                    stats.queued -= 1
+
+    def queued(self, lane: str) -> int:
+        """Number of calls waiting for a worker on `lane`."""
+        return self._stats[lane].queued
+
+    def idle(self, lane: str) -> int:
+        """Number of `lane` workers not running a call.
+
+        Derived from `running`, which each call raises and lowers in the same
+        worker, so unlike `queued` it cannot drift when callers give up.
+        """
+        with self._lock:
+            return max(0, self._sizes[lane] - self._stats[lane].running)
+
+    def stats(self) -> dict[str, dict]:
+        with self._lock:
+            return {lane: dict(s.snapshot(), workers=self._sizes[lane]) for lane, s in self._stats.items()}
+
+    def shutdown(self, wait: bool = True) -> None:
+        for pool in self._pools.values():
+            pool.shutdown(wait=wait, cancel_futures=True)
@@ -1,10 +1,12 @@
-"""Handler package for modular Telegram handlers."""
-from . import core
-from . import weather
-from . import fortune
-from . import attendance
-from . import profile
-from . import on_message
+"""Handler package for modular Telegram handlers.
+
+Command metadata for every handler module is registered here so `/help` and
+the command menu can be built without importing the handler modules
+themselves; the modules are imported on first use (see `commands.lazy_callback`).
+"""
+import importlib
+
+from ..commands import CommandSpec, register
 
 __all__ = [
     "core",
@@ -13,4 +15,70 @@ __all__ = [
     "attendance",
     "profile",
     "on_message",
+    "level_up",
+    "flood",
+    "dedup",
+    "stats",
+    "admin",
+    "inline",
 ]
+
+
+register(
+    # core
+    CommandSpec("start", "core", "start", "시작", emoji="🏁", cost=0.5),
+    CommandSpec("help", "core", "help_command", "도움말", emoji="❓", cost=0.5),
+    CommandSpec("ping", "core", "ping", "응답 확인", emoji="🏓", cost=0.5),
+    # profile
+    CommandSpec("register", "profile", "register", "등록", emoji="📝", cost=2),
+    CommandSpec("me", "profile", "me", "내 정보", emoji="👤"),
+    # weather
+    CommandSpec(
+        "weather",
+        "weather",
+        "weather_cmd",
+        "실시간 날씨 확인 (all: 즐겨찾기 전체 보기, 도시: 바로 조회)",
+        emoji="🌦️",
+        usage="[all|도시]",
+        cost=2,
+    ),
+    CommandSpec("forecast", "weather", "forecast_cmd", "5일 일기예보 (3시간 간격)", emoji="📆", usage="[도시]", cost=2),
+    # fortune
+    CommandSpec("fortune", "fortune", "fortune", "오늘의 운세 (random: 랜덤 운세)", emoji="🔮", usage="[random]"),
+    # attendance
+    CommandSpec("attend", "attendance", "attend", "출석 체크 (하루 1회)", emoji="📅", cost=2),
+    CommandSpec(
+        "attendance",
+        "attendance",
+        "attendance",
+        "내 출석 기록 조회 (페이지당 최대 10개)",
+        emoji="📋",
+        usage="[n]",
+        details=("🗓️ /attendance calendar [YYYY-MM] — 월별 출석 달력",),
+        cost=2,
+    ),
+    CommandSpec("streak", "attendance", "streak", "현재/최장 연속 출석일수 조회", emoji="🔥"),
+    # profile (xp)
+    CommandSpec("xp", "profile", "xp", "내 XP 및 레벨 조회 (history: 최근 획득 기록)", emoji="⭐", usage="[history]", cost=2),
+    CommandSpec("rank", "profile", "rank", "내 전체 순위와 오늘 0시 대비 변동", emoji="🏅", cost=2),
+    CommandSpec(
+        "leaderboard",
+        "profile",
+        "leaderboard",
+        "XP 순위, 페이지당 n명 (그룹에서는 채팅방 순위)",
+        emoji="🏆",
+        usage="[n] [global]",
+        cost=3,
+    ),
+    # stats
+    CommandSpec("stats", "stats", "stats", "채팅방 활동 통계 (yesterday: 어제)", emoji="📊", usage="[yesterday|YYYY-MM-DD]", cost=2),
+    # admin (ADMIN_IDS only)
+    CommandSpec("profile", "admin", "profile", "CPU/메모리 프로파일", emoji="🔬", usage="[seconds]", hidden=True),
+    CommandSpec("broadcast", "admin", "broadcast", "전체 사용자 공지", emoji="📣", usage="<내용>|status|cancel|resume", hidden=True),
+)
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
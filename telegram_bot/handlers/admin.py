@@ -0,0 +1,249 @@
+"""Admin-only handlers (restricted to `ADMIN_IDS`): profiling and broadcasts."""
+from __future__ import annotations
+
+import asyncio
+import datetime
+import logging
+import os
+import signal
+from typing import Optional
+
+from telegram import Bot, Message, Update
+from telegram.error import BadRequest, Forbidden, RetryAfter
+from telegram.ext import Application, ContextTypes
+
+from .. import profiling
+from ..services import broadcast_service
+from .telegram_utils import is_admin
+
+PROFILE_MAX_SECONDS = 120
+# duration of a profile started by SIGUSR1
+SIGNAL_PROFILE_SECONDS = float(os.getenv("PROFILE_SIGNAL_SECONDS", "30"))
+
+
+def _format_report(report: profiling.ProfileReport, seconds: float) -> str:
+    lines = [f"🔬 프로파일 완료 ({seconds:.0f}초, 샘플 {report.samples}개)"]
+    total = sum(n for _, n in report.top) or 1
+    for root, n in report.top:
+        lines.append(f"{100 * n / total:5.1f}%  {root}")
+    lines.append(f"메모리 증가: {report.mem_growth_kib:+.1f} KiB")
+    lines.append(f"CPU: {report.cpu_path}")
+    lines.append(f"메모리: {report.mem_path}")
+    return "\n".join(lines)
+
+
+async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """`/profile [seconds]` — sample the running bot and write CPU/memory reports."""
+    if not is_admin(update):
+        return
+    seconds = 30.0
+    if context.args:
+        try:
+            seconds = float(context.args[0])
+        except ValueError:
+            pass
+    seconds = max(1.0, min(seconds, PROFILE_MAX_SECONDS))
+    app = context.application
+    running = app.bot_data.get("profile_task")
+    if profiling.busy() or (running is not None and not running.done()):
+        await update.message.reply_text("이미 프로파일링 중입니다.")
+        return
+
+    await update.message.reply_text(f"🔬 {seconds:.0f}초 동안 프로파일링합니다...")
+    # run in the background so updates keep flowing while it samples; kept in bot_data so shutdown cancels it
+    app.bot_data["profile_task"] = app.create_task(_run_profile(update.message, seconds, app))
+
+
+async def _run_profile(message: Message, seconds: float, app: Application) -> None:
+    try:
+        report = await profiling.run_profile(seconds, app)
+    except Exception as e:
+        await message.reply_text(f"프로파일링 중 오류가 발생했습니다: {e}")
+        return
+    await message.reply_text(_format_report(report, seconds))
+
+
+def install_signal_handler(app: Application) -> None:
+    """Start a profile on SIGUSR1 (no-op where the loop has no signal support)."""
+    if not hasattr(signal, "SIGUSR1"):
+        return
+
+    async def _run() -> None:
+        if profiling.busy():
+            logging.info("SIGUSR1 ignored: a profile is already running")
+            return
+        try:
+            report = await profiling.run_profile(SIGNAL_PROFILE_SECONDS, app)
+        except Exception as e:
+            logging.warning("SIGUSR1 profile failed: %s", e)
+            return
+        logging.info("Profile written: %s, %s", report.cpu_path, report.mem_path)
+
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, lambda: app.create_task(_run()))
+    except (NotImplementedError, RuntimeError) as e:
+        logging.info("SIGUSR1 profiling unavailable: %s", e)
+
+
+BROADCAST_USAGE = (
+    "사용법: /broadcast <내용> (또는 공지할 메시지에 답장하며 /broadcast)\n"
+    "/broadcast status | cancel | resume"
+)
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}시간 {minutes}분"
+    if minutes:
+        return f"{minutes}분 {secs}초"
+    return f"{secs}초"
+
+
+def _format_progress(p: broadcast_service.Progress) -> str:
+    titles = {
+        broadcast_service.RUNNING: "📣 공지 전송 중",
+        broadcast_service.DONE: "✅ 공지 전송 완료",
+        broadcast_service.CANCELLED: "⏹️ 공지 전송 취소됨",
+    }
+    percent = 100 * p.done / p.total if p.total else 100.0
+    lines = [
+        f"{titles[p.status]} (#{p.broadcast_id})",
+        f"진행: {p.done:,}/{p.total:,} ({percent:.1f}%)",
+        f"✉️ 전송 {p.sent:,} · 🚫 차단 {p.blocked:,} · ⏭️ 건너뜀 {p.skipped:,} · ⚠️ 실패 {p.failed:,}",
+        f"속도: {p.rate():.1f}건/초",
+    ]
+    if p.status == broadcast_service.RUNNING:
+        eta = p.eta()
+        lines.append(f"남은 시간: 약 {_format_duration(eta)}" if eta is not None else "남은 시간: 계산 중")
+    return "\n".join(lines)
+
+
+def _retry_seconds(e: RetryAfter) -> float:
+    value = e.retry_after
+    return value.total_seconds() if isinstance(value, datetime.timedelta) else float(value)
+
+
+def _sender(bot: Bot, text: str):
+    """`send(user_id)` for `broadcast_service.run`, mapping Telegram errors to its exceptions."""
+    async def send(user_id: int) -> None:
+        try:
+            await bot.send_message(chat_id=user_id, text=text)
+        except RetryAfter as e:
+            raise broadcast_service.SlowDown(_retry_seconds(e)) from e
+        except Forbidden as e:
+            # blocked the bot or deactivated
+            raise broadcast_service.Unreachable(e.message) from e
+        except BadRequest as e:
+            # never started a private chat with the bot
+            if "chat not found" in e.message.lower():
+                raise broadcast_service.Unreachable(e.message) from e
+            raise
+
+    return send
+
+
+async def _run_broadcast(app: Application, row: dict, chat_id: Optional[int]) -> None:
+    """Deliver `row`, editing its progress message (reused from the row, else sent to `chat_id`)."""
+    bot = app.bot
+    target = (row.get("progress_chat_id"), row.get("progress_message_id"))
+    if target[1] is None and chat_id is not None:
+        try:
+            sent = await bot.send_message(chat_id=chat_id, text=f"📣 공지 전송 준비 중 (#{row['id']})")
+            target = (chat_id, sent.message_id)
+            await broadcast_service.set_progress_message(int(row["id"]), chat_id, sent.message_id)
+        except Exception as e:
+            logging.info("broadcast %s progress message failed: %s", row["id"], e)
+    last_text = None
+
+    async def _report(p: broadcast_service.Progress) -> None:
+        nonlocal last_text
+        text = _format_progress(p)
+        if target[1] is None or text == last_text:
+            return
+        await bot.edit_message_text(chat_id=target[0], message_id=target[1], text=text)
+        last_text = text
+
+    try:
+        await broadcast_service.run(row, _sender(bot, row["text"]), on_progress=_report)
+    except Exception as e:
+        logging.warning("broadcast %s stopped: %s", row["id"], e)
+        if target[1] is not None:
+            try:
+                await bot.send_message(
+                    chat_id=target[0],
+                    text=f"⚠️ 공지 #{row['id']} 전송이 중단되었습니다: {e}\n/broadcast resume 으로 이어서 보낼 수 있습니다.",
+                )
+            except Exception:
+                pass
+
+
+def _launch(app: Application, row: dict, chat_id: Optional[int]) -> None:
+    # kept in bot_data so shutdown cancels it and the checkpoint is saved
+    app.bot_data["broadcast_task"] = app.create_task(_run_broadcast(app, row, chat_id))
+
+
+def _broadcast_text(message: Message) -> str:
+    """Text after the command (line breaks kept), else the text of the replied-to message."""
+    parts = (message.text or "").split(None, 1)
+    if len(parts) == 2 and parts[1].strip():
+        return parts[1].strip()
+    reply = message.reply_to_message
+    return reply.text if reply is not None and reply.text else ""
+
+
+async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """`/broadcast <text>` — send `text` to every registered user; `status`, `cancel`, `resume` manage it."""
+    if not is_admin(update):
+        return
+    message = update.message
+    args = context.args or []
+    sub = args[0].lower() if len(args) == 1 else None
+    try:
+        if sub == "status":
+            p = broadcast_service.active()
+            await message.reply_text(_format_progress(p) if p else "진행 중인 공지가 없습니다.")
+            return
+        if sub == "cancel":
+            stopped = await broadcast_service.cancel()
+            await message.reply_text("공지 전송을 취소합니다." if stopped else "진행 중인 공지가 없습니다.")
+            return
+        if sub == "resume":
+            if broadcast_service.active() is not None:
+                await message.reply_text("이미 공지를 전송하고 있습니다.")
+                return
+            row = await broadcast_service.pending()
+            if row is None:
+                await message.reply_text("이어서 보낼 공지가 없습니다.")
+                return
+            _launch(context.application, row, message.chat_id)
+            return
+    except Exception as e:
+        await message.reply_text(f"처리 중 오류가 발생했습니다: {e}")
+        return
+
+    text = _broadcast_text(message)
+    if not text:
+        await message.reply_text(BROADCAST_USAGE)
+        return
+    result = await broadcast_service.start(text, update.effective_user.id)
+    if result.status == "busy":
+        await message.reply_text("이미 진행 중인 공지가 있습니다. /broadcast status 로 확인하거나 cancel 하세요.")
+    elif result.status == "error":
+        await message.reply_text("공지를 만들지 못했습니다. 잠시 후 다시 시도하세요.")
+    else:
+        _launch(context.application, result.row, message.chat_id)
+
+
+async def resume_broadcast(app: Application) -> None:
+    """Continue a broadcast left running by the previous process, if any."""
+    try:
+        row = await broadcast_service.pending()
+    except Exception as e:
+        logging.warning("checking for an unfinished broadcast failed: %s", e)
+        return
+    if row is None:
+        return
+    logging.info("Resuming broadcast %s after user id %s", row["id"], row.get("after_id"))
+    await _run_broadcast(app, row, None)
@@ -1,10 +1,13 @@
 """Attendance-related handlers."""
-from telegram import Update
+import datetime
+import html
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import ContextTypes
 
 from .. import utils
-from ..services import attendance_service
-from ..utils import extract_ttl_from_args
+from ..services import attendance_service, stats_service
+from ..utils import KST, extract_ttl_from_args
 from .telegram_utils import send_temporary_message
 
 
@@ -32,6 +35,9 @@ async def attend(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             pass
         return
 
+    if update.effective_chat is not None:
+        stats_service.record_attendance(update.effective_chat.id, user.id)
+
     if res.should_notify:
         if res.level_up:
             await send_temporary_message(
@@ -57,30 +63,121 @@ async def attendance(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         await update.message.reply_text("사용자 정보를 가져올 수 없습니다.")
         return
 
-    limit = 10
+    if context.args and context.args[0].lower() in {"calendar", "cal", "달력"}:
+        await attendance_calendar(update, context, user.id, context.args[1:], ttl)
+        return
+
+    size = attendance_service.HISTORY_PAGE_SIZE
     if context.args:
         try:
-            limit = int(context.args[0])
+            size = int(context.args[0])
         except ValueError:
             pass
 
-    res = await attendance_service.get_attendance_history(user.id, limit=limit)
-    if res.status == "error":
-        await update.message.reply_text(res.error_message or "출석 기록 조회 중 오류가 발생했습니다.")
+    page = await attendance_service.get_history_page(user.id, size=size)
+    if page.status == "error":
+        await update.message.reply_text(page.error_message or "출석 기록 조회 중 오류가 발생했습니다.")
         return
-    if res.status == "empty":
+    if page.status == "empty":
         await update.message.reply_text("출석 기록이 없습니다.")
         return
 
-    lines = [f"- {utils.format_ts_kst(ts)}" for ts in (res.timestamps or [])]
-    text = "최근 출석 기록:\n" + "\n".join(lines)
-    await send_temporary_message(update, context, text, ttl=ttl)
+    await send_temporary_message(
+        update,
+        context,
+        page.text,
+        ttl=ttl,
+        reply_markup=_history_keyboard(user.id, size, page),
+    )
+    try:
+        await update.message.delete()
+    except Exception:
+        pass
+
+
+async def attendance_calendar(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int, args, ttl) -> None:
+    """`/attendance calendar [YYYY-MM]` — month view rendered from the attendance bitmap."""
+    today = datetime.datetime.now(KST).date()
+    year, month = today.year, today.month
+    for arg in args or []:
+        try:
+            parsed = datetime.datetime.strptime(arg, "%Y-%m")
+        except ValueError:
+            continue
+        year, month = parsed.year, parsed.month
+        break
+
+    res = await attendance_service.get_calendar(user_id, year, month)
+    if res.status == "error":
+        await update.message.reply_text(res.error_message or "출석 달력 조회 중 오류가 발생했습니다.")
+        return
+
+    grid = utils.format_attendance_calendar(year, month, res.days or [], today=today)
+    text = (
+        f"📅 {year}-{month:02d} 출석 달력 ({len(res.days or [])}일)\n"
+        f"<pre>{html.escape(grid)}</pre>"
+    )
+    await send_temporary_message(update, context, text, ttl=ttl, parse_mode="HTML")
     try:
         await update.message.delete()
     except Exception:
         pass
 
 
+def _history_data(user_id: int, direction: str, cursor: tuple[int, int], size: int) -> str:
+    ts_us, row_id = cursor
+    return f"ATT:{user_id}:{direction}:{ts_us}:{row_id}:{size}"
+
+
+def _history_keyboard(user_id: int, size: int, page: attendance_service.AttendancePage):
+    size = max(1, min(size, attendance_service.HISTORY_PAGE_SIZE))
+    row = []
+    if page.has_newer:
+        row.append(InlineKeyboardButton("◀ 최근", callback_data=_history_data(user_id, "n", page.newest_cursor, size)))
+    if page.has_older:
+        row.append(InlineKeyboardButton("이전 ▶", callback_data=_history_data(user_id, "o", page.oldest_cursor, size)))
+    return InlineKeyboardMarkup([row]) if row else None
+
+
+async def history_page_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle `ATT:<user_id>:<n|o>:<ts_us>:<id>:<size>` history navigation buttons.
+
+    Buttons sent before the id was added (`ATT:<user_id>:<n|o>:<ts_us>:<size>`)
+    still work, paging on the timestamp alone.
+    """
+    query = update.callback_query
+    try:
+        parts = query.data.split(":")
+        if len(parts) == 5:
+            _, owner, direction, ts_us, size = parts
+            cursor = (int(ts_us), None)
+        else:
+            _, owner, direction, ts_us, row_id, size = parts
+            cursor = (int(ts_us), int(row_id))
+        owner_id, size = int(owner), int(size)
+    except ValueError:
+        await query.answer()
+        return
+    if query.from_user is None or query.from_user.id != owner_id:
+        await query.answer("본인의 출석 기록만 넘길 수 있습니다.")
+        return
+    await query.answer()
+
+    page = await attendance_service.get_history_page(
+        owner_id,
+        size=size,
+        direction="newer" if direction == "n" else "older",
+        cursor=cursor,
+    )
+    if page.status == "error":
+        await query.edit_message_text(page.error_message or "출석 기록 조회 중 오류가 발생했습니다.")
+        return
+    if page.status == "empty":
+        await query.edit_message_text("더 이상 출석 기록이 없습니다.")
+        return
+    await query.edit_message_text(page.text, reply_markup=_history_keyboard(owner_id, size, page))
+
+
 async def streak(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     ttl = extract_ttl_from_args(context.args)
     user = update.effective_user
@@ -93,7 +190,12 @@ async def streak(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await update.message.reply_text(res.error_message or "연속 출석 조회 중 오류가 발생했습니다.")
         return
 
-    await send_temporary_message(update, context, f"🔥 현재 연속 출석: {res.streak}일", ttl=ttl)
+    await send_temporary_message(
+        update,
+        context,
+        f"🔥 현재 연속 출석: {res.streak}일\n🏅 최장 연속 출석: {res.longest}일",
+        ttl=ttl,
+    )
     try:
         await update.message.delete()
     except Exception:
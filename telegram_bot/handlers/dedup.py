@@ -0,0 +1,22 @@
+"""Pre-dispatch duplicate-update filter.
+
+`dedup_guard` runs in handler group -2, before flood control and every other
+handler, and stops dispatch (`ApplicationHandlerStop`) for updates whose
+update_id or (chat_id, message_id) was already processed.
+"""
+import logging
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+
+from ..services import dedup
+
+
+async def dedup_guard(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # only new messages are keyed by message id; edits reuse the original id
+    message = update.message
+    chat_id = message.chat_id if message is not None else None
+    message_id = message.message_id if message is not None else None
+    if dedup.is_duplicate(update.update_id, chat_id, message_id):
+        logging.info("Dropping duplicate update %s", update.update_id)
+        raise ApplicationHandlerStop
@@ -0,0 +1,82 @@
+"""Pre-dispatch flood control.
+
+`flood_guard` runs in handler group -1, before every other handler. It charges
+the update's cost to the sender's and chat's token buckets and stops dispatch
+(`ApplicationHandlerStop`) for over-limit updates, so their DB/API work is
+never started.
+"""
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+
+from .. import commands
+from ..services import flood_service
+from .telegram_utils import send_temporary_message
+
+# callback data -> cost; weather city buttons (anything else) cost one API call
+_CALLBACK_COSTS = {"All": 5.0, "Add": 0.5, "DeleteMode": 0.5, "Back": 0.5, "Cancel": 0.5}
+_CALLBACK_PREFIX_COSTS = (("ATT:", 1.0), ("LB:", 1.0), ("DEL_", 0.5))
+_DEFAULT_CALLBACK_COST = 2.0
+# (command, first argument) -> cost, for arguments that fan out like a button;
+# `/weather all` fetches every city the "All" button does
+_COMMAND_ARG_COSTS = {("weather", "all"): _CALLBACK_COSTS["All"], ("weather", "전체"): _CALLBACK_COSTS["All"]}
+# a free-text city name while adding a weather location, or a shared location,
+# triggers a lookup
+_LOCATION_INPUT_COST = 2.0
+# inline queries arrive per keystroke and may look up a typed city name
+_INLINE_QUERY_COST = 0.5
+
+
+def update_cost(update: Update, context: ContextTypes.DEFAULT_TYPE) -> float:
+    query = update.callback_query
+    if query is not None:
+        data = query.data or ""
+        if data in _CALLBACK_COSTS:
+            return _CALLBACK_COSTS[data]
+        for prefix, cost in _CALLBACK_PREFIX_COSTS:
+            if data.startswith(prefix):
+                return cost
+        return _DEFAULT_CALLBACK_COST
+
+    if update.inline_query is not None:
+        return _INLINE_QUERY_COST
+
+    message = update.message
+    if message is not None and message.location is not None:
+        return _LOCATION_INPUT_COST
+    if message is None or not message.text:
+        return 0.0
+    if message.text.startswith("/"):
+        parts = message.text.split(maxsplit=2)
+        name = parts[0][1:].split("@", 1)[0].lower()
+        if len(parts) > 1 and (name, parts[1].lower()) in _COMMAND_ARG_COSTS:
+            return _COMMAND_ARG_COSTS[(name, parts[1].lower())]
+        spec = commands.get(name)
+        return spec.cost if spec is not None else 0.0
+    if context.user_data and context.user_data.get("waiting_for_location"):
+        return _LOCATION_INPUT_COST
+    # plain chat messages only queue XP (with its own cooldown)
+    return 0.0
+
+
+async def flood_guard(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    user = update.effective_user
+    if user is None:
+        return
+    cost = update_cost(update, context)
+    if cost <= 0:
+        return
+    chat = update.effective_chat
+    decision = flood_service.check(user.id, chat.id if chat else None, cost)
+    if decision.status == "allowed":
+        return
+
+    if decision.status == "notify":
+        notice = f"⏳ 요청이 너무 많습니다. {max(1, round(decision.retry_after))}초 후 다시 시도해 주세요."
+        try:
+            if update.callback_query is not None:
+                await update.callback_query.answer(notice)
+            else:
+                await send_temporary_message(update, context, notice, ttl=5)
+        except Exception:
+            pass
+    raise ApplicationHandlerStop
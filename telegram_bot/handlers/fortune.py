@@ -52,34 +52,20 @@ def _build_daily_rng(user_id: int, date: datetime.date) -> random.Random:
     return random.Random(seed)
 
 
-async def fortune(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Return a daily fortune for the user.
-
-    Usage:
-    - /fortune: daily fortune (deterministic per user per day, KST)
-    - /fortune random: fully random fortune
-    """
-    ttl = extract_ttl_from_args(context.args)
-    user = update.effective_user
-    if user is None:
-        await update.message.reply_text("사용자 정보를 가져올 수 없습니다.")
-        return
-
-    args = [a.lower() for a in (context.args or [])]
-    is_random = any(a in {"random", "rand", "r"} for a in args)
-
+def build_fortune(user_id: int, is_random: bool = False) -> str:
+    """Fortune message text; deterministic per user per KST day unless `is_random`."""
     now_kst = datetime.datetime.now(KST)
     if is_random:
         rng = random.Random()
     else:
-        rng = _build_daily_rng(user.id, now_kst.date())
+        rng = _build_daily_rng(user_id, now_kst.date())
 
     fortune_text = rng.choice(FORTUNES)
     lucky_number = rng.randint(1, 99)
     lucky_color = rng.choice(LUCKY_COLORS)
 
     mode_text = "랜덤 운세" if is_random else "오늘의 운세"
-    message = (
+    return (
         f"🔮 {mode_text}\n"
         f"• {fortune_text}\n"
         f"• 행운의 숫자: {lucky_number}\n"
@@ -87,6 +73,25 @@ async def fortune(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         f"(기준일: {now_kst.strftime('%Y-%m-%d')} KST)"
     )
 
+
+async def fortune(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Return a daily fortune for the user.
+
+    Usage:
+    - /fortune: daily fortune (deterministic per user per day, KST)
+    - /fortune random: fully random fortune
+    """
+    ttl = extract_ttl_from_args(context.args)
+    user = update.effective_user
+    if user is None:
+        await update.message.reply_text("사용자 정보를 가져올 수 없습니다.")
+        return
+
+    args = [a.lower() for a in (context.args or [])]
+    is_random = any(a in {"random", "rand", "r"} for a in args)
+
+    message = build_fortune(user.id, is_random)
+
     await send_temporary_message(update, context, message, ttl=ttl)
     try:
         await update.message.delete()
@@ -0,0 +1,166 @@
+"""Inline mode: `@bot 서울`, `@bot rank`, `@bot fortune`.
+
+Telegram sends an inline query per keystroke, so each user's queries are
+debounced (only the latest one still current after `INLINE_DEBOUNCE_SEC` is
+answered) and answers are built from the weather and leaderboard caches.
+Built weather results are kept until their weather entry expires, and
+`cache_time`/`is_personal` let Telegram reuse answers on its side.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import time
+from typing import Optional
+
+from telegram import InlineQueryResultArticle, InputTextMessageContent, Update
+from telegram.error import BadRequest
+from telegram.ext import ContextTypes
+
+from .. import utils
+from ..services import leaderboard_service, membership, weather_service, xp_service
+from .fortune import build_fortune
+from .weather import DEFAULT_CITIES, WEATHER_ICONS, format_weather_message
+
+INLINE_DEBOUNCE_SEC = 0.4
+_RANK_WORDS = {"rank", "순위", "랭킹", "leaderboard"}
+_FORTUNE_WORDS = {"fortune", "운세"}
+# free-text city names shorter than this are not looked up (each keystroke is a query)
+_MIN_CITY_QUERY = 2
+_MAX_CITIES = 5
+_RANK_CACHE_TIME = 30
+_DEFAULT_CACHE_TIME = 60
+
+# user id -> id of that user's latest inline query
+_latest: dict[int, str] = {}
+# city api name -> (display name, result, expires_at)
+_weather_results: dict[str, tuple[str, InlineQueryResultArticle, float]] = {}
+_MAX_WEATHER_RESULTS = 512
+
+
+def _weather_result(display_name: str, api: str, data: Optional[dict]) -> Optional[InlineQueryResultArticle]:
+    now = time.time()
+    cached = _weather_results.get(api)
+    if cached and cached[0] == display_name and cached[2] > now:
+        return cached[1]
+    info = weather_service.parse_weather_data(data) if data else None
+    text = format_weather_message(display_name, data) if info else None
+    if text is None:
+        return None
+    _, temp, humidity, wind_speed = info
+    icon = WEATHER_ICONS.get((data.get("weather") or [{}])[0].get("main", ""), "🌫️")
+    result = InlineQueryResultArticle(
+        # result ids are limited to 64 bytes; city names may be multi-byte
+        id="w:" + hashlib.sha1(api.encode()).hexdigest()[:16],
+        title=f"{icon} {display_name} 날씨",
+        description=f"{temp:.1f}°C 💧{humidity}% 🌬️{wind_speed:.1f} m/s",
+        input_message_content=InputTextMessageContent(text, parse_mode="HTML"),
+    )
+    expires = weather_service.expires_at(api)
+    if expires and expires > now:
+        if len(_weather_results) >= _MAX_WEATHER_RESULTS:
+            for key in [k for k, v in _weather_results.items() if v[2] <= now] or list(_weather_results):
+                del _weather_results[key]
+        _weather_results[api] = (display_name, result, expires)
+    return result
+
+
+async def _weather_results_for(cities: list[tuple[str, str]]) -> tuple[list[InlineQueryResultArticle], int]:
+    """Results for (display name, api name) pairs and a cache_time bounded by their expiry."""
+    names = dict((api, name) for name, api in cities)
+    by_api: dict[str, InlineQueryResultArticle] = {}
+    async for api, data in weather_service.get_weather_many(names):
+        result = _weather_result(names[api], api, data)
+        if result is not None:
+            by_api[api] = result
+    now = time.time()
+    expiries = [weather_service.expires_at(api) or now for api in by_api]
+    cache_time = int(min(max(min(expiries, default=now) - now, 10), 600))
+    return [by_api[api] for api in names if api in by_api], cache_time
+
+
+async def _rank_result(user_id: int) -> Optional[InlineQueryResultArticle]:
+    page = await leaderboard_service.get_leaderboard_page(None)
+    if page.status != "ok":
+        return None
+    text = "🏆 리더보드:\n" + page.text
+    description = "전체 XP 순위"
+    if membership.is_registered(user_id):
+        info = await xp_service.get_xp_info(user_id)
+        if info.status == "ok":
+            text += "\n\n" + utils.format_xp_progress(info.xp, info.level, info.next_xp)
+            description = f"내 레벨 {info.level} · {info.xp} XP"
+    return InlineQueryResultArticle(
+        id="rank",
+        title="🏆 리더보드",
+        description=description,
+        input_message_content=InputTextMessageContent(text),
+    )
+
+
+def _fortune_result(user_id: int) -> InlineQueryResultArticle:
+    return InlineQueryResultArticle(
+        id="fortune",
+        title="🔮 오늘의 운세",
+        description="오늘의 운세를 보냅니다",
+        input_message_content=InputTextMessageContent(build_fortune(user_id)),
+    )
+
+
+def _match_cities(text: str, favorites) -> list[tuple[str, str]]:
+    """Favorites and default cities whose name starts with `text`, else `text` itself."""
+    needle = text.lower()
+    candidates = list(dict.fromkeys([tuple(f) for f in favorites] + DEFAULT_CITIES))
+    matches = [
+        (name, api) for name, api in candidates
+        if name.lower().startswith(needle) or api.lower().startswith(needle)
+    ]
+    if not matches and len(text) >= _MIN_CITY_QUERY:
+        matches = [(text, text)]
+    return matches[:_MAX_CITIES]
+
+
+async def _build_answer(text: str, user_id: int, favorites) -> tuple[list, int, bool]:
+    """(results, cache_time, is_personal) for one query."""
+    word = text.lower()
+    if word in _RANK_WORDS:
+        result = await _rank_result(user_id)
+        return ([result] if result else []), _RANK_CACHE_TIME, True
+    if word in _FORTUNE_WORDS:
+        return [_fortune_result(user_id)], int(min(max(utils.seconds_until_next_kst_midnight(), 1), 3600)), True
+    if text:
+        cities = _match_cities(text, favorites)
+        results, cache_time = await _weather_results_for(cities)
+        # the same text gives everyone the same answer unless it matched a user's own favorite
+        shared = {api for _, api in DEFAULT_CITIES}
+        personal = any(api not in shared and api != text for _, api in cities)
+        return results, cache_time, personal
+
+    results, _ = await _weather_results_for(list(favorites)[:_MAX_CITIES])
+    rank = await _rank_result(user_id)
+    if rank is not None:
+        results.append(rank)
+    results.append(_fortune_result(user_id))
+    return results, _DEFAULT_CACHE_TIME, True
+
+
+async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.inline_query
+    if query is None:
+        return
+    user_id = query.from_user.id
+    _latest[user_id] = query.id
+    await asyncio.sleep(INLINE_DEBOUNCE_SEC)
+    if _latest.get(user_id) != query.id:
+        # superseded by a later keystroke
+        return
+    try:
+        favorites = context.user_data.get("favorites", DEFAULT_CITIES) if context.user_data is not None else DEFAULT_CITIES
+        results, cache_time, personal = await _build_answer(query.query.strip(), user_id, favorites)
+        await query.answer(results, cache_time=cache_time, is_personal=personal)
+    except BadRequest:
+        # the query expired while we were answering it
+        pass
+    finally:
+        if _latest.get(user_id) == query.id:
+            del _latest[user_id]
@@ -0,0 +1,73 @@
+"""Level-up announcements fed by the event bus.
+
+The XP flush loop publishes `LevelUp` events; this consumer groups them per
+chat over a short window and sends one congratulation message per chat,
+deleted after a TTL. Telegram sends happen only here, never on the message
+or flush paths.
+"""
+from __future__ import annotations
+
+import asyncio
+import html
+import logging
+from collections import defaultdict
+
+from telegram import Bot
+
+from ..services import event_bus
+from ..services.event_bus import LevelUp
+
+COALESCE_WINDOW_SEC = 3.0
+MESSAGE_TTL_SEC = 15.0
+
+# pending deletions; referenced so they are not collected mid-sleep, cancelled with the notifier
+_delete_tasks: set[asyncio.Task] = set()
+
+
+def _format_batch(events: list[LevelUp]) -> str:
+    # keep only the latest level reached per user within the batch
+    merged: dict[int, LevelUp] = {}
+    for ev in events:
+        prev = merged.get(ev.user_id)
+        if prev is None:
+            merged[ev.user_id] = ev
+        else:
+            merged[ev.user_id] = LevelUp(ev.user_id, ev.chat_id, prev.old_level, max(prev.new_level, ev.new_level), ev.username or prev.username)
+    lines = ["🎉 <b>레벨업!</b>"]
+    for ev in merged.values():
+        name = html.escape(f"@{ev.username}" if ev.username else f"ID:{ev.user_id}")
+        lines.append(f'• <a href="tg://user?id={ev.user_id}">{name}</a> Lv{ev.old_level} → Lv{ev.new_level}')
+    return "\n".join(lines)
+
+
+async def _delete_later(bot: Bot, chat_id: int, message_id: int, delay: float) -> None:
+    await asyncio.sleep(delay)
+    try:
+        await bot.delete_message(chat_id=chat_id, message_id=message_id)
+    except Exception:
+        pass
+
+
+async def run_level_up_notifier(bot: Bot, window: float = COALESCE_WINDOW_SEC, ttl: float = MESSAGE_TTL_SEC):
+    """Consume `LevelUp` events forever, sending one coalesced message per chat per window."""
+    queue = event_bus.subscribe(LevelUp)
+    try:
+        while True:
+            batch = await event_bus.next_batch(queue, window)
+            by_chat: dict[int, list[LevelUp]] = defaultdict(list)
+            for ev in batch:
+                if ev.chat_id is not None:
+                    by_chat[ev.chat_id].append(ev)
+            for chat_id, events in by_chat.items():
+                try:
+                    sent = await bot.send_message(chat_id=chat_id, text=_format_batch(events), parse_mode="HTML")
+                except Exception as e:
+                    logging.warning("level-up announcement to %s failed: %s", chat_id, e)
+                    continue
+                task = asyncio.create_task(_delete_later(bot, chat_id, sent.message_id, ttl))
+                _delete_tasks.add(task)
+                task.add_done_callback(_delete_tasks.discard)
+    finally:
+        event_bus.unsubscribe(LevelUp, queue)
+        for task in list(_delete_tasks):
+            task.cancel()
@@ -2,7 +2,7 @@
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from ..services import xp_service
+from ..services import stats_service, xp_service
 
 
 async def on_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -14,4 +14,11 @@ async def on_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     if update.message.text.startswith("/"):
         return
 
-    await xp_service.award_message_xp(user.id)
+    chat = update.effective_chat
+    if chat is not None:
+        stats_service.record_message(chat.id, user.id)
+    await xp_service.award_message_xp(
+        user.id,
+        chat_id=chat.id if chat else None,
+        username=user.username,
+    )
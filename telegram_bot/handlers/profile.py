@@ -1,11 +1,14 @@
-"""Profile-related handlers: register, me, xp, leaderboard."""
-from telegram import Update
+"""Profile-related handlers: register, me, xp, rank, leaderboard."""
+from typing import Optional
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 
 from .. import utils
 from ..services import user_service, xp_service, leaderboard_service
 from ..utils import extract_ttl_from_args
-from .telegram_utils import send_temporary_message
+from .telegram_utils import send_coalesced, send_temporary_message
 
 
 async def register(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -88,6 +91,10 @@ async def xp(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await update.message.reply_text("사용자 정보를 가져올 수 없습니다.")
         return
 
+    if any(a.lower() in {"history", "기록"} for a in (context.args or [])):
+        await xp_history(update, context, user.id, ttl)
+        return
+
     res = await xp_service.get_xp_info(user.id)
     if res.status == "error":
         await update.message.reply_text(f"XP 정보 조회 중 오류가 발생했습니다: {res.error_message}")
@@ -105,30 +112,155 @@ async def xp(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         pass
 
 
+async def xp_history(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int, ttl: float | None) -> None:
+    res = await xp_service.get_xp_history(user_id)
+    if res.status == "error":
+        await update.message.reply_text(f"XP 기록 조회 중 오류가 발생했습니다: {res.error_message}")
+        return
+
+    await send_temporary_message(
+        update,
+        context,
+        utils.format_xp_history(res.daily or [], res.hourly or []),
+        ttl=ttl,
+    )
+    try:
+        await update.message.delete()
+    except Exception:
+        pass
+
+
 async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show the XP ranking one page at a time.
+
+    In groups the chat's own ranking is shown by default; `/leaderboard global`
+    shows the cross-chat ranking. A numeric argument sets the rows per page
+    (at most `LEADERBOARD_PAGE_SIZE`); ◀/▶ buttons move between pages.
+    """
     ttl = extract_ttl_from_args(context.args)
-    limit = 10
-    if context.args:
+    size = leaderboard_service.LEADERBOARD_PAGE_SIZE
+    use_global = False
+    for arg in context.args or []:
+        if arg.lower() in {"global", "all", "전체"}:
+            use_global = True
+            continue
         try:
-            limit = int(context.args[0])
+            size = int(arg)
         except ValueError:
             pass
+    size = max(1, min(size, leaderboard_service.LEADERBOARD_PAGE_SIZE))
 
-    res = await leaderboard_service.get_leaderboard(limit=limit)
+    chat = update.effective_chat
+    is_group = chat is not None and chat.type in ("group", "supergroup")
+    scope_chat = chat.id if is_group and not use_global else None
+
+    async def _send() -> Optional[int]:
+        page = await leaderboard_service.get_leaderboard_page(scope_chat, size=size)
+        if page.status == "error":
+            await update.message.reply_text(page.error_message or "리더보드 조회 중 오류가 발생했습니다.")
+            return None
+        if page.status == "empty":
+            sent = await update.message.reply_text("리더보드가 비어 있습니다.")
+            return sent.message_id
+
+        sent = await send_temporary_message(
+            update,
+            context,
+            _leaderboard_title(scope_chat) + page.text,
+            ttl=ttl,
+            reply_markup=_leaderboard_keyboard(scope_chat, size, page),
+        )
+        try:
+            await update.message.delete()
+        except Exception:
+            pass
+        return sent.message_id if sent else None
+
+    # identical requests from a busy group share one reply
+    await send_coalesced(update, context, ("leaderboard", scope_chat, size), _send, ttl=ttl)
+
+
+async def rank(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """`/rank` — global rank and the change since the daily snapshot."""
+    ttl = extract_ttl_from_args(context.args)
+    user = update.effective_user
+    if user is None:
+        await update.message.reply_text("사용자 정보를 가져올 수 없습니다.")
+        return
+
+    res = await leaderboard_service.get_user_rank(user.id)
     if res.status == "error":
-        await update.message.reply_text(res.error_message or "리더보드 조회 중 오류가 발생했습니다.")
+        await update.message.reply_text(res.error_message or "순위 조회 중 오류가 발생했습니다.")
         return
-    if res.status == "empty":
-        await update.message.reply_text("리더보드가 비어 있습니다.")
+    if res.status == "not_found":
+        await update.message.reply_text("등록된 정보가 없습니다. /register 로 등록하세요.")
         return
 
+    line = f"🏅 현재 순위: {res.rank}위"
+    if res.delta_known:
+        line += f" {utils.format_rank_delta(res.delta)}"
+        if res.previous_rank is not None:
+            line += f" (오늘 0시 {res.previous_rank}위)"
     await send_temporary_message(
         update,
         context,
-        "🏆 리더보드:\n" + utils.format_leaderboard(res.rows or []),
+        f"{line}\n{utils.format_xp_progress(res.xp, res.level, res.next_xp)}",
         ttl=ttl,
     )
     try:
         await update.message.delete()
     except Exception:
         pass
+
+
+def _leaderboard_title(scope_chat) -> str:
+    return "🏆 이 채팅방 리더보드:\n" if scope_chat is not None else "🏆 리더보드:\n"
+
+
+def _leaderboard_keyboard(scope_chat, size: int, page: leaderboard_service.LeaderboardPage):
+    scope = "c" if scope_chat is not None else "g"
+    row = []
+    if page.has_prev and page.first_cursor:
+        xp, uid = page.first_cursor
+        row.append(InlineKeyboardButton("◀ 이전", callback_data=f"LB:{scope}:p:{xp}:{uid}:{page.first_rank}:{size}"))
+    if page.has_next and page.last_cursor:
+        xp, uid = page.last_cursor
+        last_rank = page.first_rank + size - 1
+        row.append(InlineKeyboardButton("다음 ▶", callback_data=f"LB:{scope}:n:{xp}:{uid}:{last_rank}:{size}"))
+    return InlineKeyboardMarkup([row]) if row else None
+
+
+async def leaderboard_page_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle `LB:<g|c>:<p|n>:<xp>:<user_id>:<rank>:<size>` leaderboard navigation buttons."""
+    query = update.callback_query
+    try:
+        _, scope, direction, xp, uid, rank, size = query.data.split(":")
+        cursor, rank, size = (int(xp), int(uid)), int(rank), int(size)
+    except ValueError:
+        await query.answer()
+        return
+    await query.answer()
+
+    chat = update.effective_chat
+    scope_chat = chat.id if scope == "c" and chat is not None else None
+    page = await leaderboard_service.get_leaderboard_page(
+        scope_chat,
+        size=size,
+        direction="prev" if direction == "p" else "next",
+        cursor=cursor,
+        rank=rank,
+    )
+    if page.status == "error":
+        await query.edit_message_text(page.error_message or "리더보드 조회 중 오류가 발생했습니다.")
+        return
+    if page.status == "empty":
+        await query.edit_message_text("더 이상 순위가 없습니다.")
+        return
+    try:
+        await query.edit_message_text(
+            _leaderboard_title(scope_chat) + page.text,
+            reply_markup=_leaderboard_keyboard(scope_chat, size, page),
+        )
+    except BadRequest:
+        # same page as already shown ("message is not modified")
+        pass
@@ -0,0 +1,89 @@
+"""Chat activity handlers: `/stats` and the end-of-day digest."""
+from __future__ import annotations
+
+import asyncio
+import datetime
+import logging
+import os
+
+from telegram import Bot, Update
+from telegram.ext import ContextTypes
+
+from .. import utils
+from ..services import stats_service
+from ..utils import extract_ttl_from_args
+from .telegram_utils import send_temporary_message
+
+# chats need at least this many messages in a day to get a digest
+DIGEST_MIN_MESSAGES = int(os.getenv("STATS_DIGEST_MIN_MESSAGES", "20"))
+
+
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """`/stats [yesterday|YYYY-MM-DD]` — activity counters for this chat."""
+    ttl = extract_ttl_from_args(context.args)
+    chat = update.effective_chat
+    if chat is None:
+        return
+    day = stats_service.today_kst()
+    for arg in context.args or []:
+        if arg.lower() in {"yesterday", "어제"}:
+            day -= datetime.timedelta(days=1)
+            break
+        try:
+            day = datetime.date.fromisoformat(arg)
+            break
+        except ValueError:
+            continue
+
+    res = await stats_service.get_stats(chat.id, day)
+    if res.status == "error":
+        await update.message.reply_text(res.error_message or "통계 조회 중 오류가 발생했습니다.")
+        return
+    if res.status == "future":
+        await update.message.reply_text("아직 오지 않은 날짜입니다.")
+        return
+    if res.status == "empty":
+        await update.message.reply_text(f"{day.isoformat()}에 기록된 활동이 없습니다.")
+        return
+
+    await send_temporary_message(
+        update,
+        context,
+        utils.format_chat_stats(res.day, res.messages, res.active_users, res.attendances, res.top),
+        ttl=ttl,
+    )
+    try:
+        await update.message.delete()
+    except Exception:
+        pass
+
+
+async def send_daily_digest(bot: Bot, day: datetime.date) -> int:
+    """Post `day`'s stats to every group chat that was active enough. Returns chats notified."""
+    try:
+        await stats_service.flush()
+    except Exception as e:
+        logging.warning("stats flush before digest failed: %s", e)
+    sent = 0
+    for chat_id in stats_service.active_chats(day):
+        if chat_id >= 0:
+            # private chats
+            continue
+        res = await stats_service.get_stats(chat_id, day)
+        if res.status != "ok" or res.messages < DIGEST_MIN_MESSAGES:
+            continue
+        text = utils.format_chat_stats(res.day, res.messages, res.active_users, res.attendances, res.top, title="🌙 오늘의 채팅 요약")
+        try:
+            await bot.send_message(chat_id=chat_id, text=text)
+            sent += 1
+        except Exception as e:
+            logging.warning("daily digest to %s failed: %s", chat_id, e)
+    return sent
+
+
+async def run_daily_digest(bot: Bot) -> None:
+    """Sleep until each KST midnight and post the finished day's digest."""
+    while True:
+        await asyncio.sleep(utils.seconds_until_next_kst_midnight() + 5)
+        yesterday = stats_service.today_kst() - datetime.timedelta(days=1)
+        await send_daily_digest(bot, yesterday)
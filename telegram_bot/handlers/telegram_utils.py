@@ -2,9 +2,26 @@
 from __future__ import annotations
 
 import asyncio
+import os
+from typing import Awaitable, Callable, Optional
+
 from telegram import Update
 from telegram.ext import ContextTypes
 
+from ..services import coalesce
+
+# sent once per window, in reply to the earlier answer, when identical requests are coalesced into it
+COALESCED_TEXT = "👆 방금 보낸 답변을 확인하세요."
+
+
+def is_admin(update: Update) -> bool:
+    """True if the sender is listed in `ADMIN_IDS` (comma-separated user ids)."""
+    user = update.effective_user
+    if user is None:
+        return False
+    ids = {int(x) for x in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if x.lstrip("-").isdigit()}
+    return user.id in ids
+
 
 async def send_temporary_message(
     update: Update,
@@ -48,3 +65,39 @@ async def send_temporary_message(
             pass
 
     return sent
+
+
+async def send_coalesced(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    key,
+    send: Callable[[], Awaitable[Optional[int]]],
+    ttl: Optional[float] = None,
+) -> None:
+    """Reply via `send()` unless the same request (`key`) was just answered in this group.
+
+    `send` replies and returns the reply's message id, or None on failure. In
+    groups, identical requests within the coalescing window (capped at `ttl`,
+    so a deleted reply is not relied on) get no reply of their own; the first
+    of them gets one short pointer replying to the earlier answer. Private
+    chats are always answered.
+    """
+    chat = update.effective_chat
+    if chat is None or chat.type == "private":
+        await send()
+        return
+    window = min(coalesce.COALESCE_WINDOW_SEC, ttl) if ttl else coalesce.COALESCE_WINDOW_SEC
+    earlier = await coalesce.run_once(chat.id, key, send, window=window)
+    if earlier is None:
+        return
+    try:
+        await send_temporary_message(
+            update,
+            context,
+            COALESCED_TEXT,
+            ttl=ttl,
+            reply_to_message_id=earlier,
+            allow_sending_without_reply=True,
+        )
+    except Exception:
+        pass
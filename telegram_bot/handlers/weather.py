@@ -2,13 +2,30 @@
 from __future__ import annotations
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from typing import List, Tuple
+from typing import List, Optional, Tuple
+import asyncio
+import collections
+import html
 import logging
+import time
 
 from ..services import weather_service
 from ..utils import format_ts_kst, KST
+from .telegram_utils import send_coalesced
 import datetime
 
+# minimum seconds between progressive edits of the dashboard message
+DASHBOARD_EDIT_INTERVAL = 0.8
+
+WEATHER_ICONS = {
+    "Clear": "☀️",
+    "Clouds": "☁️",
+    "Rain": "🌧️",
+    "Drizzle": "🌦️",
+    "Thunderstorm": "⛈️",
+    "Snow": "❄️",
+}
+
 DEFAULT_CITIES: List[Tuple[str, str]] = [
     ("서울", "Seoul"),
     ("부산", "Busan"),
@@ -32,6 +49,7 @@ def generate_keyboard(cities, delete_mode: bool = False):
     if delete_mode:
         keyboard.append([InlineKeyboardButton("⬅️ 뒤로가기", callback_data="Back")])
     else:
+        keyboard.append([InlineKeyboardButton("🌐 전체 보기", callback_data="All")])
         keyboard.append([
             InlineKeyboardButton("➕ 새 지역 추가", callback_data="Add"),
             InlineKeyboardButton("🗑️ 삭제 모드", callback_data="DeleteMode"),
@@ -40,10 +58,146 @@ def generate_keyboard(cities, delete_mode: bool = False):
     return InlineKeyboardMarkup(keyboard)
 
 
+def render_dashboard(favorites, results: dict, done: bool) -> str:
+    """Compact one-line-per-city table; cities still loading show ⏳."""
+    width = max((len(name) for name, _ in favorites), default=2)
+    lines = []
+    for name, api in favorites:
+        label = name + "　" * (width - len(name))
+        if api not in results:
+            lines.append(f"{label} ⏳")
+            continue
+        data = results[api]
+        info = weather_service.parse_weather_data(data) if data else None
+        if not info:
+            lines.append(f"{label} ⚠️ 정보 없음")
+            continue
+        _, temp, humidity, wind_speed = info
+        main = (data.get("weather") or [{}])[0].get("main", "")
+        icon = WEATHER_ICONS.get(main, "🌫️")
+        lines.append(f"{label} {icon} {temp:5.1f}°C 💧{humidity:3d}% 🌬️{wind_speed:4.1f}")
+    header = "🌐 <b>즐겨찾기 전체 날씨</b>" + ("" if done else " (불러오는 중…)")
+    return header + "\n<pre>" + html.escape("\n".join(lines)) + "</pre>"
+
+
+def format_weather_message(display_name: str, weather_data: dict) -> Optional[str]:
+    """Detailed current-weather message, or None if the response cannot be parsed."""
+    info = weather_service.parse_weather_data(weather_data)
+    if not info:
+        return None
+    desc, temp, humidity, wind_speed = info
+    # The dt field in weather_data is a unix timestamp. We keep human-friendly timestamp.
+    dt_ts = weather_data.get("dt")
+    if dt_ts:
+        dt_iso = datetime.datetime.utcfromtimestamp(int(dt_ts)).replace(tzinfo=datetime.timezone.utc).astimezone(KST).isoformat()
+        last_update = format_ts_kst(dt_iso)
+    else:
+        last_update = "-"
+
+    return (
+        f"🌍 <b>{html.escape(display_name)}</b> 현재 날씨\n\n"
+        f"☁️ 상태: <b>{desc}</b>\n"
+        f"🌡️ 기온: <b>{temp}°C</b>\n"
+        f"💧 습도: <b>{humidity}%</b>\n"
+        f"🌬️ 풍속: <b>{wind_speed} m/s</b>\n\n"
+        f"🕒 데이터 시각: <b>{last_update}</b>"
+    )
+
+
+def render_forecast(display_name: str, forecast: dict, detail_steps: int = 8) -> str:
+    """Next `detail_steps` 3-hour steps in detail, then one line per remaining day (KST)."""
+    now = time.time()
+    # a cached forecast can be up to one step old; skip steps already over
+    steps = [s for s in forecast.get("steps", []) if s[0] + 3 * 3600 > now]
+    lines = [f"📆 <b>{html.escape(display_name)}</b> 일기예보", ""]
+    for dt, temp, pop, main, desc in steps[:detail_steps]:
+        t = datetime.datetime.fromtimestamp(dt, KST)
+        icon = WEATHER_ICONS.get(main, "🌫️")
+        lines.append(f"{t:%m/%d %H}시 {icon} {temp:5.1f}°C ☔{pop:3d}% {html.escape(desc)}")
+
+    days: dict = {}
+    for dt, temp, pop, main, _ in steps[detail_steps:]:
+        day = datetime.datetime.fromtimestamp(dt, KST).date()
+        lo, hi, top_pop, mains = days.setdefault(day, [temp, temp, pop, collections.Counter()])
+        days[day][:3] = [min(lo, temp), max(hi, temp), max(top_pop, pop)]
+        mains[main] += 1
+    if days:
+        lines.append("")
+    for day, (lo, hi, top_pop, mains) in days.items():
+        icon = WEATHER_ICONS.get(mains.most_common(1)[0][0], "🌫️")
+        lines.append(f"{day:%m/%d}({'월화수목금토일'[day.weekday()]}) {icon} {lo:.0f}~{hi:.0f}°C ☔{top_pop}%")
+    return "\n".join(lines)
+
+
+async def show_dashboard(edit, favorites, reply_markup=None) -> None:
+    """Fetch every favorite concurrently and progressively edit one message.
+
+    `edit` is a coroutine function taking (text, reply_markup); edits are
+    throttled to one per DASHBOARD_EDIT_INTERVAL seconds plus a final one.
+    """
+    results: dict[str, Optional[dict]] = {}
+    loop = asyncio.get_running_loop()
+    last_edit = loop.time()
+    async for city, data in weather_service.get_weather_many(api for _, api in favorites):
+        results[city] = data
+        if len(results) < len(favorites) and loop.time() - last_edit >= DASHBOARD_EDIT_INTERVAL:
+            try:
+                await edit(render_dashboard(favorites, results, done=False), None)
+            except Exception:
+                pass
+            last_edit = loop.time()
+    await edit(render_dashboard(favorites, results, done=True), reply_markup)
+
+
+def _resolve_city(name: str, favorites) -> Tuple[str, str]:
+    """(api name, display name) for a typed city: a favorite's name or api name, else `name` itself."""
+    city_api_name = next(
+        (api for n, api in favorites if n == name or api.lower() == name.lower()), name
+    )
+    display_name = next((n for n, api in favorites if api == city_api_name), name)
+    return city_api_name, display_name
+
+
 async def weather_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if "favorites" not in context.user_data:
         context.user_data["favorites"] = DEFAULT_CITIES.copy()
     context.user_data["waiting_for_location"] = False
+    if context.args and context.args[0].lower() in {"all", "전체"}:
+        favorites = context.user_data["favorites"]
+        sent = await update.message.reply_text(
+            render_dashboard(favorites, {}, done=False),
+            parse_mode="HTML",
+        )
+
+        async def _edit(text, markup):
+            await sent.edit_text(text, reply_markup=markup, parse_mode="HTML")
+
+        try:
+            await update.message.delete()
+        except Exception:
+            pass
+        await show_dashboard(_edit, favorites, reply_markup=generate_keyboard(favorites))
+        return
+    city_args = [a for a in context.args or [] if not a.startswith("ttl:")]
+    if city_args:
+        name = " ".join(city_args)
+        city_api_name, display_name = _resolve_city(name, context.user_data["favorites"])
+
+        async def _send() -> Optional[int]:
+            weather_data = await weather_service.get_weather_raw(city_api_name)
+            message = format_weather_message(display_name, weather_data) if weather_data else None
+            if message is None:
+                await update.message.reply_text(f"⚠️ '{name}' 지역을 찾을 수 없습니다.")
+                return None
+            sent = await update.message.reply_text(message, parse_mode="HTML")
+            try:
+                await update.message.delete()
+            except Exception:
+                pass
+            return sent.message_id
+
+        await send_coalesced(update, context, ("weather", city_api_name.lower()), _send)
+        return
     await update.message.reply_text(
         "🌦️ <b>실시간 날씨 확인</b>\n\n자주 찾는 도시를 선택하거나 ➕ 버튼으로 새로운 도시를 추가하세요.",
         reply_markup=generate_keyboard(context.user_data["favorites"]),
@@ -55,6 +209,25 @@ async def weather_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         pass
 
 
+async def forecast_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """`/forecast [도시]` — 5-day forecast; defaults to the first favorite."""
+    favorites = context.user_data.setdefault("favorites", DEFAULT_CITIES.copy())
+    if context.args:
+        city_api_name, display_name = _resolve_city(" ".join(context.args), favorites)
+    else:
+        display_name, city_api_name = (favorites or DEFAULT_CITIES)[0]
+
+    forecast = await weather_service.get_forecast(city_api_name)
+    if not forecast or not forecast.get("steps"):
+        await update.message.reply_text(f"⚠️ '{display_name}' 지역의 예보를 찾을 수 없습니다.")
+        return
+    await update.message.reply_text(render_forecast(display_name, forecast), parse_mode="HTML")
+    try:
+        await update.message.delete()
+    except Exception:
+        pass
+
+
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -63,7 +236,8 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if data == "Add":
         await query.edit_message_text(
-            "➕ <b>새로운 지역명을 입력하세요</b>\n예시: <code>서울</code>, <code>부산</code>",
+            "➕ <b>새로운 지역명을 입력하세요</b>\n예시: <code>서울</code>, <code>부산</code>\n"
+            "📎 위치를 공유하면 현재 위치의 날씨를 추가합니다.",
             parse_mode="HTML",
         )
         context.user_data["waiting_for_location"] = True
@@ -96,6 +270,15 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
+    if data == "All":
+        await query.edit_message_text(render_dashboard(favorites, {}, done=False), parse_mode="HTML")
+
+        async def _edit(text, markup):
+            await query.edit_message_text(text, reply_markup=markup, parse_mode="HTML")
+
+        await show_dashboard(_edit, favorites, reply_markup=generate_keyboard(favorites))
+        return
+
     if data == "Cancel":
         await query.edit_message_text("✅ 메뉴가 닫혔습니다.")
         context.user_data["waiting_for_location"] = False
@@ -108,30 +291,11 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text(f"⚠️ '{city_api_name}' 지역을 찾을 수 없습니다.")
         return
 
-    info = weather_service.parse_weather_data(weather_data)
-    if not info:
+    display_name = next((name for name, api in favorites if api == city_api_name), city_api_name)
+    message = format_weather_message(display_name, weather_data)
+    if message is None:
         await query.edit_message_text("⚠️ 날씨 정보를 파싱할 수 없습니다.")
         return
-    desc, temp, humidity, wind_speed = info
-    display_name = next((name for name, api in favorites if api == city_api_name), city_api_name)
-    # Construct the display message with last_update below
-    # The dt field in weather_data is a unix timestamp. We keep human-friendly timestamp.
-    # For now, omit dt formatting; keep concise output.
-    dt_ts = weather_data.get("dt")
-    if dt_ts:
-        dt_iso = datetime.datetime.utcfromtimestamp(int(dt_ts)).replace(tzinfo=datetime.timezone.utc).astimezone(KST).isoformat()
-        last_update = format_ts_kst(dt_iso)
-    else:
-        last_update = "-"
-
-    message = (
-        f"🌍 <b>{display_name}</b> 현재 날씨\n\n"
-        f"☁️ 상태: <b>{desc}</b>\n"
-        f"🌡️ 기온: <b>{temp}°C</b>\n"
-        f"💧 습도: <b>{humidity}%</b>\n"
-        f"🌬️ 풍속: <b>{wind_speed} m/s</b>\n\n"
-        f"🕒 데이터 시각: <b>{last_update}</b>"
-    )
     await query.edit_message_text(text=message, reply_markup=generate_keyboard(favorites), parse_mode="HTML")
 
 
@@ -168,3 +332,35 @@ async def add_location(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.delete()
     except Exception:
         pass
+
+
+async def location_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Weather for a shared location; the location's geohash cell is added to favorites.
+
+    In private chats every location share is answered; elsewhere only while
+    the user is adding a location.
+    """
+    message = update.message
+    chat = update.effective_chat
+    if message is None or message.location is None:
+        return
+    if (chat is None or chat.type != "private") and not context.user_data.get("waiting_for_location"):
+        return
+    context.user_data["waiting_for_location"] = False
+
+    key, weather_data = await weather_service.get_weather_by_coords(
+        message.location.latitude, message.location.longitude
+    )
+    if not weather_data:
+        await message.reply_text("⚠️ 이 위치의 날씨 정보를 가져올 수 없습니다.")
+        return
+
+    favorites = context.user_data.setdefault("favorites", DEFAULT_CITIES.copy())
+    existing = next((name for name, api in favorites if api == key), None)
+    display_name = existing or weather_data.get("name") or "현재 위치"
+    if existing is None:
+        favorites.append((display_name, key))
+    text = format_weather_message(display_name, weather_data) or "⚠️ 날씨 정보를 파싱할 수 없습니다."
+    if existing is None:
+        text += f"\n\n✅ '{html.escape(display_name)}' 위치가 즐겨찾기에 추가되었습니다."
+    await message.reply_text(text, reply_markup=generate_keyboard(favorites), parse_mode="HTML")
@@ -0,0 +1,98 @@
+"""Typed row models returned by the db layer.
+
+Rows are decoded once at the db boundary: ids and counters become ints and
+timestamps become timezone-aware datetimes, so services, handlers and caches
+never re-parse PostgREST payloads. All models use `__slots__` to keep cached
+rows small.
+"""
+from __future__ import annotations
+
+import datetime
+from dataclasses import dataclass
+from typing import Any, Optional
+
+
+def parse_ts(value: Any) -> Optional[datetime.datetime]:
+    """Decode a PostgREST timestamp (ISO string, possibly `Z`-suffixed) to an aware datetime."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime.datetime):
+        dt = value
+    else:
+        s = str(value)
+        if s.endswith("Z"):
+            s = s[:-1] + "+00:00"
+        try:
+            dt = datetime.datetime.fromisoformat(s)
+        except ValueError:
+            return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return dt
+
+
+@dataclass(slots=True)
+class UserRow:
+    id: int
+    username: Optional[str] = None
+    xp: int = 0
+    level: int = 1
+    last_xp_at: Optional[datetime.datetime] = None
+
+    @property
+    def next_xp(self) -> int:
+        """Total XP required for the next level (see `db.calc_level_from_xp`)."""
+        return 100 * self.level * self.level
+
+    @classmethod
+    def from_record(cls, r: dict) -> "UserRow":
+        return cls(
+            id=int(r["id"]),
+            username=r.get("username"),
+            xp=int(r.get("xp") or 0),
+            level=int(r.get("level") or 1),
+            last_xp_at=parse_ts(r.get("last_xp_at")),
+        )
+
+    def to_record(self) -> dict:
+        return {
+            "id": self.id,
+            "username": self.username,
+            "xp": self.xp,
+            "level": self.level,
+            "last_xp_at": self.last_xp_at.isoformat() if self.last_xp_at else None,
+        }
+
+
+@dataclass(slots=True)
+class AttendanceRow:
+    id: int
+    user_id: int
+    ts: datetime.datetime
+
+    @classmethod
+    def from_record(cls, r: dict, user_id: Optional[int] = None) -> Optional["AttendanceRow"]:
+        ts = parse_ts(r.get("ts"))
+        if ts is None:
+            return None
+        return cls(id=int(r.get("id") or 0), user_id=int(r.get("user_id") or user_id or 0), ts=ts)
+
+
+@dataclass(slots=True)
+class LeaderboardEntry:
+    id: int
+    username: Optional[str] = None
+    xp: int = 0
+    level: int = 1
+
+    @classmethod
+    def from_record(cls, r: dict) -> "LeaderboardEntry":
+        return cls(
+            id=int(r["id"]),
+            username=r.get("username"),
+            xp=int(r.get("xp") or 0),
+            level=int(r.get("level") or 1),
+        )
+
+    def to_record(self) -> dict:
+        return {"id": self.id, "username": self.username, "xp": self.xp, "level": self.level}
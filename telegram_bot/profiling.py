@@ -0,0 +1,209 @@
+"""On-demand profiling of the running bot.
+
+`run_profile` samples the event-loop thread and the DB executor threads for a
+fixed duration, with before/after `tracemalloc` snapshots, and writes:
+
+- `cpu-<ts>.collapsed`: collapsed stacks (`frame;frame;frame count`, the
+  input format of flamegraph.pl / speedscope). Loop samples are rooted at the
+  handler that was running (`handler:<module>.<function>`) or the asyncio task
+  otherwise; executor samples at `db:<operation>`.
+- `mem-<ts>.txt`: the top allocation growth between the snapshots plus an
+  inventory of the bot's in-process caches, queues and live asyncio tasks.
+
+Triggered by the admin-only `/profile` command or SIGUSR1. Only one profile
+runs at a time.
+"""
+from __future__ import annotations
+
+import asyncio
+import collections
+import datetime
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Optional
+
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+_HANDLERS_DIR = os.path.join(_PACKAGE_DIR, "handlers")
+_MAX_DEPTH = 64
+_TRACEMALLOC_FRAMES = 16
+
+_lock = asyncio.Lock()
+
+
+def profile_dir() -> Path:
+    return Path(os.getenv("PROFILE_DIR", ".cache/profiles"))
+
+
+def _label(code) -> str:
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def _stack(frame) -> list:
+    """Code objects of `frame` and its callers, outermost first."""
+    codes = []
+    while frame is not None and len(codes) < _MAX_DEPTH:
+        codes.append(frame.f_code)
+        frame = frame.f_back
+    codes.reverse()
+    return codes
+
+
+def _task_label(task: Optional[asyncio.Task]) -> str:
+    if task is None:
+        return "loop:callbacks"
+    coro = task.get_coro()
+    return f"task:{getattr(coro, '__qualname__', None) or task.get_name()}"
+
+
+class SamplingProfiler:
+    """Periodically samples the loop thread and `db-*` executor threads from a helper thread."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, interval: float = 0.005):
+        self.loop = loop
+        self.interval = interval
+        self.counts: collections.Counter[str] = collections.Counter()
+        self.samples = 0
+        self._loop_thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self) -> None:
+        frames = sys._current_frames()
+        self.samples += 1
+
+        frame = frames.get(self._loop_thread_id)
+        if frame is not None:
+            codes = _stack(frame)
+            root = None
+            for code in codes:
+                if code.co_filename.startswith(_HANDLERS_DIR):
+                    root = "handler:" + _label(code).replace(":", ".", 1)
+                    break
+            if root is None:
+                task = asyncio.current_task(self.loop)
+                idle = task is None and codes and codes[-1].co_filename.endswith("selectors.py")
+                root = "loop:idle" if idle else _task_label(task)
+            self.counts[";".join([root] + [_label(c) for c in codes])] += 1
+
+        for thread in threading.enumerate():
+            if not thread.name.startswith("db-") or thread.ident not in frames:
+                continue
+            codes = _stack(frames[thread.ident])
+            # idle workers are parked in the pool's queue; only count ones running our code
+            ours = [c for c in codes if c.co_filename.startswith(_PACKAGE_DIR)]
+            if not ours:
+                continue
+            root = "db:" + getattr(ours[-1], "co_qualname", ours[-1].co_name)
+            self.counts[";".join([root] + [_label(c) for c in codes])] += 1
+
+
+def inventory(app: Any = None) -> dict[str, Any]:
+    """Sizes of the bot's long-lived in-process structures (for spotting growth)."""
+    from . import db
+    from .services import flood_service, membership, stats_service, weather_service, xp_service
+
+    out: dict[str, Any] = {
+        "db._user_cache": len(db._user_cache),
+        "xp_service._pending": len(xp_service._pending),
+        "xp_service._pending_chat": len(xp_service._pending_chat),
+        "xp_service._pending_events": len(xp_service._pending_events),
+        "xp_service._staged": len(xp_service._staged),
+        "weather_service._cache": len(weather_service._cache),
+        "stats_service._days": len(stats_service._days),
+        "membership ids": membership.size(),
+        "flood buckets": len(flood_service._user_buckets) + len(flood_service._chat_buckets),
+    }
+    if app is not None:
+        out["context.user_data (users)"] = len(app.user_data)
+        out["context.user_data (keys)"] = sum(len(d) for d in app.user_data.values())
+        out["context.chat_data (chats)"] = len(app.chat_data)
+    tasks = collections.Counter(_task_label(t) for t in asyncio.all_tasks())
+    out["asyncio tasks"] = sum(tasks.values())
+    for name, n in tasks.most_common(15):
+        out[f"  {name}"] = n
+    return out
+
+
+@dataclass
+class ProfileReport:
+    cpu_path: Path
+    mem_path: Path
+    samples: int
+    top: list[tuple[str, int]] = field(default_factory=list)
+    mem_growth_kib: float = 0.0
+
+
+def _write_reports(report: ProfileReport, counts, diff, inv: dict, duration: float) -> None:
+    report.cpu_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(report.cpu_path, "w", encoding="utf-8") as f:
+        for stack, n in counts.most_common():
+            f.write(f"{stack} {n}\n")
+    with open(report.mem_path, "w", encoding="utf-8") as f:
+        f.write(f"# tracemalloc growth over {duration:.0f}s (top 50 by size delta)\n")
+        for stat in diff[:50]:
+            f.write(f"{stat.size_diff / 1024:+.1f} KiB ({stat.count_diff:+d} blocks)\n")
+            for line in stat.traceback.format()[-6:]:
+                f.write(f"    {line}\n")
+        f.write("\n# inventory after profiling\n")
+        for key, value in inv.items():
+            f.write(f"{key}: {value}\n")
+
+
+def busy() -> bool:
+    return _lock.locked()
+
+
+async def run_profile(duration: float = 30.0, app: Any = None) -> ProfileReport:
+    """Profile CPU and memory for `duration` seconds and write the reports."""
+    async with _lock:
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(_TRACEMALLOC_FRAMES)
+        before = tracemalloc.take_snapshot()
+        profiler = SamplingProfiler(asyncio.get_running_loop())
+        profiler.start()
+        t0 = time.monotonic()
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            profiler.stop()
+            after = tracemalloc.take_snapshot()
+            if started_tracing:
+                tracemalloc.stop()
+
+        # leave out tracemalloc's and the sampler's own allocations
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        diff = after.filter_traces(filters).compare_to(before.filter_traces(filters), "traceback")
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        directory = profile_dir()
+        roots = collections.Counter()
+        for stack, n in profiler.counts.items():
+            roots[stack.split(";", 1)[0]] += n
+        report = ProfileReport(
+            cpu_path=directory / f"cpu-{stamp}.collapsed",
+            mem_path=directory / f"mem-{stamp}.txt",
+            samples=profiler.samples,
+            top=roots.most_common(10),
+            mem_growth_kib=sum(s.size_diff for s in diff) / 1024,
+        )
+        await asyncio.to_thread(
+            _write_reports, report, profiler.counts, diff, inventory(app), time.monotonic() - t0
+        )
+        return report
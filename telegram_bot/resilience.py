@@ -0,0 +1,161 @@
+"""Small resilience primitives for calls to external services.
+
+- `CircuitBreaker` fails fast after repeated failures and lets a single probe
+  through once its cool-down has passed.
+- `RateBudget` is a sliding-window call budget (e.g. an API quota).
+- `TokenBucket` allows bursts up to `capacity` refilled at `rate` per second.
+- `retry_async` retries a coroutine with capped exponential backoff and full
+  jitter.
+
+None of these know about a particular client; the weather and DB layers wrap
+their own calls with them.
+"""
+from __future__ import annotations
+
+import asyncio
+import collections
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(RuntimeError):
+    """Raised (or reported) when a call is refused because the breaker is open."""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return CLOSED
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return HALF_OPEN
+        return OPEN
+
+    def allow(self) -> bool:
+        """Return True if a call may proceed. In half-open state only one probe is allowed."""
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """Give back a half-open probe slot without recording an outcome.
+
+        Callers must do this when a call allowed by `allow()` ends without an
+        outcome, including on cancellation, or a half-open breaker refuses
+        every later call.
+        """
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._probe_in_flight or self._failures >= self.failure_threshold:
+            # a failed probe re-opens immediately for another full cool-down
+            self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+    def snapshot(self) -> dict:
+        return {"name": self.name, "state": self.state, "failures": self._failures}
+
+
+class RateBudget:
+    """Allow at most `limit` calls in any `window`-second sliding window."""
+
+    def __init__(self, limit: int, window: float = 60.0):
+        self.limit = limit
+        self.window = window
+        self._calls: collections.deque[float] = collections.deque()
+
+    def _trim(self, now: float) -> None:
+        while self._calls and now - self._calls[0] >= self.window:
+            self._calls.popleft()
+
+    def try_acquire(self) -> bool:
+        now = time.monotonic()
+        self._trim(now)
+        if len(self._calls) >= self.limit:
+            return False
+        self._calls.append(now)
+        return True
+
+    def remaining(self) -> int:
+        self._trim(time.monotonic())
+        return max(0, self.limit - len(self._calls))
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self, now: Optional[float] = None) -> float:
+        self._refill(time.monotonic() if now is None else now)
+        return self.tokens
+
+    def take(self, cost: float, now: Optional[float] = None) -> bool:
+        if self.available(now) < cost:
+            return False
+        self.tokens -= cost
+        return True
+
+    def wait_time(self, cost: float) -> float:
+        """Seconds until `cost` tokens will be available."""
+        missing = cost - self.available()
+        return max(0.0, missing / self.rate) if self.rate > 0 else float("inf")
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter delay for retry number `attempt` (0-based)."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+async def retry_async(
+    fn: Callable[[], Awaitable[T]],
+    attempts: int = 3,
+    base_delay: float = 0.2,
+    max_delay: float = 2.0,
+    retry_on: Callable[[BaseException], bool] = lambda e: True,
+) -> T:
+    """Await `fn()` up to `attempts` times, sleeping a jittered backoff between tries.
+
+    Exceptions for which `retry_on` returns False are raised immediately.
+    """
+    for attempt in range(attempts):
+        try:
+            return await fn()
+        except Exception as e:
+            if attempt == attempts - 1 or not retry_on(e):
+                raise
+            await asyncio.sleep(backoff_delay(attempt, base_delay, max_delay))
+    raise AssertionError("unreachable")
@@ -2,10 +2,28 @@ from . import xp_service
 from . import attendance_service
 from . import user_service
 from . import leaderboard_service
+from . import attendance_bitmap
+from . import event_bus
+from . import flood_service
+from . import membership
+from . import stats_service
+from . import rank_history
+from . import dedup
+from . import coalesce
+from . import broadcast_service
 
 __all__ = [
     "xp_service",
     "attendance_service",
     "user_service",
     "leaderboard_service",
+    "attendance_bitmap",
+    "event_bus",
+    "flood_service",
+    "membership",
+    "stats_service",
+    "rank_history",
+    "dedup",
+    "coalesce",
+    "broadcast_service",
 ]
@@ -0,0 +1,210 @@
+"""Compact per-user attendance day bitmaps (no Telegram dependencies).
+
+Each user's attendance is kept as a Python int used as a bitmap: bit `i` is
+set when the user attended on KST epoch day `anchor + i`. Today-checks are a
+single bit test, streaks are bit scans and a month calendar is a slice of the
+bits. Bitmaps live in memory (least recently used ones are evicted past
+`_MAX_BITMAPS`), are persisted to `attendance_bitmaps`, and are rebuilt from
+`attendances` by streaming when a user has no stored bitmap. A stored bitmap
+is topped up on load with attendances newer than it, so a failed persist can
+not let a user attend twice after a restart.
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import datetime
+from collections import OrderedDict
+from typing import Optional
+
+from .. import db
+from ..utils import KST
+
+
+_KST_EPOCH = datetime.date(1970, 1, 1)
+_REBUILD_PAGE_SIZE = 1000
+_MAX_BITMAPS = 10_000
+# stored bitmaps are topped up from attendances since `updated_at` minus this
+# (client and DB clocks differ; re-setting a bit is harmless)
+_TOP_UP_MARGIN = datetime.timedelta(hours=1)
+
+
+def epoch_day(date: datetime.date) -> int:
+    """Return the number of days between 1970-01-01 and `date` (a KST date)."""
+    return (date - _KST_EPOCH).days
+
+
+def today_epoch_day() -> int:
+    return epoch_day(datetime.datetime.now(KST).date())
+
+
+def ts_to_epoch_day(ts: datetime.datetime) -> int:
+    return epoch_day(ts.astimezone(KST).date())
+
+
+class AttendanceBitmap:
+    __slots__ = ("anchor", "bits")
+
+    def __init__(self, anchor: int, bits: int = 0):
+        self.anchor = anchor
+        self.bits = bits
+
+    def has(self, day: int) -> bool:
+        offset = day - self.anchor
+        return offset >= 0 and (self.bits >> offset) & 1 == 1
+
+    def set(self, day: int) -> None:
+        if day < self.anchor:
+            self.bits <<= self.anchor - day
+            self.anchor = day
+        self.bits |= 1 << (day - self.anchor)
+
+    def last_day(self) -> Optional[int]:
+        if not self.bits:
+            return None
+        return self.anchor + self.bits.bit_length() - 1
+
+    def current_streak(self) -> int:
+        """Length of the run of consecutive days ending at the most recent attendance."""
+        if not self.bits:
+            return 0
+        top = self.bits.bit_length() - 1
+        zeros = ~self.bits & ((1 << (top + 1)) - 1)
+        if not zeros:
+            return top + 1
+        return top - (zeros.bit_length() - 1)
+
+    def longest_streak(self) -> int:
+        """Length of the longest run of set bits (x & (x << 1) shortens every run by one)."""
+        x = self.bits
+        n = 0
+        while x:
+            x &= x << 1
+            n += 1
+        return n
+
+    def days_in_range(self, start: int, end: int) -> int:
+        """Return the bits for days [start, end) as an int with bit 0 = `start`."""
+        if end <= start or not self.bits:
+            return 0
+        lo = start - self.anchor
+        width = end - start
+        if lo >= 0:
+            chunk = self.bits >> lo
+        else:
+            chunk = self.bits << -lo
+        return chunk & ((1 << width) - 1)
+
+    def encode(self) -> str:
+        raw = self.bits.to_bytes((self.bits.bit_length() + 7) // 8, "little")
+        return base64.b64encode(raw).decode("ascii")
+
+    @classmethod
+    def decode(cls, anchor: int, bits: str) -> "AttendanceBitmap":
+        return cls(anchor, int.from_bytes(base64.b64decode(bits), "little"))
+
+
+_bitmaps: OrderedDict[int, AttendanceBitmap] = OrderedDict()
+_load_locks: dict[int, asyncio.Lock] = {}
+
+
+async def _apply_attendances(bm: AttendanceBitmap, user_id: int, after: Optional[str]) -> AttendanceBitmap:
+    """Set the bits for the user's attendances after `after` (all of them for None)."""
+    while True:
+        batch = await db.get_attendance_ts_after(user_id, after, limit=_REBUILD_PAGE_SIZE)
+        for ts in batch:
+            bm.set(ts_to_epoch_day(ts))
+        if len(batch) < _REBUILD_PAGE_SIZE:
+            break
+        after = batch[-1].isoformat()
+    return bm
+
+
+async def _load(user_id: int) -> AttendanceBitmap:
+    row = await db.get_attendance_bitmap(user_id)
+    if not row:
+        bm = await _apply_attendances(AttendanceBitmap(today_epoch_day()), user_id, None)
+        await db.upsert_attendance_bitmaps([{"user_id": user_id, "anchor_day": bm.anchor, "bits": bm.encode()}])
+        return bm
+    bm = AttendanceBitmap.decode(int(row["anchor_day"]), row["bits"])
+    updated = row.get("updated_at")
+    if updated:
+        since = datetime.datetime.fromisoformat(str(updated).replace("Z", "+00:00")) - _TOP_UP_MARGIN
+        await _apply_attendances(bm, user_id, since.isoformat())
+    return bm
+
+
+def _remember(user_id: int, bm: AttendanceBitmap) -> None:
+    _bitmaps[user_id] = bm
+    _bitmaps.move_to_end(user_id)
+    while len(_bitmaps) > _MAX_BITMAPS:
+        _bitmaps.popitem(last=False)
+
+
+async def get_bitmap(user_id: int) -> AttendanceBitmap:
+    """Return the user's bitmap: memory, then `attendance_bitmaps` (topped up), then a rebuild."""
+    bm = _bitmaps.get(user_id)
+    if bm is not None:
+        _bitmaps.move_to_end(user_id)
+        return bm
+    lock = _load_locks.setdefault(user_id, asyncio.Lock())
+    async with lock:
+        bm = _bitmaps.get(user_id)
+        if bm is None:
+            bm = await _load(user_id)
+            _remember(user_id, bm)
+    _load_locks.pop(user_id, None)
+    return bm
+
+
+async def mark(user_id: int, day: Optional[int] = None) -> AttendanceBitmap:
+    """Set the bit for `day` (default: today KST) and persist the bitmap."""
+    bm = await get_bitmap(user_id)
+    bm.set(today_epoch_day() if day is None else day)
+    await db.upsert_attendance_bitmaps([{"user_id": user_id, "anchor_day": bm.anchor, "bits": bm.encode()}])
+    return bm
+
+
+async def rebuild_all(batch_size: int = 500, page_size: int = _REBUILD_PAGE_SIZE) -> int:
+    """Rebuild every stored bitmap from `attendances` in one streaming pass.
+
+    Rows are read by (user_id, id) keyset pages, so only the current user's
+    bitmap and one pending upsert batch are held in memory. Returns the number
+    of users written.
+    """
+    written = 0
+    pending: list[dict] = []
+    cur_uid: Optional[int] = None
+    cur: Optional[AttendanceBitmap] = None
+    after_uid, after_id = -(2 ** 63), 0
+
+    async def _emit():
+        nonlocal pending, written
+        if pending:
+            await db.upsert_attendance_bitmaps(pending, lane=db.BACKGROUND)
+            written += len(pending)
+            pending = []
+
+    while True:
+        rows = await db.get_attendance_rows_after(after_uid, after_id, limit=page_size)
+        for r in rows:
+            uid = r.user_id
+            if uid != cur_uid:
+                if cur is not None:
+                    pending.append({"user_id": cur_uid, "anchor_day": cur.anchor, "bits": cur.encode()})
+                    if len(pending) >= batch_size:
+                        await _emit()
+                cur_uid, cur = uid, None
+            day = ts_to_epoch_day(r.ts)
+            if cur is None:
+                cur = AttendanceBitmap(day)
+            cur.set(day)
+        if len(rows) < page_size:
+            break
+        after_uid, after_id = rows[-1].user_id, rows[-1].id
+
+    if cur is not None:
+        pending.append({"user_id": cur_uid, "anchor_day": cur.anchor, "bits": cur.encode()})
+    await _emit()
+    _bitmaps.clear()
+    return written
@@ -1,10 +1,22 @@
 """Attendance-related business logic (no Telegram dependencies)."""
 from __future__ import annotations
 
+import datetime
+import time
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Any, Iterable, Literal
+from typing import Literal
 
-from .. import db
+from .. import db, utils
+from . import attendance_bitmap
+
+
+# hard cap on rows per history page; keeps every reply well under Telegram's limit
+HISTORY_PAGE_SIZE = 10
+_PAGE_CACHE_TTL = 60.0
+_PAGE_CACHE_MAX_USERS = 256
+_PAGE_CACHE_MAX_PAGES_PER_USER = 8
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
 
 
 @dataclass
@@ -18,10 +30,15 @@ class AttendanceResult:
 
 
 @dataclass
-class AttendanceHistoryResult:
+class AttendancePage:
     status: Literal["ok", "empty", "error"]
     error_message: str | None = None
-    timestamps: list[str] | None = None
+    text: str | None = None
+    # cursors are (epoch microseconds, id) of the newest/oldest row on the page
+    newest_cursor: tuple[int, int] | None = None
+    oldest_cursor: tuple[int, int] | None = None
+    has_newer: bool = False
+    has_older: bool = False
 
 
 @dataclass
@@ -29,25 +46,23 @@ class StreakResult:
     status: Literal["ok", "error"]
     error_message: str | None = None
     streak: int = 0
+    longest: int = 0
 
 
-def _extract_data(res: Any) -> Any:
-    return res.get("data") if isinstance(res, dict) else getattr(res, "data", None)
-
-
-def _extract_level_info(data: Any) -> tuple[bool, int | None, int | None]:
-    if not isinstance(data, dict):
-        return False, None, None
-    old_level = data.get("old_level")
-    new_level = data.get("new_level")
-    if old_level and new_level and new_level > old_level:
-        return True, int(old_level), int(new_level)
-    return False, old_level, new_level
+@dataclass
+class CalendarResult:
+    status: Literal["ok", "error"]
+    error_message: str | None = None
+    year: int = 0
+    month: int = 0
+    # days of the month (1-based) the user attended
+    days: list[int] | None = None
 
 
 async def attend(user_id: int) -> AttendanceResult:
     try:
-        already = await db.attended_today(user_id)
+        bitmap = await attendance_bitmap.get_bitmap(user_id)
+        already = bitmap.has(attendance_bitmap.today_epoch_day())
     except Exception as e:
         return AttendanceResult(
             status="error",
@@ -58,55 +73,143 @@ async def attend(user_id: int) -> AttendanceResult:
         return AttendanceResult(status="already")
 
     try:
-        res = await db.record_attendance(user_id)
+        row = await db.record_attendance(user_id)
     except Exception as e:
         return AttendanceResult(
             status="error",
             error_message=f"출석 처리 중 오류가 발생했습니다: {e}",
         )
 
-    data = _extract_data(res)
-    level_up, old_level, new_level = _extract_level_info(data)
-    return AttendanceResult(
-        status="recorded",
-        should_notify=bool(data),
-        level_up=level_up,
-        old_level=old_level,
-        new_level=new_level,
-    )
+    invalidate_history_pages(user_id)
+    try:
+        await attendance_bitmap.mark(user_id)
+    except Exception as e:
+        print(f"[ERROR] attend: Failed to persist attendance bitmap for user {user_id}: {type(e).__name__}: {e}")
+    return AttendanceResult(status="recorded", should_notify=row is not None)
+
+
+# user_id -> OrderedDict[(direction, cursor, size) -> (page, expires_at)]
+_page_cache: OrderedDict[int, OrderedDict[tuple, tuple[AttendancePage, float]]] = OrderedDict()
+
+
+def _cursor_from_ts(ts: datetime.datetime) -> int:
+    return (ts - _EPOCH) // datetime.timedelta(microseconds=1)
+
+
+def _ts_from_cursor(cursor: int) -> str:
+    return (_EPOCH + datetime.timedelta(microseconds=cursor)).isoformat()
+
+
+def _db_cursor(cursor: tuple[int, int | None]) -> tuple[str, int | None]:
+    return _ts_from_cursor(cursor[0]), cursor[1]
+
 
+def _page_cache_get(user_id: int, key: tuple) -> AttendancePage | None:
+    pages = _page_cache.get(user_id)
+    if not pages:
+        return None
+    entry = pages.get(key)
+    if entry is None:
+        return None
+    if entry[1] < time.monotonic():
+        pages.pop(key, None)
+        return None
+    _page_cache.move_to_end(user_id)
+    return entry[0]
+
+
+def _page_cache_set(user_id: int, key: tuple, page: AttendancePage) -> None:
+    pages = _page_cache.setdefault(user_id, OrderedDict())
+    _page_cache.move_to_end(user_id)
+    pages[key] = (page, time.monotonic() + _PAGE_CACHE_TTL)
+    while len(pages) > _PAGE_CACHE_MAX_PAGES_PER_USER:
+        pages.popitem(last=False)
+    while len(_page_cache) > _PAGE_CACHE_MAX_USERS:
+        _page_cache.popitem(last=False)
+
+
+def invalidate_history_pages(user_id: int) -> None:
+    _page_cache.pop(user_id, None)
+
+
+async def get_history_page(
+    user_id: int,
+    size: int = HISTORY_PAGE_SIZE,
+    direction: Literal["first", "older", "newer"] = "first",
+    cursor: tuple[int, int | None] | None = None,
+) -> AttendancePage:
+    """Return one rendered page of attendance history using a (ts, id) keyset cursor.
+
+    `older` pages start strictly before `cursor`, `newer` pages strictly after it;
+    a None id (buttons from before ids were added) compares on ts alone.
+    One extra row is fetched to tell whether another page exists in that
+    direction. Rendered pages are cached briefly per user.
+    """
+    size = max(1, min(int(size), HISTORY_PAGE_SIZE))
+    if direction == "first":
+        cursor = None
+    key = (direction, cursor, size)
+    cached = _page_cache_get(user_id, key)
+    if cached is not None:
+        return cached
 
-async def get_attendance_history(user_id: int, limit: int = 30) -> AttendanceHistoryResult:
     try:
-        res = await db.get_attendance(user_id, limit=limit)
+        rows = await db.get_attendance_page(
+            user_id,
+            limit=size + 1,
+            before=_db_cursor(cursor) if direction == "older" and cursor is not None else None,
+            after=_db_cursor(cursor) if direction == "newer" and cursor is not None else None,
+        )
     except Exception as e:
-        return AttendanceHistoryResult(
+        return AttendancePage(
             status="error",
             error_message=f"출석 기록 조회 중 오류가 발생했습니다: {e}",
         )
 
-    data = _extract_data(res)
-    if not data:
-        return AttendanceHistoryResult(status="empty", timestamps=[])
-
-    timestamps: list[str] = []
-    for row in data:
-        ts = row.get("ts") if isinstance(row, dict) else getattr(row, "ts", None)
-        if ts:
-            timestamps.append(ts)
-
-    if not timestamps:
-        return AttendanceHistoryResult(status="empty", timestamps=[])
-
-    return AttendanceHistoryResult(status="ok", timestamps=timestamps)
+    more = len(rows) > size
+    if more:
+        # the extra row sits on the far side of the page from the cursor
+        rows = rows[1:] if direction == "newer" else rows[:size]
+    if not rows:
+        page = AttendancePage(status="empty")
+        _page_cache_set(user_id, key, page)
+        return page
+
+    page = AttendancePage(
+        status="ok",
+        text="최근 출석 기록:\n" + "\n".join(f"- {utils.format_ts_kst(r.ts)}" for r in rows),
+        newest_cursor=(_cursor_from_ts(rows[0].ts), rows[0].id),
+        oldest_cursor=(_cursor_from_ts(rows[-1].ts), rows[-1].id),
+        has_newer=more if direction == "newer" else direction == "older",
+        has_older=more if direction != "newer" else True,
+    )
+    _page_cache_set(user_id, key, page)
+    return page
 
 
 async def get_streak(user_id: int) -> StreakResult:
     try:
-        s = await db.get_streak(user_id)
+        bitmap = await attendance_bitmap.get_bitmap(user_id)
     except Exception as e:
         return StreakResult(
             status="error",
             error_message=f"연속 출석 조회 중 오류가 발생했습니다: {e}",
         )
-    return StreakResult(status="ok", streak=s)
+    return StreakResult(status="ok", streak=bitmap.current_streak(), longest=bitmap.longest_streak())
+
+
+async def get_calendar(user_id: int, year: int, month: int) -> CalendarResult:
+    """Return the days of `year`-`month` (KST) the user attended, read from the bitmap."""
+    try:
+        bitmap = await attendance_bitmap.get_bitmap(user_id)
+    except Exception as e:
+        return CalendarResult(
+            status="error",
+            error_message=f"출석 달력 조회 중 오류가 발생했습니다: {e}",
+        )
+    first = datetime.date(year, month, 1)
+    nxt = datetime.date(year + (month == 12), month % 12 + 1, 1)
+    start = attendance_bitmap.epoch_day(first)
+    bits = bitmap.days_in_range(start, attendance_bitmap.epoch_day(nxt))
+    days = [i + 1 for i in range((nxt - first).days) if (bits >> i) & 1]
+    return CalendarResult(status="ok", year=year, month=month, days=days)
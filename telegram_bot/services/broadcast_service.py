@@ -0,0 +1,315 @@
+"""Admin broadcasts to every registered user (no Telegram dependencies).
+
+Recipients are streamed from `users` in id order with keyset pages, minus
+anyone in `blocked_users`, and handed to a small pool of workers sharing one
+token bucket (`BROADCAST_RATE` messages per second, below Telegram's global
+limit of about 30/s so regular replies still go out). A 429 pauses every
+worker for the requested time and the recipient is retried.
+
+Progress lives in the `broadcasts` row. Workers finish out of order, so
+`after_id` is a low watermark (every recipient up to it has been handled),
+written with the counters every `CHECKPOINT_SEC`; a broadcast interrupted by
+a restart resumes from there, re-sending at most the messages in flight.
+Recipients that cannot be reached are recorded in `blocked_users` and
+skipped by later broadcasts.
+"""
+from __future__ import annotations
+
+import asyncio
+import collections
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Literal, Optional
+
+from .. import db
+from ..resilience import TokenBucket, retry_async
+
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "8"))
+CHECKPOINT_SEC = float(os.getenv("BROADCAST_CHECKPOINT_SEC", "5"))
+# stays within PostgREST's default max-rows
+_PAGE_SIZE = 1000
+# 429s tolerated for one recipient before it counts as failed
+_MAX_SLOWDOWNS = 5
+
+RUNNING = "running"
+DONE = "done"
+CANCELLED = "cancelled"
+
+
+class SlowDown(Exception):
+    """Raised by a send callable when the API asks to wait (HTTP 429)."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class Unreachable(Exception):
+    """Raised by a send callable when the recipient blocked the bot or no longer exists."""
+
+
+@dataclass
+class Progress:
+    broadcast_id: int
+    # recipients when the run (re)started plus those handled before it; blocked users are included
+    total: int
+    sent: int = 0
+    blocked: int = 0
+    # already in `blocked_users`, not attempted
+    skipped: int = 0
+    failed: int = 0
+    status: Literal["running", "done", "cancelled"] = RUNNING
+    started: float = field(default_factory=time.monotonic)
+    # handled by this process; the rate ignores work done before a restart
+    handled: int = 0
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.blocked + self.skipped + self.failed
+
+    def rate(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.handled / elapsed if elapsed > 0 else 0.0
+
+    def eta(self) -> Optional[float]:
+        """Seconds left at the current rate, None until something was handled."""
+        rate = self.rate()
+        if rate <= 0:
+            return None
+        return max(self.total - self.done, 0) / rate
+
+
+@dataclass
+class StartResult:
+    status: Literal["ok", "busy", "error"]
+    row: Optional[dict] = None
+
+
+class _Pacer:
+    """Shared send pacing: a token bucket plus a pause for every worker after a 429."""
+
+    def __init__(self, rate: float):
+        self._bucket = TokenBucket(rate, capacity=max(1.0, rate / 5))
+        self._resume_at = 0.0
+
+    def pause(self, seconds: float) -> None:
+        self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+    async def acquire(self) -> None:
+        while True:
+            wait = self._resume_at - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            elif self._bucket.take(1):
+                return
+            else:
+                await asyncio.sleep(self._bucket.wait_time(1))
+
+
+_active: Optional[Progress] = None
+_cancel_requested = False
+
+
+def active() -> Optional[Progress]:
+    """Progress of the broadcast running in this process, if any."""
+    return _active
+
+
+async def pending() -> Optional[dict]:
+    """A broadcast left running by an earlier process (or a failed run), if any."""
+    return await db.get_running_broadcast()
+
+
+async def start(text: str, created_by: int) -> StartResult:
+    """Create a broadcast row; refused while another broadcast is running."""
+    try:
+        if _active is not None or await db.get_running_broadcast() is not None:
+            return StartResult("busy")
+        row = await db.create_broadcast(text, created_by)
+    except Exception as e:
+        logging.warning("creating broadcast failed: %s", e)
+        return StartResult("error")
+    return StartResult("ok", row) if row else StartResult("error")
+
+
+async def cancel() -> bool:
+    """Stop the running broadcast (or mark a stale running row cancelled). False if there is none."""
+    global _cancel_requested
+    if _active is not None:
+        _cancel_requested = True
+        return True
+    row = await db.get_running_broadcast()
+    if row is None:
+        return False
+    await db.update_broadcast(int(row["id"]), {"status": CANCELLED})
+    return True
+
+
+async def set_progress_message(broadcast_id: int, chat_id: int, message_id: int) -> None:
+    await db.update_broadcast(broadcast_id, {"progress_chat_id": chat_id, "progress_message_id": message_id})
+
+
+async def run(
+    row: dict,
+    send: Callable[[int], Awaitable[None]],
+    on_progress: Optional[Callable[[Progress], Awaitable[None]]] = None,
+    rate: float = BROADCAST_RATE,
+    workers: int = BROADCAST_WORKERS,
+) -> Progress:
+    """Deliver broadcast `row` from its checkpoint on; `send(user_id)` sends one message.
+
+    `send` raises `SlowDown` on a 429 and `Unreachable` for recipients to
+    record in `blocked_users`; any other exception counts as a failure.
+    `on_progress` is awaited after every checkpoint and once at the end.
+    If the run is cancelled (shutdown) the checkpoint is saved and the row
+    stays running, to be resumed by the next process.
+    """
+    global _active, _cancel_requested
+    if _active is not None:
+        raise RuntimeError("a broadcast is already running")
+    broadcast_id = int(row["id"])
+    after = int(row.get("after_id") or 0)
+    progress = Progress(
+        broadcast_id,
+        total=0,
+        sent=int(row.get("sent") or 0),
+        blocked=int(row.get("blocked") or 0),
+        skipped=int(row.get("skipped") or 0),
+        failed=int(row.get("failed") or 0),
+    )
+    _active = progress
+    _cancel_requested = False
+
+    pacer = _Pacer(rate)
+    queue: asyncio.Queue[Optional[int]] = asyncio.Queue(maxsize=workers * 4)
+    # ids in the order they were read, until the watermark passes them
+    order: collections.deque[int] = collections.deque()
+    finished: set[int] = set()
+    newly_blocked: list[dict] = []
+    watermark = after
+
+    def _finish(user_id: int) -> None:
+        nonlocal watermark
+        finished.add(user_id)
+        progress.handled += 1
+        while order and order[0] in finished:
+            watermark = order.popleft()
+            finished.discard(watermark)
+
+    async def _produce() -> None:
+        cursor = after
+        while not _cancel_requested:
+            ids = await retry_async(lambda: db.get_user_ids_after(cursor, limit=_PAGE_SIZE), base_delay=1.0, max_delay=10.0)
+            if not ids:
+                break
+            blocked = await retry_async(lambda: db.get_blocked_user_ids(ids), base_delay=1.0, max_delay=10.0)
+            for user_id in ids:
+                order.append(user_id)
+                if user_id in blocked:
+                    progress.skipped += 1
+                    _finish(user_id)
+                else:
+                    await queue.put(user_id)
+            cursor = ids[-1]
+            if len(ids) < _PAGE_SIZE:
+                break
+        for _ in range(workers):
+            await queue.put(None)
+
+    async def _deliver(user_id: int) -> None:
+        for _ in range(_MAX_SLOWDOWNS):
+            await pacer.acquire()
+            try:
+                await send(user_id)
+            except SlowDown as e:
+                pacer.pause(e.retry_after)
+                continue
+            except Unreachable as e:
+                progress.blocked += 1
+                newly_blocked.append({"user_id": user_id, "reason": str(e)[:200]})
+                return
+            except Exception as e:
+                logging.info("broadcast %d to %d failed: %s", broadcast_id, user_id, e)
+                progress.failed += 1
+                return
+            progress.sent += 1
+            return
+        progress.failed += 1
+
+    async def _work() -> None:
+        while True:
+            user_id = await queue.get()
+            if user_id is None:
+                return
+            if _cancel_requested:
+                # drain without sending; the watermark stays before these ids
+                continue
+            await _deliver(user_id)
+            _finish(user_id)
+
+    async def _checkpoint(status: str = RUNNING) -> None:
+        fields = {
+            "status": status,
+            "after_id": watermark,
+            "sent": progress.sent,
+            "blocked": progress.blocked,
+            "skipped": progress.skipped,
+            "failed": progress.failed,
+        }
+        try:
+            # blocked users first, so a resumed run skips them even if the second write fails
+            batch = newly_blocked[:]
+            await db.mark_users_blocked(batch)
+            del newly_blocked[:len(batch)]
+            await db.update_broadcast(broadcast_id, fields)
+        except Exception as e:
+            logging.warning("broadcast %d checkpoint failed: %s", broadcast_id, e)
+
+    async def _report() -> None:
+        if on_progress is None:
+            return
+        try:
+            await on_progress(progress)
+        except Exception as e:
+            logging.info("broadcast %d progress report failed: %s", broadcast_id, e)
+
+    async def _checkpoints() -> None:
+        while True:
+            await asyncio.sleep(CHECKPOINT_SEC)
+            await _checkpoint()
+            await _report()
+
+    tasks: list[asyncio.Task] = []
+    try:
+        progress.total = progress.done + await db.count_users_after(after)
+        producer = asyncio.create_task(_produce())
+        tasks = [producer, asyncio.create_task(_checkpoints())]
+        pool = [asyncio.create_task(_work()) for _ in range(workers)]
+        tasks += pool
+        await asyncio.gather(producer, *pool)
+        progress.status = CANCELLED if _cancel_requested else DONE
+        progress.total = progress.done if progress.status == DONE else progress.total
+        await _checkpoint(progress.status)
+        await _report()
+        logging.info(
+            "broadcast %d %s: %d sent, %d blocked, %d skipped, %d failed",
+            broadcast_id, progress.status, progress.sent, progress.blocked, progress.skipped, progress.failed,
+        )
+        return progress
+    except asyncio.CancelledError:
+        await _checkpoint()
+        raise
+    except Exception:
+        # the row stays running and is picked up again on the next start or `/broadcast resume`
+        await _checkpoint()
+        raise
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        _active = None
+        _cancel_requested = False
+
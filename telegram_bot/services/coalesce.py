@@ -0,0 +1,82 @@
+"""Per-chat response coalescing (no Telegram dependencies).
+
+When several people in one chat send the same idempotent read command within
+`COALESCE_WINDOW_SEC`, only the first request produces a reply; identical
+requests that arrive while it is running or shortly after are folded into it.
+The first of those is given that reply's message id to point at; the rest
+get nothing, so a burst costs at most two sends per window.
+Requests are identical when they share a key, which callers build from
+everything that determines the reply (command and normalized arguments).
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Hashable, Optional
+
+COALESCE_WINDOW_SEC = float(os.getenv("COALESCE_WINDOW_SEC", "10"))
+_MAX_ENTRIES = 10_000
+
+
+@dataclass
+class _Entry:
+    # resolves to the first reply's message id, None if it failed
+    done: asyncio.Future
+    expires: float
+    pointed: bool = False
+
+
+_entries: dict[tuple[int, Hashable], _Entry] = {}
+_coalesced = 0
+
+
+def _evict(now: float) -> None:
+    for k in [k for k, e in _entries.items() if e.expires <= now]:
+        del _entries[k]
+
+
+async def run_once(
+    chat_id: int,
+    key: Hashable,
+    produce: Callable[[], Awaitable[Optional[int]]],
+    window: float = COALESCE_WINDOW_SEC,
+) -> Optional[int]:
+    """Run `produce` unless an identical request in this chat is running or replied within `window`.
+
+    `produce` sends the reply and returns its message id, or None on failure.
+    Requests waiting on a running `produce` share its outcome, failure
+    included; a failed reply does not open a window, so requests arriving
+    after it run `produce` themselves. Returns the earlier reply's message id
+    for the first request coalesced into it (the caller may point at it
+    once), None otherwise.
+    """
+    global _coalesced
+    entry_key = (chat_id, key)
+    entry = _entries.get(entry_key)
+    if entry is not None and entry.expires > time.monotonic():
+        message_id = await asyncio.shield(entry.done)
+        _coalesced += 1
+        if message_id is None or entry.pointed:
+            return None
+        entry.pointed = True
+        return message_id
+
+    now = time.monotonic()
+    if len(_entries) >= _MAX_ENTRIES:
+        _evict(now)
+    entry = _Entry(asyncio.get_running_loop().create_future(), now + window)
+    _entries[entry_key] = entry
+    message_id = None
+    try:
+        message_id = await produce()
+    finally:
+        entry.done.set_result(message_id)
+        if message_id is None and _entries.get(entry_key) is entry:
+            del _entries[entry_key]
+    return None
+
+
+def stats() -> dict:
+    return {"windows": len(_entries), "coalesced": _coalesced}
@@ -0,0 +1,85 @@
+"""Duplicate update detection (no Telegram dependencies).
+
+Remembers the most recent `DEDUP_CAPACITY` update ids and (chat_id,
+message_id) pairs in fixed-size ring buffers, each paired with a hash set for
+O(1) membership. An update seen again (a redelivered webhook, or updates
+refetched after a restart before the offset was acknowledged) is reported as a
+duplicate before any handler runs. The recent keys are kept in the warm-start
+snapshot so the window survives a restart.
+"""
+from __future__ import annotations
+
+import os
+from typing import Any, Hashable, Optional
+
+DEDUP_CAPACITY = int(os.getenv("DEDUP_CAPACITY", "4096"))
+
+
+class RecentKeys:
+    """The last `capacity` distinct keys: a ring buffer for eviction order plus a set for lookups."""
+
+    __slots__ = ("capacity", "_ring", "_keys", "_pos")
+
+    def __init__(self, capacity: int = DEDUP_CAPACITY):
+        self.capacity = max(1, capacity)
+        self._ring: list[Optional[Hashable]] = [None] * self.capacity
+        self._keys: set = set()
+        self._pos = 0
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._keys
+
+    def add(self, key: Hashable) -> bool:
+        """Remember `key`. Returns False if it was already present."""
+        if key in self._keys:
+            return False
+        evicted = self._ring[self._pos]
+        if evicted is not None:
+            self._keys.discard(evicted)
+        self._ring[self._pos] = key
+        self._keys.add(key)
+        self._pos = (self._pos + 1) % self.capacity
+        return True
+
+    def items(self) -> list:
+        """Keys oldest first."""
+        ring = self._ring[self._pos:] + self._ring[:self._pos]
+        return [k for k in ring if k is not None]
+
+
+_update_ids = RecentKeys()
+_messages = RecentKeys()
+_dropped = 0
+
+
+def is_duplicate(update_id: int, chat_id: Optional[int] = None, message_id: Optional[int] = None) -> bool:
+    """True if this update (or the message it carries) was already seen; otherwise record it."""
+    global _dropped
+    message_key = (chat_id, message_id) if chat_id is not None and message_id is not None else None
+    if update_id in _update_ids or (message_key is not None and message_key in _messages):
+        _dropped += 1
+        return True
+    _update_ids.add(update_id)
+    if message_key is not None:
+        _messages.add(message_key)
+    return False
+
+
+def stats() -> dict:
+    return {"update_ids": len(_update_ids), "messages": len(_messages), "dropped": _dropped}
+
+
+def export_state() -> dict:
+    return {"update_ids": _update_ids.items(), "messages": [list(k) for k in _messages.items()]}
+
+
+def import_state(data: dict[str, Any]) -> int:
+    """Restore keys from `export_state`. Returns the number of update ids restored."""
+    for uid in data.get("update_ids", []):
+        _update_ids.add(int(uid))
+    for chat_id, message_id in data.get("messages", []):
+        _messages.add((int(chat_id), int(message_id)))
+    return len(data.get("update_ids", []))
@@ -0,0 +1,69 @@
+"""In-process async event bus (no Telegram dependencies).
+
+Publishers call `publish()`, which never awaits: events are put on each
+subscriber's bounded queue and dropped when a queue is full, so hot paths
+such as the XP flush loop cannot be slowed down by slow consumers.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class LevelUp:
+    user_id: int
+    chat_id: Optional[int]
+    old_level: int
+    new_level: int
+    username: Optional[str] = None
+
+
+_subscribers: dict[type, list[asyncio.Queue]] = {}
+
+
+def subscribe(event_type: type, maxsize: int = 1000) -> asyncio.Queue:
+    """Register a new bounded queue receiving every published `event_type`."""
+    queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+    _subscribers.setdefault(event_type, []).append(queue)
+    return queue
+
+
+def unsubscribe(event_type: type, queue: asyncio.Queue) -> None:
+    queues = _subscribers.get(event_type)
+    if queues and queue in queues:
+        queues.remove(queue)
+
+
+def publish(event: object) -> int:
+    """Deliver `event` to all subscribers of its type without blocking.
+
+    Returns the number of queues that accepted the event.
+    """
+    delivered = 0
+    for queue in _subscribers.get(type(event), ()):
+        try:
+            queue.put_nowait(event)
+            delivered += 1
+        except asyncio.QueueFull:
+            logging.warning("event bus queue full; dropping %s", type(event).__name__)
+    return delivered
+
+
+async def next_batch(queue: asyncio.Queue, window: float, max_items: int = 100) -> list:
+    """Wait for one event, then collect whatever else arrives within `window` seconds."""
+    first = await queue.get()
+    batch = [first]
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + window
+    while len(batch) < max_items:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(await asyncio.wait_for(queue.get(), timeout=remaining))
+        except asyncio.TimeoutError:
+            break
+    return batch
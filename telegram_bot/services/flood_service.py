@@ -0,0 +1,76 @@
+"""Flood control: per-user and per-chat token buckets (no Telegram dependencies).
+
+Every update is charged a cost (see `CommandSpec.cost`) against both the
+sender's bucket and the chat's bucket before any handler runs. Over-limit
+updates are dropped; the sender gets at most one notice per
+`NOTICE_INTERVAL_SEC`. Idle buckets are evicted so memory stays bounded.
+"""
+from __future__ import annotations
+
+import os
+import time
+from dataclasses import dataclass
+from typing import Literal, Optional
+
+from ..resilience import TokenBucket
+
+USER_RATE = float(os.getenv("FLOOD_USER_RATE", "0.5"))  # tokens per second
+USER_BURST = float(os.getenv("FLOOD_USER_BURST", "8"))
+CHAT_RATE = float(os.getenv("FLOOD_CHAT_RATE", "2"))
+CHAT_BURST = float(os.getenv("FLOOD_CHAT_BURST", "20"))
+NOTICE_INTERVAL_SEC = 30.0
+BUCKET_IDLE_SEC = 600.0
+_MAX_BUCKETS = 50_000
+
+_user_buckets: dict[int, TokenBucket] = {}
+_chat_buckets: dict[int, TokenBucket] = {}
+_last_notice: dict[int, float] = {}
+
+
+@dataclass
+class FloodDecision:
+    status: Literal["allowed", "dropped", "notify"]
+    retry_after: float = 0.0
+
+
+def _bucket(buckets: dict[int, TokenBucket], key: int, rate: float, burst: float) -> TokenBucket:
+    b = buckets.get(key)
+    if b is None:
+        if len(buckets) >= _MAX_BUCKETS:
+            evict_idle()
+        b = buckets[key] = TokenBucket(rate, burst)
+    return b
+
+
+def check(user_id: int, chat_id: Optional[int], cost: float) -> FloodDecision:
+    """Charge `cost` to the user's and chat's buckets, or refuse without charging either."""
+    now = time.monotonic()
+    user_b = _bucket(_user_buckets, user_id, USER_RATE, USER_BURST)
+    chat_b = _bucket(_chat_buckets, chat_id, CHAT_RATE, CHAT_BURST) if chat_id is not None and chat_id != user_id else None
+
+    limited = user_b.available(now) < cost or (chat_b is not None and chat_b.available(now) < cost)
+    if not limited:
+        user_b.take(cost, now)
+        if chat_b is not None:
+            chat_b.take(cost, now)
+        return FloodDecision(status="allowed")
+
+    retry_after = max(user_b.wait_time(cost), chat_b.wait_time(cost) if chat_b is not None else 0.0)
+    if now - _last_notice.get(user_id, float("-inf")) >= NOTICE_INTERVAL_SEC:
+        _last_notice[user_id] = now
+        return FloodDecision(status="notify", retry_after=retry_after)
+    return FloodDecision(status="dropped", retry_after=retry_after)
+
+
+def evict_idle(idle_seconds: float = BUCKET_IDLE_SEC) -> int:
+    """Drop buckets untouched for `idle_seconds` (they would be full anyway)."""
+    cutoff = time.monotonic() - idle_seconds
+    evicted = 0
+    for buckets in (_user_buckets, _chat_buckets):
+        stale = [k for k, b in buckets.items() if b.updated < cutoff]
+        for k in stale:
+            del buckets[k]
+        evicted += len(stale)
+    for uid in [u for u, t in _last_notice.items() if t < cutoff]:
+        del _last_notice[uid]
+    return evicted
@@ -1,34 +1,268 @@
-"""Leaderboard business logic (no Telegram dependencies)."""
+"""Leaderboard business logic (no Telegram dependencies).
+
+Global rankings come straight from `users.xp`. Per-chat rankings are served
+from in-memory ordered indexes, one per chat, loaded lazily from `chat_xp` on
+first use and evicted once the chat goes idle, so memory follows the number of
+active chats rather than the number of chats the bot has ever seen.
+
+Both are served one page at a time with keyset cursors on (xp desc, user id),
+and rendered pages are cached per board version. Global pages show each
+user's rank change since the daily snapshot (see `rank_history`).
+"""
 from __future__ import annotations
 
+import asyncio
+import bisect
+import time
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Any, Literal
+from typing import Literal, Optional
+
+from .. import db, utils
+from ..models import LeaderboardEntry
+from . import membership, rank_history
 
-from .. import db
+
+# evict a chat's index after this many seconds without reads or writes
+CHAT_INDEX_IDLE_SEC = 900.0
+# rows per leaderboard page (`/leaderboard n` may ask for fewer)
+LEADERBOARD_PAGE_SIZE = 10
+# rendered pages are keyed by board version; the TTL only covers changes made
+# outside the bot (e.g. maintenance imports)
+RENDER_CACHE_TTL = 60.0
+_RENDER_CACHE_MAX = 256
 
 
 @dataclass
-class LeaderboardResult:
+class LeaderboardPage:
     status: Literal["ok", "empty", "error"]
     error_message: str | None = None
-    rows: list[dict] | None = None
+    text: str | None = None
+    first_rank: int = 1
+    # (xp, user_id) of the first and last rows, used as keyset cursors
+    first_cursor: tuple[int, int] | None = None
+    last_cursor: tuple[int, int] | None = None
+    has_prev: bool = False
+    has_next: bool = False
+
+
+class _ChatIndex:
+    """Ordered (xp desc, user_id asc) index for a single chat."""
+
+    __slots__ = ("keys", "xp_by_user", "last_used", "version")
+
+    def __init__(self, pairs: list[tuple[int, int]]):
+        self.xp_by_user: dict[int, int] = {uid: xp for uid, xp in pairs}
+        self.keys: list[tuple[int, int]] = sorted((-xp, uid) for uid, xp in self.xp_by_user.items())
+        self.last_used = time.monotonic()
+        self.version = 0
+
+    def set_xp(self, user_id: int, xp: int) -> None:
+        old = self.xp_by_user.get(user_id)
+        if old == xp:
+            return
+        if old is not None:
+            i = bisect.bisect_left(self.keys, (-old, user_id))
+            if i < len(self.keys) and self.keys[i] == (-old, user_id):
+                self.keys.pop(i)
+        self.xp_by_user[user_id] = xp
+        bisect.insort(self.keys, (-xp, user_id))
+        self.last_used = time.monotonic()
+        self.version += 1
+
+    def top(self, limit: int, offset: int = 0) -> list[tuple[int, int]]:
+        self.last_used = time.monotonic()
+        return [(uid, -neg) for neg, uid in self.keys[offset:offset + limit]]
+
+
+_chat_indexes: dict[int, _ChatIndex] = {}
+_load_locks: dict[int, asyncio.Lock] = {}
+
+# bumped whenever a user's global XP changes; part of the render cache key
+_global_version = 0
+_render_cache: "OrderedDict[tuple, tuple[LeaderboardPage, float]]" = OrderedDict()
+
+
+async def _get_chat_index(chat_id: int) -> _ChatIndex:
+    idx = _chat_indexes.get(chat_id)
+    if idx is not None:
+        return idx
+    lock = _load_locks.setdefault(chat_id, asyncio.Lock())
+    async with lock:
+        idx = _chat_indexes.get(chat_id)
+        if idx is None:
+            pairs = await db.get_chat_xp_rows(chat_id)
+            idx = _ChatIndex(pairs)
+            _chat_indexes[chat_id] = idx
+    _load_locks.pop(chat_id, None)
+    return idx
+
+
+def apply_chat_xp(chat_id: int, user_id: int, xp: int) -> None:
+    """Record a user's new absolute chat XP in the chat's index, if loaded.
+
+    Unloaded chats are left alone: the row is already in `chat_xp` and will be
+    picked up when the index is next loaded.
+    """
+    idx = _chat_indexes.get(chat_id)
+    if idx is not None:
+        idx.set_xp(user_id, xp)
+
 
+def evict_idle_chat_indexes(idle_seconds: float = CHAT_INDEX_IDLE_SEC) -> int:
+    """Drop indexes for chats idle longer than `idle_seconds`. Returns the count evicted."""
+    cutoff = time.monotonic() - idle_seconds
+    stale = [cid for cid, idx in _chat_indexes.items() if idx.last_used < cutoff]
+    for cid in stale:
+        _chat_indexes.pop(cid, None)
+    return len(stale)
 
-def _extract_data(res: Any) -> Any:
-    return res.get("data") if isinstance(res, dict) else getattr(res, "data", None)
 
+def note_global_xp_change() -> None:
+    """Bump the global leaderboard version (call when a user's XP actually changed)."""
+    global _global_version
+    _global_version += 1
 
-async def get_leaderboard(limit: int = 10) -> LeaderboardResult:
+
+def _render_cache_get(key: tuple) -> Optional[LeaderboardPage]:
+    entry = _render_cache.get(key)
+    if entry is None:
+        return None
+    page, expires = entry
+    if expires < time.monotonic():
+        _render_cache.pop(key, None)
+        return None
+    _render_cache.move_to_end(key)
+    return page
+
+
+def _render_cache_set(key: tuple, page: LeaderboardPage) -> None:
+    _render_cache[key] = (page, time.monotonic() + RENDER_CACHE_TTL)
+    _render_cache.move_to_end(key)
+    while len(_render_cache) > _RENDER_CACHE_MAX:
+        _render_cache.popitem(last=False)
+
+
+def _build_page(
+    rows: list[LeaderboardEntry], start: int, has_prev: bool, has_next: bool, with_deltas: bool = False
+) -> LeaderboardPage:
+    if not rows:
+        return LeaderboardPage(status="empty")
+    deltas = rank_history.deltas((r.id, rank) for rank, r in enumerate(rows, start=start)) if with_deltas else None
+    return LeaderboardPage(
+        status="ok",
+        text=utils.format_leaderboard(rows, start=start, deltas=deltas),
+        first_rank=start,
+        first_cursor=(rows[0].xp, rows[0].id),
+        last_cursor=(rows[-1].xp, rows[-1].id),
+        has_prev=has_prev,
+        has_next=has_next,
+    )
+
+
+async def _global_page(size: int, direction: str, cursor: Optional[tuple[int, int]], rank: int) -> LeaderboardPage:
+    if direction == "prev" and cursor is not None:
+        rows = await db.get_leaderboard_page(cursor, "prev", size)
+        start = max(1, rank - len(rows))
+        return _build_page(rows, start, has_prev=start > 1, has_next=True, with_deltas=True)
+    rows = await db.get_leaderboard_page(cursor if direction == "next" else None, "next", size + 1)
+    start = rank + 1 if direction == "next" and cursor is not None else 1
+    return _build_page(rows[:size], start, has_prev=start > 1, has_next=len(rows) > size, with_deltas=True)
+
+
+async def _chat_page(
+    idx: _ChatIndex, size: int, direction: str, cursor: Optional[tuple[int, int]]
+) -> LeaderboardPage:
+    if cursor is None or direction == "first":
+        i = 0
+    elif direction == "prev":
+        i = max(0, bisect.bisect_left(idx.keys, (-cursor[0], cursor[1])) - size)
+    else:
+        i = bisect.bisect_right(idx.keys, (-cursor[0], cursor[1]))
+    top = idx.top(size, offset=i)
+    names = await db.get_usernames([uid for uid, _ in top]) if top else {}
+    rows = [
+        LeaderboardEntry(id=uid, username=names.get(uid), xp=xp, level=db.calc_level_from_xp(xp))
+        for uid, xp in top
+    ]
+    # in-memory index: ranks are exact
+    return _build_page(rows, i + 1, has_prev=i > 0, has_next=i + size < len(idx.keys))
+
+
+async def get_leaderboard_page(
+    chat_id: Optional[int] = None,
+    size: int = LEADERBOARD_PAGE_SIZE,
+    direction: Literal["first", "next", "prev"] = "first",
+    cursor: Optional[tuple[int, int]] = None,
+    rank: int = 0,
+) -> LeaderboardPage:
+    """Return one rendered page of the global (`chat_id=None`) or per-chat leaderboard.
+
+    Pages are keyset-based on (xp desc, user id): `cursor` is the (xp, id) of
+    the last row shown for "next" or the first row shown for "prev", and
+    `rank` is that row's rank. Rendered pages are cached under the board's
+    version, which only changes when some user's XP changes (or, for the
+    global board, when a new daily snapshot is loaded).
+    """
+    size = max(1, min(int(size), LEADERBOARD_PAGE_SIZE))
     try:
-        res = await db.get_leaderboard(limit=limit)
+        if chat_id is None:
+            key = ("g", _global_version, rank_history.snapshot_day(), direction, cursor, rank, size)
+            page = _render_cache_get(key)
+            if page is None:
+                page = await _global_page(size, direction, cursor, rank)
+                _render_cache_set(key, page)
+        else:
+            idx = await _get_chat_index(chat_id)
+            key = ("c", chat_id, idx.version, direction, cursor, size)
+            page = _render_cache_get(key)
+            if page is None:
+                page = await _chat_page(idx, size, direction, cursor)
+                _render_cache_set(key, page)
+            idx.last_used = time.monotonic()
     except Exception as e:
-        return LeaderboardResult(
+        return LeaderboardPage(
             status="error",
             error_message=f"리더보드 조회 중 오류가 발생했습니다: {e}",
         )
+    return page
 
-    data = _extract_data(res)
-    if not data:
-        return LeaderboardResult(status="empty", rows=[])
 
-    return LeaderboardResult(status="ok", rows=list(data))
+@dataclass
+class RankResult:
+    status: Literal["ok", "not_found", "error"]
+    error_message: str | None = None
+    rank: int = 0
+    xp: int = 0
+    level: int = 1
+    next_xp: int = 0
+    # rank in the latest daily snapshot (None if not ranked in it)
+    previous_rank: int | None = None
+    # False when the snapshot cannot tell (not loaded, or truncated above this rank)
+    delta_known: bool = False
+    delta: int | None = None
+    snapshot_day: str | None = None
+
+
+async def get_user_rank(user_id: int) -> RankResult:
+    """The user's current global rank and its change since the daily snapshot."""
+    if not membership.is_registered(user_id):
+        return RankResult(status="not_found")
+    try:
+        row = await db.get_xp_info(user_id)
+        rank = await db.count_users_ahead(row.xp, user_id) + 1
+    except Exception as e:
+        return RankResult(status="error", error_message=f"순위 조회 중 오류가 발생했습니다: {e}")
+    day = rank_history.snapshot_day()
+    known, delta = rank_history.rank_delta(user_id, rank)
+    return RankResult(
+        status="ok",
+        rank=rank,
+        xp=row.xp,
+        level=row.level,
+        next_xp=row.next_xp,
+        previous_rank=rank_history.previous_rank(user_id),
+        delta_known=known,
+        delta=delta,
+        snapshot_day=day.isoformat() if day else None,
+    )
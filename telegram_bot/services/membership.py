@@ -0,0 +1,73 @@
+"""Registered-user membership index (no Telegram dependencies).
+
+Keeps every registered user id in one sorted `array('q')` (8 bytes per user)
+so the message path can tell registered from unregistered senders with a
+binary search and no DB call. Loaded once at startup by streaming `users`
+ids in keyset pages; `/register` adds to it.
+"""
+from __future__ import annotations
+
+import asyncio
+import bisect
+import logging
+from array import array
+
+from .. import db
+
+# stays within PostgREST's default max-rows so a short page really means the end
+_LOAD_PAGE_SIZE = 1000
+
+_ids = array("q")
+_loaded = False
+
+
+def is_loaded() -> bool:
+    return _loaded
+
+
+def is_registered(user_id: int) -> bool:
+    """True if `user_id` is registered. Before the index has loaded every user counts as registered."""
+    if not _loaded:
+        return True
+    i = bisect.bisect_left(_ids, user_id)
+    return i < len(_ids) and _ids[i] == user_id
+
+
+def add(user_id: int) -> None:
+    i = bisect.bisect_left(_ids, user_id)
+    if i == len(_ids) or _ids[i] != user_id:
+        _ids.insert(i, user_id)
+
+
+def size() -> int:
+    return len(_ids)
+
+
+async def load(page_size: int = _LOAD_PAGE_SIZE) -> int:
+    """Build the index from `users` and switch lookups over to it. Returns the user count."""
+    global _ids, _loaded
+    ids = array("q")
+    after = -(2 ** 63)
+    while True:
+        page = await db.get_user_ids_after(after, limit=page_size)
+        ids.extend(page)
+        if len(page) < page_size:
+            break
+        after = page[-1]
+    # ids registered while the load was running
+    merged = sorted(set(ids).union(_ids)) if _ids else ids
+    _ids = merged if isinstance(merged, array) else array("q", merged)
+    _loaded = True
+    logging.info("Membership index loaded: %d registered users", len(_ids))
+    return len(_ids)
+
+
+async def load_until_ready(retry_sec: float = 30.0) -> None:
+    """Run `load`, retrying until it succeeds (startup task)."""
+    while True:
+        try:
+            await load()
+            return
+        except Exception as e:
+            logging.warning("Membership index load failed, retrying in %.0fs: %s", retry_sec, e)
+            await asyncio.sleep(retry_sec)
@@ -0,0 +1,152 @@
+"""Daily leaderboard snapshots and rank deltas (no Telegram dependencies).
+
+Just after each KST midnight the global ranking (top `SNAPSHOT_MAX_USERS`) is
+stored in `leaderboard_snapshots` as one compact blob: an int64 array of
+interleaved (user_id, xp) pairs in rank order, zlib-compressed and base64
+encoded. The newest snapshot is kept in memory as `user_id -> rank`, so the
+delta for any row is a dict lookup rather than a DB query. Snapshots older
+than `RETENTION_DAYS` are deleted after each new one.
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import datetime
+import logging
+import os
+import zlib
+from array import array
+from typing import Iterable, Optional
+
+from .. import db, utils
+
+SNAPSHOT_MAX_USERS = int(os.getenv("LEADERBOARD_SNAPSHOT_MAX_USERS", "10000"))
+RETENTION_DAYS = int(os.getenv("LEADERBOARD_SNAPSHOT_RETENTION_DAYS", "14"))
+# stays within PostgREST's default max-rows
+_PAGE_SIZE = 1000
+_LOAD_RETRY_SEC = 300.0
+
+_day: Optional[datetime.date] = None
+_ranks: dict[int, int] = {}
+# the snapshot holds every user, so anyone missing from it is new
+_complete = False
+
+
+def _today() -> datetime.date:
+    return datetime.datetime.now(utils.KST).date()
+
+
+def encode(pairs: array) -> str:
+    return base64.b64encode(zlib.compress(pairs.tobytes(), 6)).decode("ascii")
+
+
+def decode(data: str) -> array:
+    pairs = array("q")
+    pairs.frombytes(zlib.decompress(base64.b64decode(data)))
+    return pairs
+
+
+def snapshot_day() -> Optional[datetime.date]:
+    """Day of the snapshot deltas are computed against (None until one is loaded)."""
+    return _day
+
+
+def _install(day: datetime.date, pairs: array, complete: bool) -> None:
+    global _day, _ranks, _complete
+    _ranks = {pairs[i]: i // 2 + 1 for i in range(0, len(pairs), 2)}
+    _complete = complete
+    _day = day
+
+
+def previous_rank(user_id: int) -> Optional[int]:
+    return _ranks.get(user_id)
+
+
+def rank_delta(user_id: int, rank: int) -> tuple[bool, Optional[int]]:
+    """(known, delta) for one user, with `deltas`' rules.
+
+    `known` is False when there is no snapshot or the user is below a
+    truncated one; otherwise `delta` is as in `deltas` (None: new).
+    """
+    found = deltas([(user_id, rank)])
+    return user_id in found, found.get(user_id)
+
+
+def deltas(ranked: Iterable[tuple[int, int]]) -> dict[int, Optional[int]]:
+    """Rank deltas for (user_id, current rank) pairs.
+
+    Users missing from the snapshot map to None when they are new to the
+    ranked range; users below a truncated snapshot are left out. Empty until a
+    snapshot is loaded.
+    """
+    if _day is None:
+        return {}
+    out: dict[int, Optional[int]] = {}
+    for user_id, rank in ranked:
+        prev = _ranks.get(user_id)
+        if prev is not None:
+            out[user_id] = prev - rank
+        elif _complete or rank <= len(_ranks):
+            out[user_id] = None
+    return out
+
+
+async def take_snapshot(day: Optional[datetime.date] = None) -> int:
+    """Store the current ranking as `day`'s snapshot, prune old ones. Returns users stored."""
+    day = day or _today()
+    pairs = array("q")
+    cursor = None
+    complete = True
+    while True:
+        remaining = SNAPSHOT_MAX_USERS - len(pairs) // 2
+        if remaining <= 0:
+            complete = False
+            break
+        limit = min(_PAGE_SIZE, remaining)
+        chunk = await db.get_ranking_chunk(cursor, limit)
+        for user_id, xp in chunk:
+            pairs.extend((user_id, xp))
+        if len(chunk) < limit:
+            break
+        cursor = (chunk[-1][1], chunk[-1][0])
+    users = len(pairs) // 2
+    await db.upsert_leaderboard_snapshot(day.isoformat(), users, complete, encode(pairs))
+    _install(day, pairs, complete)
+    await db.delete_leaderboard_snapshots_before((day - datetime.timedelta(days=RETENTION_DAYS)).isoformat())
+    logging.info("Leaderboard snapshot for %s stored: %d users", day, users)
+    return users
+
+
+async def load_latest() -> Optional[datetime.date]:
+    """Load the newest stored snapshot into memory. Returns its day."""
+    row = await db.get_latest_leaderboard_snapshot()
+    if row is None:
+        return None
+    day = datetime.date.fromisoformat(str(row["day"])[:10])
+    _install(day, decode(row["data"]), bool(row.get("complete", True)))
+    return day
+
+
+async def run_daily_snapshots() -> None:
+    """Load the latest snapshot (taking today's if it is missing), then snapshot after each KST midnight."""
+    while True:
+        try:
+            day = await load_latest()
+            if day is None or day < _today():
+                await take_snapshot()
+            break
+        except Exception as e:
+            logging.warning("Leaderboard snapshot load failed, retrying in %.0fs: %s", _LOAD_RETRY_SEC, e)
+            await asyncio.sleep(_LOAD_RETRY_SEC)
+
+    while True:
+        await asyncio.sleep(utils.seconds_until_next_kst_midnight() + 2)
+        # imported here: xp_service imports leaderboard_service, which imports this module
+        from . import xp_service
+
+        try:
+            # include XP earned right up to midnight
+            await xp_service.flush_pending()
+            await take_snapshot()
+        except Exception as e:
+            logging.warning("Daily leaderboard snapshot failed: %s", e)
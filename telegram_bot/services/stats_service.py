@@ -0,0 +1,276 @@
+"""Streaming chat activity counters (no Telegram dependencies).
+
+Per chat and KST day the bot keeps, in memory:
+- message and attendance counts,
+- a HyperLogLog sketch (p=10, 1 KiB) estimating distinct active users,
+- a Space-Saving sketch of the top talkers.
+
+The message and attendance paths only bump these counters. A background loop
+flushes changed days to `chat_daily_stats` in one batched upsert, merging in
+the stored row the first time a day is flushed by this process (so restarts
+do not reset a day). `/stats` and the end-of-day digest read only these
+counters or that table, never the raw message/attendance history.
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import datetime
+import hashlib
+import math
+from dataclasses import dataclass, field
+from typing import Literal, Optional
+
+from .. import db
+from ..utils import KST
+
+HLL_P = 10
+TOP_K = 20
+# days older than this many days ago are dropped from memory after a flush
+MEMORY_DAYS = 2
+
+
+class HyperLogLog:
+    __slots__ = ("registers",)
+
+    def __init__(self, registers: Optional[bytearray] = None):
+        self.registers = registers if registers is not None else bytearray(1 << HLL_P)
+
+    @staticmethod
+    def _hash(value: int) -> int:
+        return int.from_bytes(hashlib.blake2b(value.to_bytes(8, "little", signed=True), digest_size=8).digest(), "big")
+
+    def add(self, value: int) -> None:
+        h = self._hash(value)
+        idx = h >> (64 - HLL_P)
+        rest = h & ((1 << (64 - HLL_P)) - 1)
+        rank = (64 - HLL_P) - rest.bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def merge(self, other: "HyperLogLog") -> None:
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+    def count(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # small-range correction (linear counting)
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def encode(self) -> str:
+        return base64.b64encode(bytes(self.registers)).decode("ascii")
+
+    @classmethod
+    def decode(cls, data: str) -> "HyperLogLog":
+        raw = bytearray(base64.b64decode(data))
+        return cls(raw if len(raw) == 1 << HLL_P else None)
+
+
+class SpaceSaving:
+    """Top-k heavy hitters in O(k) memory; counts may overestimate by at most `error`."""
+
+    __slots__ = ("k", "counts")
+
+    def __init__(self, k: int = TOP_K):
+        self.k = k
+        # item -> [count, error]
+        self.counts: dict[int, list[int]] = {}
+
+    def add(self, item: int, n: int = 1, error: int = 0) -> None:
+        entry = self.counts.get(item)
+        if entry is not None:
+            entry[0] += n
+            entry[1] += error
+            return
+        if len(self.counts) < self.k:
+            self.counts[item] = [n, error]
+            return
+        victim = min(self.counts, key=lambda i: self.counts[i][0])
+        floor = self.counts.pop(victim)[0]
+        self.counts[item] = [floor + n, floor + error]
+
+    def top(self, n: int) -> list[tuple[int, int]]:
+        return sorted(((i, c[0]) for i, c in self.counts.items()), key=lambda t: -t[1])[:n]
+
+    def merge(self, other: "SpaceSaving") -> None:
+        for item, (count, error) in other.counts.items():
+            self.add(item, count, error)
+
+    def to_list(self) -> list[list[int]]:
+        return [[i, c, e] for i, (c, e) in self.counts.items()]
+
+    @classmethod
+    def from_list(cls, rows: list) -> "SpaceSaving":
+        ss = cls()
+        for item, count, error in rows or []:
+            ss.counts[int(item)] = [int(count), int(error)]
+        return ss
+
+
+@dataclass
+class DayStats:
+    messages: int = 0
+    attendances: int = 0
+    users: HyperLogLog = field(default_factory=HyperLogLog)
+    talkers: SpaceSaving = field(default_factory=SpaceSaving)
+    # stored row already merged in (set by the first flush or read)
+    loaded: bool = False
+    dirty: bool = False
+
+    def merge_record(self, r: dict) -> None:
+        self.messages += int(r.get("messages") or 0)
+        self.attendances += int(r.get("attendances") or 0)
+        if r.get("hll"):
+            self.users.merge(HyperLogLog.decode(r["hll"]))
+        self.talkers.merge(SpaceSaving.from_list(r.get("top") or []))
+        self.loaded = True
+
+    def to_record(self, chat_id: int, day: datetime.date) -> dict:
+        return {
+            "chat_id": chat_id,
+            "day": day.isoformat(),
+            "messages": self.messages,
+            "attendances": self.attendances,
+            "hll": self.users.encode(),
+            "top": self.talkers.to_list(),
+        }
+
+
+@dataclass
+class StatsResult:
+    status: Literal["ok", "empty", "future", "error"]
+    error_message: str | None = None
+    day: datetime.date | None = None
+    messages: int = 0
+    active_users: int = 0
+    attendances: int = 0
+    # (user_id, username, messages)
+    top: list[tuple[int, Optional[str], int]] = field(default_factory=list)
+
+
+_days: dict[tuple[int, datetime.date], DayStats] = {}
+_flush_lock = asyncio.Lock()
+
+
+def today_kst() -> datetime.date:
+    return datetime.datetime.now(KST).date()
+
+
+def _get(chat_id: int, day: Optional[datetime.date] = None) -> DayStats:
+    key = (chat_id, day or today_kst())
+    stats = _days.get(key)
+    if stats is None:
+        stats = _days[key] = DayStats()
+    return stats
+
+
+def record_message(chat_id: int, user_id: int) -> None:
+    stats = _get(chat_id)
+    stats.messages += 1
+    stats.users.add(user_id)
+    stats.talkers.add(user_id)
+    stats.dirty = True
+
+
+def record_attendance(chat_id: int, user_id: int) -> None:
+    stats = _get(chat_id)
+    stats.attendances += 1
+    stats.users.add(user_id)
+    stats.dirty = True
+
+
+async def _load_missing(keys: list[tuple[int, datetime.date]]) -> None:
+    """Merge stored rows into in-memory days that have not been loaded yet."""
+    missing = [k for k in keys if not _days[k].loaded]
+    if not missing:
+        return
+    rows = await db.get_chat_daily_stats(
+        sorted({cid for cid, _ in missing}), sorted({d.isoformat() for _, d in missing})
+    )
+    by_key = {(int(r["chat_id"]), datetime.date.fromisoformat(str(r["day"])[:10])): r for r in rows}
+    for key in missing:
+        r = by_key.get(key)
+        if r is not None:
+            _days[key].merge_record(r)
+        else:
+            _days[key].loaded = True
+
+
+async def flush() -> int:
+    """Upsert every changed day in one batch. Returns the number of rows written."""
+    async with _flush_lock:
+        keys = [k for k, s in _days.items() if s.dirty]
+        if keys:
+            await _load_missing(keys)
+            records = [_days[k].to_record(*k) for k in keys]
+            for k in keys:
+                _days[k].dirty = False
+            try:
+                await db.upsert_chat_daily_stats(records)
+            except Exception:
+                for k in keys:
+                    _days[k].dirty = True
+                raise
+        cutoff = today_kst() - datetime.timedelta(days=MEMORY_DAYS)
+        for k in [k for k, s in _days.items() if k[1] < cutoff and not s.dirty]:
+            del _days[k]
+        return len(keys)
+
+
+async def start_background_flush(interval_seconds: float = 30.0):
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await flush()
+        except Exception as e:
+            print(f"[ERROR] stats flush: {type(e).__name__}: {e}")
+
+
+def active_chats(day: datetime.date) -> list[int]:
+    """Chats with in-memory counters for `day`."""
+    return [cid for cid, d in _days if d == day]
+
+
+async def _read_stored(chat_id: int, day: datetime.date) -> DayStats:
+    """The stored counters for an older day, without keeping them in memory."""
+    stats = DayStats()
+    rows = await db.get_chat_daily_stats([chat_id], [day.isoformat()])
+    if rows:
+        stats.merge_record(rows[0])
+    return stats
+
+
+async def get_stats(chat_id: int, day: Optional[datetime.date] = None, top_n: int = 5) -> StatsResult:
+    today = today_kst()
+    day = day or today
+    if day > today:
+        return StatsResult(status="future", day=day)
+    key = (chat_id, day)
+    try:
+        if key in _days or day >= today - datetime.timedelta(days=MEMORY_DAYS):
+            # recent days stay in memory until `flush` ages them out
+            _get(chat_id, day)
+            await _load_missing([key])
+            stats = _days[key]
+        else:
+            # any older date can be asked for; do not let requests grow `_days`
+            stats = await _read_stored(chat_id, day)
+        top = stats.talkers.top(top_n)
+        names = await db.get_usernames([uid for uid, _ in top]) if top else {}
+    except Exception as e:
+        return StatsResult(status="error", error_message=f"통계 조회 중 오류가 발생했습니다: {e}")
+
+    if not stats.messages and not stats.attendances:
+        return StatsResult(status="empty", day=day)
+    return StatsResult(
+        status="ok",
+        day=day,
+        messages=stats.messages,
+        active_users=stats.users.count(),
+        attendances=stats.attendances,
+        top=[(uid, names.get(uid), n) for uid, n in top],
+    )
@@ -1,10 +1,12 @@
 """User/profile business logic (no Telegram dependencies)."""
 from __future__ import annotations
 
+import datetime
 from dataclasses import dataclass
 from typing import Any, Literal
 
 from .. import db
+from . import membership, xp_service
 
 
 @dataclass
@@ -23,17 +25,7 @@ class ProfileResult:
     xp: int = 0
     level: int = 1
     next_xp: int = 0
-    last_xp_at: str | None = None
-
-
-def _extract_data(res: Any) -> Any:
-    return res.get("data") if isinstance(res, dict) else getattr(res, "data", None)
-
-
-def _row_get(row: Any, key: str, default: Any = None) -> Any:
-    if isinstance(row, dict):
-        return row.get(key, default)
-    return getattr(row, key, default)
+    last_xp_at: datetime.datetime | None = None
 
 
 async def register_user(user_id: int, username: str | None) -> RegisterResult:
@@ -42,43 +34,38 @@ async def register_user(user_id: int, username: str | None) -> RegisterResult:
     except Exception as e:
         return RegisterResult(status="error", error_message=str(e))
 
-    existing_data = _extract_data(existing)
-    if existing_data:
+    if existing is not None:
+        membership.add(user_id)
         return RegisterResult(status="exists")
 
     try:
-        res = await db.create_user(user_id, username)
+        row = await db.create_user(user_id, username)
     except Exception as e:
         return RegisterResult(status="error", error_message=str(e))
 
-    data = _extract_data(res)
-    if data:
+    if row is not None:
+        membership.add(user_id)
+        await xp_service.claim_staged_xp(user_id)
         return RegisterResult(status="created")
 
-    return RegisterResult(status="unknown", raw_result=res)
+    return RegisterResult(status="unknown", raw_result=row)
 
 
 async def get_profile(user_id: int) -> ProfileResult:
     try:
-        res = await db.get_user(user_id)
+        row = await db.get_user(user_id)
     except Exception as e:
         return ProfileResult(status="error", error_message=str(e))
 
-    data = _extract_data(res)
-    if not data:
+    if row is None:
         return ProfileResult(status="not_found")
 
-    row = data[0] if isinstance(data, (list, tuple)) and data else data
-    xp = _row_get(row, "xp", 0)
-    level = _row_get(row, "level", 1)
-    next_xp = db.xp_for_level((level or 1) + 1)
-
     return ProfileResult(
         status="found",
-        user_id=_row_get(row, "id", user_id),
-        username=_row_get(row, "username", None),
-        xp=xp or 0,
-        level=level or 1,
-        next_xp=next_xp,
-        last_xp_at=_row_get(row, "last_xp_at", None),
+        user_id=row.id,
+        username=row.username,
+        xp=row.xp,
+        level=row.level,
+        next_xp=row.next_xp,
+        last_xp_at=row.last_xp_at,
     )
@@ -2,91 +2,565 @@
 
 This module provides an async interface to query OpenWeather, parse the response
 and caches the result to avoid excessive API calls.
+
+Every API call goes through `_call_api`, which applies a per-minute call budget
+(the free tier allows 60 calls/min), bounded retries with jitter for transient
+errors, and a circuit breaker. When a call cannot be made or fails, callers fall
+back to a stale cache entry (kept for up to `_STALE_MAX_AGE` past expiry).
+
+Coordinates are bucketed into geohash cells (`GEOHASH_PRECISION`, default 5,
+about 5 km x 5 km) and looked up under a `geo:<cell>` key at the cell centre,
+so everyone sharing a location in the same cell shares one cache entry. Such
+keys work anywhere a city name does (cache, dashboard, favorites, snapshots).
+
+Entries expire when the provider is next expected to have new data rather
+than on a fixed TTL: current weather `_CURRENT_CADENCE` after its observation
+time, forecasts at the next 3-hour forecast step. Only the fields the bot
+displays are stored. Names answered with 404 are not looked up again for
+`_NOT_FOUND_TTL` seconds. Concurrent misses for the same entry share one request
+(`_coalesced`), so a city costs at most about six current-weather calls and
+one forecast call per three hours however many users ask.
 """
 from __future__ import annotations
 import asyncio
 import logging
 import os
 import time
-from typing import Any, Optional, Tuple
-
-import httpx
+from typing import TYPE_CHECKING, Any, AsyncIterator, Iterable, Optional, Tuple
 
+from ..resilience import CLOSED, CircuitBreaker, RateBudget, retry_async
 from ..utils import KST
 
-WEATHER_TOKEN = os.getenv("OPENWEATHER_TOKEN")
-if not WEATHER_TOKEN:
-    logging.warning("OPENWEATHER_TOKEN not set in environment; weather service disabled")
+if TYPE_CHECKING:
+    import httpx
+
+API_HOST = "api.openweathermap.org"
+
+_token: Optional[str] = None
+_token_checked = False
 
-_client: Optional[httpx.AsyncClient] = None
+_client: Optional["httpx.AsyncClient"] = None
 _client_lock = asyncio.Lock()
 
-# Simple TTL cache: key -> (data, expires_at)
+# Cache: key -> (data, expires_at)
+# Expired entries are kept for `_STALE_MAX_AGE` more seconds so they can be
+# served while the API is unavailable or the call budget is spent.
 _cache: dict[str, tuple[Any, float]] = {}
 _cache_lock = asyncio.Lock()
-_CACHE_TTL = 300  # seconds
+_STALE_MAX_AGE = 3 * 3600  # seconds
+# Names the API answered 404 for: key -> until when to answer None without a
+# call (inline queries look up whatever prefix the user has typed)
+_not_found: dict[str, float] = {}
+_NOT_FOUND_TTL = 300
+_MAX_NOT_FOUND = 4096
+# in-flight fetches by cache key; concurrent misses await the same task
+_inflight: dict[str, asyncio.Task] = {}
+
+# Provider update cadence. Stations report about every 10 minutes; the
+# forecast list moves on every 3 hours (UTC-aligned steps). New data shows up
+# a few minutes after the nominal time.
+_CURRENT_CADENCE = 600
+_FORECAST_CADENCE = 3 * 3600
+_PUBLISH_GRACE = 300
+_MIN_TTL = 60
+
+FORECAST_PREFIX = "fc:"
+
+# Per-attempt timeouts, retry policy and an overall deadline for one logical call
+_CONNECT_TIMEOUT = 2.0
+_REQUEST_TIMEOUT = 3.0
+_RETRY_ATTEMPTS = 3
+_CALL_DEADLINE = 6.0
+
+_breaker = CircuitBreaker("openweather", failure_threshold=5, reset_timeout=30.0)
+_budget: Optional[RateBudget] = None
+
+# OpenWeather city ids learned from earlier responses, keyed by cache key.
+# Cities with a known id can be fetched together through the group endpoint.
+_city_ids: dict[str, int] = {}
+# set to False once the group endpoint is rejected for this API key
+_group_supported = True
+_GROUP_MAX_IDS = 20
+_FANOUT_LIMIT = 4
 
+GEO_PREFIX = "geo:"
+GEOHASH_PRECISION = max(1, min(int(os.getenv("WEATHER_GEOHASH_PRECISION", "5")), 12))
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
 
-async def _get_client() -> httpx.AsyncClient:
+
+def _get_token() -> Optional[str]:
+    """Read OPENWEATHER_TOKEN on first use (after .env has been loaded)."""
+    global _token, _token_checked
+    if not _token_checked:
+        _token = os.getenv("OPENWEATHER_TOKEN")
+        _token_checked = True
+        if not _token:
+            logging.warning("OPENWEATHER_TOKEN not set in environment; weather service disabled")
+    return _token
+
+
+def _get_budget() -> RateBudget:
+    global _budget
+    if _budget is None:
+        _budget = RateBudget(int(os.getenv("OPENWEATHER_CALLS_PER_MIN", "60")), window=60.0)
+    return _budget
+
+
+async def _get_client() -> "httpx.AsyncClient":
     global _client
     async with _client_lock:
         if _client is None:
-            _client = httpx.AsyncClient(timeout=5.0)
+            # imported here so that importing this module stays cheap at startup
+            import httpx
+
+            _client = httpx.AsyncClient(
+                timeout=httpx.Timeout(_REQUEST_TIMEOUT, connect=_CONNECT_TIMEOUT),
+                # every call goes to one host: keep a few connections warm and
+                # reuse them instead of paying TLS setup per request
+                limits=httpx.Limits(
+                    max_connections=2 * _FANOUT_LIMIT,
+                    max_keepalive_connections=_FANOUT_LIMIT,
+                    keepalive_expiry=120.0,
+                ),
+            )
         return _client
 
 
+class _Transient(Exception):
+    """A retryable API failure (HTTP 429 or 5xx)."""
+
+
+class _BudgetExhausted(Exception):
+    pass
+
+
+async def _call_api(url: str) -> Optional["httpx.Response"]:
+    """GET `url` with budget, retries and circuit breaker applied.
+
+    Returns the response for any non-transient status (callers check it), or
+    None when the call was refused or failed; callers then serve stale data.
+    """
+    import httpx
+
+    budget = _get_budget()
+    if budget.remaining() == 0:
+        logging.warning("OpenWeather call budget exhausted; serving cached data")
+        return None
+    client = await _get_client()
+    # allowed while not closed means this call is the half-open probe
+    probe = _breaker.state != CLOSED
+    if not _breaker.allow():
+        logging.debug("OpenWeather circuit open; serving cached data")
+        return None
+
+    async def _attempt() -> "httpx.Response":
+        if not budget.try_acquire():
+            raise _BudgetExhausted()
+        resp = await client.get(url)
+        if resp.status_code == 429 or resp.status_code >= 500:
+            raise _Transient(f"HTTP {resp.status_code}")
+        return resp
+
+    def _retryable(e: BaseException) -> bool:
+        return isinstance(e, (_Transient, httpx.TransportError))
+
+    try:
+        resp = await asyncio.wait_for(
+            retry_async(_attempt, attempts=_RETRY_ATTEMPTS, base_delay=0.25, max_delay=1.5, retry_on=_retryable),
+            timeout=_CALL_DEADLINE,
+        )
+    except _BudgetExhausted:
+        logging.warning("OpenWeather call budget exhausted during retries")
+        if probe:
+            _breaker.release_probe()
+        return None
+    except Exception as e:
+        _breaker.record_failure()
+        logging.warning("OpenWeather call failed (%s): %s", _breaker.state, e or type(e).__name__)
+        return None
+    except BaseException:
+        # cancelled (handler timeout, shutdown): no outcome, but free the probe slot
+        if probe:
+            _breaker.release_probe()
+        raise
+    _breaker.record_success()
+    return resp
+
+
+async def warm_up() -> None:
+    """Create the shared HTTP client, resolve the API host and open a pooled connection."""
+    if not _get_token():
+        return
+    client = await _get_client()
+    await asyncio.get_running_loop().getaddrinfo(API_HOST, 443)
+    try:
+        # the bare host does not count against the API quota
+        await client.head(f"https://{API_HOST}/")
+    except Exception as e:
+        logging.debug("Weather warm-up request failed: %s", e)
+
+
 def _cache_key(city_api_name: str) -> str:
     return city_api_name.lower()
 
 
-async def _get_cached(city_api_name: str) -> Optional[Any]:
+def geohash_encode(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits, ch, even = 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            ch = (ch << 1) | 1
+            rng[0] = mid
+        else:
+            ch <<= 1
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_GEOHASH_BASE32[ch])
+            bits, ch = 0, 0
+    return "".join(chars)
+
+
+def geohash_decode(cell: str) -> Tuple[float, float]:
+    """Centre (lat, lon) of a geohash cell."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for c in cell.lower():
+        ch = _GEOHASH_BASE32.index(c)
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if (ch >> shift) & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return (lat_range[0] + lat_range[1]) / 2, (lon_range[0] + lon_range[1]) / 2
+
+
+def geo_key(lat: float, lon: float) -> str:
+    """Cache/favorite key for the geohash cell containing (lat, lon)."""
+    return GEO_PREFIX + geohash_encode(lat, lon)
+
+
+def is_geo_key(city_api_name: str) -> bool:
+    return city_api_name.startswith(GEO_PREFIX)
+
+
+def _weather_url(city_api_name: str, token: str, endpoint: str = "weather") -> str:
+    if is_geo_key(city_api_name):
+        lat, lon = geohash_decode(city_api_name[len(GEO_PREFIX):])
+        where = f"lat={lat:.4f}&lon={lon:.4f}"
+    else:
+        where = f"q={city_api_name},KR"
+    return f"https://{API_HOST}/data/2.5/{endpoint}?{where}&appid={token}&units=metric&lang=kr"
+
+
+async def _get_cached(city_api_name: str, allow_stale: bool = False) -> Optional[Any]:
     key = _cache_key(city_api_name)
     now = time.time()
     async with _cache_lock:
         item = _cache.get(key)
-        if item and item[1] > now:
+        if not item:
+            return None
+        if item[1] > now:
             return item[0]
-        if item:
+        if item[1] + _STALE_MAX_AGE <= now:
             _cache.pop(key, None)
-    return None
+            return None
+        return item[0] if allow_stale else None
+
+
+def _current_expiry(data: dict, now: float) -> float:
+    """When the station behind `data` should have reported again.
+
+    Observations often lag; once the expected report time has passed, wait a
+    full cadence rather than polling every `_MIN_TTL` for a late station.
+    """
+    expected = int(data.get("dt") or 0) + _CURRENT_CADENCE
+    if expected <= now:
+        return now + _CURRENT_CADENCE
+    return min(max(expected, now + _MIN_TTL), now + _CURRENT_CADENCE)
+
+
+def _forecast_expiry(now: float) -> float:
+    """Just after the next 3-hour forecast step."""
+    return (now // _FORECAST_CADENCE + 1) * _FORECAST_CADENCE + _PUBLISH_GRACE
+
+
+def _slim_current(data: dict) -> dict:
+    """The current-weather fields the bot displays, in the API's own shape."""
+    weather = (data.get("weather") or [{}])[0]
+    main = data.get("main") or {}
+    return {
+        "id": data.get("id"),
+        "name": data.get("name"),
+        "dt": data.get("dt"),
+        "weather": [{"main": weather.get("main"), "description": weather.get("description")}],
+        "main": {"temp": main.get("temp"), "humidity": main.get("humidity")},
+        "wind": {"speed": (data.get("wind") or {}).get("speed", 0.0)},
+    }
+
+
+def _slim_forecast(data: dict) -> dict:
+    """{"name": city, "steps": [[dt, temp, pop %, main, description], ...]}"""
+    steps = []
+    for item in data.get("list") or []:
+        weather = (item.get("weather") or [{}])[0]
+        steps.append([
+            int(item["dt"]),
+            float(item["main"]["temp"]),
+            int(round(float(item.get("pop") or 0) * 100)),
+            weather.get("main") or "",
+            weather.get("description") or "",
+        ])
+    return {"name": (data.get("city") or {}).get("name"), "steps": steps}
 
 
-async def _set_cache(city_api_name: str, data: Any) -> None:
+async def _coalesced(key: str, fetch) -> Any:
+    """Run `fetch()` once for all concurrent callers asking for `key`."""
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(fetch())
+        _inflight[key] = task
+        task.add_done_callback(lambda _t: _inflight.pop(key, None))
+    # shielded so one caller giving up does not cancel the fetch for the others
+    return await asyncio.shield(task)
+
+
+async def _set_cache(city_api_name: str, data: Any, expires_at: Optional[float] = None) -> None:
     key = _cache_key(city_api_name)
+    now = time.time()
+    if expires_at is None:
+        expires_at = _current_expiry(data, now)
     async with _cache_lock:
-        _cache[key] = (data, time.time() + _CACHE_TTL)
+        _cache[key] = (data, expires_at)
+    # a coordinate lookup reports the nearest station's city id; fetching that
+    # id through the group endpoint would answer for the city, not the cell
+    if isinstance(data, dict) and data.get("id") and not is_geo_key(key):
+        _city_ids[key] = int(data["id"])
+
+
+def expires_at(city_api_name: str) -> Optional[float]:
+    """Expiry (epoch seconds) of the cached entry for `city_api_name`, if any."""
+    item = _cache.get(_cache_key(city_api_name))
+    return item[1] if item else None
 
 
+def export_cache() -> dict:
+    """Cache entries (including stale ones still servable) with remaining TTLs, for snapshots."""
+    now = time.time()
+    entries = [[key, data, exp - now] for key, (data, exp) in _cache.items() if exp + _STALE_MAX_AGE > now]
+    return {"entries": entries, "city_ids": dict(_city_ids)}
+
+
+def import_cache(data: dict, elapsed: float) -> int:
+    """Restore entries from `export_cache`, dropping those past the stale window.
+
+    Entries are not refetched: expired ones are served as stale data and
+    refreshed on next use, so a restart costs no API quota.
+    """
+    now = time.time()
+    restored = 0
+    for key, payload, ttl in data.get("entries", []):
+        remaining = ttl - elapsed
+        if remaining + _STALE_MAX_AGE <= 0:
+            continue
+        _cache[key] = (payload, now + remaining)
+        restored += 1
+    _city_ids.update({k: int(v) for k, v in data.get("city_ids", {}).items()})
+    return restored
+
+
+def _remember_not_found(key: str) -> None:
+    now = time.time()
+    if len(_not_found) >= _MAX_NOT_FOUND:
+        for k in [k for k, until in _not_found.items() if until <= now] or list(_not_found)[: _MAX_NOT_FOUND // 2]:
+            del _not_found[k]
+    _not_found[_cache_key(key)] = now + _NOT_FOUND_TTL
+
+
+def _known_missing(key: str) -> bool:
+    until = _not_found.get(_cache_key(key))
+    if until is None:
+        return False
+    if until <= time.time():
+        _not_found.pop(_cache_key(key), None)
+        return False
+    return True
+
+
 async def get_weather_raw(city_api_name: str) -> Optional[dict]:
     """Fetch raw weather data from OpenWeather asynchronously with caching.
 
+    `city_api_name` is a city name or a `geo:<cell>` key (see `geo_key`).
     Returns the JSON dict or None.
     """
-    if not WEATHER_TOKEN:
+    token = _get_token()
+    if not token:
         return None
 
     cached = await _get_cached(city_api_name)
     if cached is not None:
         logging.debug("Weather cache hit: %s", city_api_name)
         return cached
+    if _known_missing(city_api_name):
+        return None
+    return await _coalesced(
+        _cache_key(city_api_name),
+        lambda: _fetch(city_api_name, token, "weather", _slim_current, _current_expiry),
+    )
 
-    client = await _get_client()
-    url = (
-        f"https://api.openweathermap.org/data/2.5/weather?q={city_api_name},KR"
-        f"&appid={WEATHER_TOKEN}&units=metric&lang=kr"
+
+async def get_forecast(city_api_name: str) -> Optional[dict]:
+    """5-day / 3-hour forecast for a city name or `geo:` key (see `_slim_forecast`)."""
+    token = _get_token()
+    if not token:
+        return None
+    key = FORECAST_PREFIX + city_api_name
+    cached = await _get_cached(key)
+    if cached is not None:
+        return cached
+    if _known_missing(key):
+        return None
+    return await _coalesced(
+        _cache_key(key),
+        lambda: _fetch(city_api_name, token, "forecast", _slim_forecast, lambda _d, now: _forecast_expiry(now)),
     )
+
+
+async def _fetch(city_api_name: str, token: str, endpoint: str, slim, expiry) -> Optional[dict]:
+    """One API call for `endpoint`; caches the slimmed result until `expiry(data, now)`."""
+    key = city_api_name if endpoint == "weather" else FORECAST_PREFIX + city_api_name
     try:
-        resp = await client.get(url)
-        resp.raise_for_status()
-        data = resp.json()
-        # cache the raw response
-        await _set_cache(city_api_name, data)
-        return data
-    except Exception as e:
-        logging.exception("Weather API error for %s: %s", city_api_name, e)
+        url = _weather_url(city_api_name, token, endpoint)
+    except ValueError:
+        logging.warning("Invalid geohash key: %s", city_api_name)
+        return None
+    resp = await _call_api(url)
+    if resp is None:
+        stale = await _get_cached(key, allow_stale=True)
+        if stale is not None:
+            logging.info("Serving stale %s for %s", endpoint, city_api_name)
+        return stale
+    if resp.status_code != 200:
+        # 404: unknown city; other 4xx are not worth retrying either
+        logging.warning("Weather API (%s) returned %s for %s", endpoint, resp.status_code, city_api_name)
+        if resp.status_code == 404:
+            _remember_not_found(key)
+        return None
+    try:
+        data = slim(resp.json())
+    except (ValueError, KeyError, TypeError) as e:
+        logging.warning("Weather API (%s) returned invalid data for %s: %s", endpoint, city_api_name, e)
         return None
+    await _set_cache(key, data, expiry(data, time.time()))
+    return data
 
 
+async def _get_group(cities: list[str]) -> Optional[dict[str, Optional[dict]]]:
+    """Fetch several cities with known ids in one call to the group endpoint.
+
+    Returns None if the group call failed and the cities should be fetched
+    individually (the caller does that within its fan-out bound).
+    """
+    global _group_supported
+    token = _get_token()
+    ids = {_city_ids[_cache_key(c)]: c for c in cities}
+    url = (
+        f"https://{API_HOST}/data/2.5/group?id={','.join(str(i) for i in ids)}"
+        f"&appid={token}&units=metric&lang=kr"
+    )
+    resp = await _call_api(url)
+    if resp is None:
+        # API unavailable or out of budget: single calls would fail the same way
+        return {c: await _get_cached(c, allow_stale=True) for c in cities}
+    try:
+        if resp.status_code in (401, 403, 404):
+            # not available on this plan; stop trying and fall back to single calls
+            _group_supported = False
+            raise RuntimeError(f"group endpoint unavailable ({resp.status_code})")
+        resp.raise_for_status()
+        items = resp.json().get("list") or []
+    except Exception as e:
+        logging.warning("Weather group call failed, falling back to single calls: %s", e)
+        return None
+
+    out: dict[str, Optional[dict]] = {c: None for c in cities}
+    for item in items:
+        city = ids.get(int(item.get("id") or 0))
+        if city is not None:
+            item = _slim_current(item)
+            await _set_cache(city, item)
+            out[city] = item
+    return out
+
+
+async def get_weather_many(
+    city_api_names: Iterable[str],
+    concurrency: int = _FANOUT_LIMIT,
+) -> AsyncIterator[tuple[str, Optional[dict]]]:
+    """Yield (city, data) pairs for many cities as results become available.
+
+    Cached cities are yielded first. Cities with a known OpenWeather id are
+    fetched in batched group calls; the rest individually. At most
+    `concurrency` requests are in flight at once.
+    """
+    cities = list(dict.fromkeys(city_api_names))
+    if not _get_token():
+        for city in cities:
+            yield city, None
+        return
+
+    to_fetch: list[str] = []
+    for city in cities:
+        cached = await _get_cached(city)
+        if cached is not None:
+            yield city, cached
+        else:
+            to_fetch.append(city)
+    if not to_fetch:
+        return
+
+    grouped = [c for c in to_fetch if _group_supported and _cache_key(c) in _city_ids]
+    single = [c for c in to_fetch if c not in grouped]
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def _one(city: str) -> dict[str, Optional[dict]]:
+        async with sem:
+            return {city: await get_weather_raw(city)}
+
+    async def _batch(chunk: list[str]) -> dict[str, Optional[dict]]:
+        async with sem:
+            res = await _get_group(chunk)
+        if res is None:
+            # the slot is released first; each single call takes its own
+            res = {}
+            for part in await asyncio.gather(*(_one(c) for c in chunk)):
+                res.update(part)
+        return res
+
+    jobs = [_batch(grouped[i:i + _GROUP_MAX_IDS]) for i in range(0, len(grouped), _GROUP_MAX_IDS)]
+    jobs += [_one(c) for c in single]
+    for fut in asyncio.as_completed(jobs):
+        for city, data in (await fut).items():
+            yield city, data
+
+
+async def get_weather_by_coords(lat: float, lon: float) -> Tuple[str, Optional[dict]]:
+    """Weather for the geohash cell containing (lat, lon).
+
+    Returns (key, data); `key` can be stored as a favorite and passed back to
+    `get_weather_raw`.
+    """
+    key = geo_key(lat, lon)
+    return key, await get_weather_raw(key)
+
+
 def parse_weather_data(data: dict) -> Optional[Tuple[str, float, int, float]]:
     try:
         weather = data["weather"][0]["description"]
@@ -98,6 +572,15 @@ def parse_weather_data(data: dict) -> Optional[Tuple[str, float, int, float]]:
         return None
 
 
+def stats() -> dict:
+    """Breaker state, remaining call budget and cache size (for diagnostics)."""
+    return {
+        "breaker": _breaker.snapshot(),
+        "budget_remaining": _get_budget().remaining(),
+        "cached": len(_cache),
+    }
+
+
 async def close_client() -> None:
     global _client
     async with _client_lock:
@@ -1,38 +1,138 @@
 """XP service: in-memory queue for message XP and background flush to DB.
 
-This reduces DB write frequency and improves message path latency.
+This reduces DB write frequency and improves message path latency. Every
+flush also appends the applied amounts to the `xp_events` log in one batch,
+which keeps the hourly/daily `xp_rollups` used by `/xp history` up to date.
+Level changes seen while flushing are published as `LevelUp` events on the
+event bus; announcing them is left to a separate consumer.
 """
 from __future__ import annotations
 import asyncio
+import os
+import time
+from collections import OrderedDict
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from typing import Dict, Literal
+from typing import Dict, Literal, Optional, Tuple
 
 from .. import db
+from . import event_bus, leaderboard_service, membership
 
 
 _pending: Dict[int, int] = {}
+# per-chat ledger deltas keyed by (chat_id, user_id); flushed to `chat_xp`
+_pending_chat: Dict[Tuple[int, int], int] = {}
+# event log deltas keyed by (user_id, chat_id, source); flushed to `xp_events`
+_pending_events: Dict[Tuple[int, Optional[int], str], int] = {}
+# latest username seen per pending user, used only for level-up announcements
+_pending_names: Dict[int, str] = {}
+# chat each pending user last earned XP in, where their level-up is announced
+_pending_last_chat: Dict[int, int] = {}
 _lock = asyncio.Lock()
 
 MESSAGE_XP = 5
 MESSAGE_COOLDOWN_SEC = 60
 
+# raw xp_events older than this are pruned; daily rollups are kept
+XP_EVENT_RETENTION_DAYS = int(os.getenv("XP_EVENT_RETENTION_DAYS", "30"))
+# hourly rollups only back the "last 24h" view, keep a little more than that
+XP_HOURLY_ROLLUP_RETENTION_DAYS = 7
+
+# Unregistered senders get no XP unless XP_ACCRUE_UNREGISTERED is set; then
+# their message XP is staged in memory (never written to `users`) and moved
+# into the normal queue when they /register. The staging area keeps at most
+# XP_STAGING_MAX_USERS users, evicting the least recently active.
+ACCRUE_UNREGISTERED = os.getenv("XP_ACCRUE_UNREGISTERED", "").lower() in ("1", "true", "yes")
+STAGING_MAX_USERS = int(os.getenv("XP_STAGING_MAX_USERS", "10000"))
+# user_id -> (staged xp, monotonic time of last award)
+_staged: "OrderedDict[int, Tuple[int, float]]" = OrderedDict()
+
 
 @dataclass
 class XpAwardResult:
-    status: Literal["awarded", "skipped", "error"]
+    status: Literal["awarded", "staged", "skipped", "error"]
     error_message: str | None = None
 
 
-async def queue_xp(user_id: int, amount: int) -> None:
+async def queue_xp(user_id: int, amount: int, chat_id: Optional[int] = None, source: str = "message") -> None:
     async with _lock:
         _pending[user_id] = _pending.get(user_id, 0) + amount
+        ev_key = (user_id, chat_id, source)
+        _pending_events[ev_key] = _pending_events.get(ev_key, 0) + amount
+        if chat_id is not None:
+            key = (chat_id, user_id)
+            _pending_chat[key] = _pending_chat.get(key, 0) + amount
+            _pending_last_chat[user_id] = chat_id
+
+
+def export_pending() -> dict:
+    """Unflushed XP deltas in a JSON-friendly form (for shutdown snapshots)."""
+    return {
+        "users": [[uid, amt] for uid, amt in _pending.items()],
+        "chat": [[cid, uid, amt] for (cid, uid), amt in _pending_chat.items()],
+        "events": [[uid, cid, src, amt] for (uid, cid, src), amt in _pending_events.items()],
+        "names": [[uid, name] for uid, name in _pending_names.items()],
+        "last_chat": [[uid, cid] for uid, cid in _pending_last_chat.items()],
+        "staged": [[uid, amt] for uid, (amt, _) in _staged.items()],
+    }
+
+
+async def import_pending(data: dict) -> None:
+    """Merge deltas saved by `export_pending` back into the queues."""
+    async with _lock:
+        for uid, amt in data.get("users", []):
+            _pending[uid] = _pending.get(uid, 0) + amt
+        for cid, uid, amt in data.get("chat", []):
+            _pending_chat[(cid, uid)] = _pending_chat.get((cid, uid), 0) + amt
+        for uid, cid, src, amt in data.get("events", []):
+            _pending_events[(uid, cid, src)] = _pending_events.get((uid, cid, src), 0) + amt
+        for uid, name in data.get("names", []):
+            _pending_names.setdefault(uid, name)
+        for uid, cid in data.get("last_chat", []):
+            _pending_last_chat.setdefault(uid, cid)
+    for uid, amt in data.get("staged", []):
+        _staged[uid] = (_staged.get(uid, (0, 0.0))[0] + amt, 0.0)
+
+
+def _stage_xp(user_id: int) -> XpAwardResult:
+    now = time.monotonic()
+    amt, last = _staged.get(user_id, (0, float("-inf")))
+    if now - last < MESSAGE_COOLDOWN_SEC:
+        return XpAwardResult(status="skipped")
+    _staged[user_id] = (amt + MESSAGE_XP, now)
+    _staged.move_to_end(user_id)
+    while len(_staged) > STAGING_MAX_USERS:
+        _staged.popitem(last=False)
+    return XpAwardResult(status="staged")
+
 
+async def claim_staged_xp(user_id: int) -> int:
+    """Move a newly registered user's staged XP into the flush queue. Returns the amount."""
+    amt, _ = _staged.pop(user_id, (0, 0.0))
+    if amt:
+        await queue_xp(user_id, amt, source="staged")
+    return amt
+
+
+async def award_message_xp(
+    user_id: int,
+    chat_id: Optional[int] = None,
+    username: Optional[str] = None,
+) -> XpAwardResult:
+    """Award message XP for a user, respecting cooldown.
+
+    When `chat_id` is given the XP is also credited to that chat's ledger.
+    Unregistered users are skipped without touching the DB (or staged, see
+    `ACCRUE_UNREGISTERED`).
+    """
+    if not membership.is_registered(user_id):
+        return _stage_xp(user_id) if ACCRUE_UNREGISTERED else XpAwardResult(status="skipped")
 
-async def award_message_xp(user_id: int) -> XpAwardResult:
-    """Award message XP for a user, respecting cooldown."""
     try:
         info = await db.get_xp_info(user_id)
+    except db.DatabaseUnavailable as e:
+        # breaker is open: skip quietly rather than log once per chat message
+        return XpAwardResult(status="error", error_message=str(e))
     except Exception as e:
         print(
             f"[ERROR] award_message_xp: Failed to get xp info for user {user_id}: "
@@ -40,22 +140,14 @@ async def award_message_xp(user_id: int) -> XpAwardResult:
         )
         return XpAwardResult(status="error", error_message=str(e))
 
-    last_xp = info.get("last_xp_at")
-    if last_xp:
-        if isinstance(last_xp, str) and last_xp.endswith("Z"):
-            last_xp = last_xp.replace("Z", "+00:00")
-        try:
-            last_dt = datetime.fromisoformat(last_xp)
-            kst = timezone(timedelta(hours=9))
-            last_dt_kst = last_dt.astimezone(kst)
-            now_kst = datetime.now(kst)
-            if (now_kst - last_dt_kst).total_seconds() < MESSAGE_COOLDOWN_SEC:
-                return XpAwardResult(status="skipped")
-        except Exception:
-            pass
+    if info.last_xp_at is not None:
+        if (datetime.now(timezone.utc) - info.last_xp_at).total_seconds() < MESSAGE_COOLDOWN_SEC:
+            return XpAwardResult(status="skipped")
 
     try:
-        await queue_xp(user_id, MESSAGE_XP)
+        await queue_xp(user_id, MESSAGE_XP, chat_id=chat_id)
+        if username:
+            _pending_names[user_id] = username
     except Exception as e:
         print(
             f"[ERROR] award_message_xp: Failed to queue xp for user {user_id}: "
@@ -83,12 +175,55 @@ async def get_xp_info(user_id: int) -> XpInfoResult:
 
     return XpInfoResult(
         status="ok",
-        xp=info.get("xp", 0),
-        level=info.get("level", 1),
-        next_xp=info.get("next_xp", 0),
+        xp=info.xp,
+        level=info.level,
+        next_xp=info.next_xp,
     )
 
 
+@dataclass
+class XpHistoryResult:
+    status: Literal["ok", "error"]
+    error_message: str | None = None
+    # (KST day start ISO, amount) for the last 7 days, oldest first
+    daily: list[tuple[str, int]] | None = None
+    # amounts for each of the last 24 hours, oldest first
+    hourly: list[int] | None = None
+
+
+async def get_xp_history(user_id: int, days: int = 7) -> XpHistoryResult:
+    """Return recent XP earnings read from `xp_rollups` (at most days + 24 rows)."""
+    kst = timezone(timedelta(hours=9))
+    now = datetime.now(kst)
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    day_start = today - timedelta(days=days - 1)
+    hour_start = now.replace(minute=0, second=0, microsecond=0) - timedelta(hours=23)
+    try:
+        daily_rows, hourly_rows = await asyncio.gather(
+            db.get_xp_rollups(user_id, "d", day_start.isoformat(), limit=days),
+            db.get_xp_rollups(user_id, "h", hour_start.isoformat(), limit=24),
+        )
+    except Exception as e:
+        return XpHistoryResult(status="error", error_message=str(e))
+
+    by_day: Dict[str, int] = {}
+    for bucket, amount in daily_rows:
+        key = bucket.astimezone(kst).date().isoformat()
+        by_day[key] = by_day.get(key, 0) + amount
+    daily = []
+    for i in range(days):
+        d = (day_start + timedelta(days=i)).date().isoformat()
+        daily.append((d, by_day.get(d, 0)))
+
+    hourly = [0] * 24
+    for bucket, amount in hourly_rows:
+        slot = int((bucket - hour_start).total_seconds() // 3600)
+        if 0 <= slot < 24:
+            hourly[slot] += amount
+
+    return XpHistoryResult(status="ok", daily=daily, hourly=hourly)
+
+
 async def flush_pending(concurrency: int = 5) -> None:
     """Flush all pending XP updates to DB. This is typically run in background.
 
@@ -97,22 +232,93 @@ async def flush_pending(concurrency: int = 5) -> None:
     async with _lock:
         items = list(_pending.items())
         _pending.clear()
+        chat_items = list(_pending_chat.items())
+        _pending_chat.clear()
+        event_items = list(_pending_events.items())
+        _pending_events.clear()
+        names = dict(_pending_names)
+        _pending_names.clear()
+        announce_chat = dict(_pending_last_chat)
+        _pending_last_chat.clear()
 
-    if not items:
+    if not items and not chat_items and not event_items:
         return
 
     sem = asyncio.Semaphore(concurrency)
+    # users whose delta was dropped / requeued by `_flush_item`; chat deltas and events follow suit
+    rejected: set[int] = set()
+    requeued: set[int] = set()
 
     async def _flush_item(uid: int, amt: int):
         async with sem:
             try:
-                await db.add_xp(uid, amt)
+                res = await db.add_xp(uid, amt)
             except Exception as e:
                 # If write fails, requeue
+                requeued.add(uid)
                 async with _lock:
                     _pending[uid] = _pending.get(uid, 0) + amt
+                    if uid in announce_chat:
+                        _pending_last_chat.setdefault(uid, announce_chat[uid])
+                return
+        if res is None:
+            # not registered (e.g. queued before the membership index loaded)
+            rejected.add(uid)
+            return
+        if res["new_xp"] != res["old_xp"]:
+            leaderboard_service.note_global_xp_change()
+        old_level, new_level = res["old_level"], res["new_level"]
+        if new_level > old_level:
+            event_bus.publish(
+                event_bus.LevelUp(uid, announce_chat.get(uid), old_level, new_level, names.get(uid))
+            )
+
+    async def _flush_chat_item(key: Tuple[int, int], amt: int):
+        if key[1] in rejected:
+            # no `users` row, so no per-chat ledger either
+            return
+        if key[1] in requeued:
+            async with _lock:
+                _pending_chat[key] = _pending_chat.get(key, 0) + amt
+            return
+        async with sem:
+            try:
+                res = await db.add_chat_xp(key[0], key[1], amt)
+            except Exception:
+                async with _lock:
+                    _pending_chat[key] = _pending_chat.get(key, 0) + amt
+                return
+            leaderboard_service.apply_chat_xp(key[0], key[1], res["new_xp"])
 
+    async def _flush_events():
+        # only log what `users.xp` got, so the history matches the balance
+        applied = [(key, amt) for key, amt in event_items if key[0] not in rejected and key[0] not in requeued]
+        if len(applied) < len(event_items):
+            async with _lock:
+                for key, amt in event_items:
+                    if key[0] in requeued:
+                        _pending_events[key] = _pending_events.get(key, 0) + amt
+        if not applied:
+            return
+        now_iso = datetime.now(timezone.utc).isoformat()
+        events = [
+            {"user_id": uid, "chat_id": cid, "amount": amt, "source": src, "ts": now_iso}
+            for (uid, cid, src), amt in applied
+        ]
+        try:
+            await db.record_xp_events(events)
+        except Exception as e:
+            print(f"[ERROR] flush_pending: Failed to record {len(events)} xp events: {type(e).__name__}: {e}")
+            async with _lock:
+                for key, amt in applied:
+                    _pending_events[key] = _pending_events.get(key, 0) + amt
+
+    # global deltas first: events and chat ledgers depend on whether they were applied
     await asyncio.gather(*[_flush_item(uid, amt) for uid, amt in items])
+    await asyncio.gather(
+        *[_flush_chat_item(key, amt) for key, amt in chat_items],
+        _flush_events(),
+    )
 
 
 async def start_background_flush(interval_seconds: float = 2.0):
@@ -120,3 +326,23 @@ async def start_background_flush(interval_seconds: float = 2.0):
     while True:
         await asyncio.sleep(interval_seconds)
         await flush_pending()
+        leaderboard_service.evict_idle_chat_indexes()
+
+
+async def compact_events(retention_days: int = XP_EVENT_RETENTION_DAYS) -> None:
+    """Prune raw XP events past the retention window (rollups stay)."""
+    now = datetime.now(timezone.utc)
+    await db.prune_xp_events(
+        (now - timedelta(days=retention_days)).isoformat(),
+        hourly_before_iso=(now - timedelta(days=XP_HOURLY_ROLLUP_RETENTION_DAYS)).isoformat(),
+    )
+
+
+async def start_background_compaction(interval_seconds: float = 3600.0):
+    """Start an infinite background task that prunes old XP events."""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await compact_events()
+        except Exception as e:
+            print(f"[ERROR] compact_events: {type(e).__name__}: {e}")
@@ -0,0 +1,107 @@
+"""Warm-start snapshots of in-process caches.
+
+On shutdown the user cache, the weather cache, the recent
+update ids used for deduplication and any XP deltas that could not be flushed
+are written to one gzip-compressed JSON file
+(`SNAPSHOT_PATH`). On startup the file is loaded once and removed (so pending
+XP is never applied twice), entries that have expired in the meantime are
+dropped, and the hot user set is revalidated in the background. Leaderboard
+pages are not snapshotted; the first view after a restart renders them again.
+"""
+from __future__ import annotations
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Optional
+
+from . import db
+from .services import dedup, weather_service, xp_service
+
+SNAPSHOT_VERSION = 1
+
+
+def _path() -> Path:
+    return Path(os.getenv("SNAPSHOT_PATH", ".cache/bot_snapshot.json.gz"))
+
+
+def _write(path: Path, payload: dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def _read(path: Path) -> Optional[dict]:
+    if not path.exists():
+        return None
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return json.load(f)
+    finally:
+        # consumed exactly once, even if it turns out to be unreadable
+        path.unlink(missing_ok=True)
+
+
+async def save() -> Optional[Path]:
+    """Write the current caches and pending XP to the snapshot file."""
+    payload = {
+        "version": SNAPSHOT_VERSION,
+        "saved_at": time.time(),
+        "db": db.export_cache(),
+        "weather": weather_service.export_cache(),
+        "pending_xp": xp_service.export_pending(),
+        "dedup": dedup.export_state(),
+    }
+    path = _path()
+    try:
+        await asyncio.to_thread(_write, path, payload)
+    except Exception as e:
+        logging.warning("Failed to write cache snapshot %s: %s", path, e)
+        return None
+    return path
+
+
+async def load() -> Optional[dict]:
+    """Restore the snapshot written by `save`.
+
+    Returns the revalidation plan for `revalidate`, or None if there was no
+    usable snapshot.
+    """
+    path = _path()
+    try:
+        payload = await asyncio.to_thread(_read, path)
+    except Exception as e:
+        logging.warning("Ignoring unreadable cache snapshot %s: %s", path, e)
+        return None
+    if not payload or payload.get("version") != SNAPSHOT_VERSION:
+        return None
+
+    elapsed = max(0.0, time.time() - float(payload.get("saved_at", 0)))
+    plan = db.import_cache(payload.get("db", {}), elapsed)
+    restored_weather = weather_service.import_cache(payload.get("weather", {}), elapsed)
+    await xp_service.import_pending(payload.get("pending_xp", {}))
+    dedup.import_state(payload.get("dedup", {}))
+    logging.info(
+        "Loaded cache snapshot (%.0fs old): %d users, %d weather entries",
+        elapsed,
+        len(plan["users"]),
+        restored_weather,
+    )
+    return plan
+
+
+async def revalidate(plan: Optional[dict]) -> None:
+    """Refresh the snapshotted hot users from the database."""
+    if not plan:
+        return
+    try:
+        loaded = await db.prefetch_users(plan.get("users", []))
+        logging.info("Revalidated %d cached users after restart", loaded)
+    except Exception as e:
+        logging.warning("Cache revalidation failed: %s", e)
@@ -2,7 +2,7 @@
 from __future__ import annotations
 import datetime
 from datetime import timezone
-from typing import Any, Dict, Iterable, List
+from typing import Any, Iterable, List, Optional
 
 
 KST = datetime.timezone(datetime.timedelta(hours=9))
@@ -24,6 +24,12 @@ def extract_ttl_from_args(args: List[str]) -> float | None:
     return None
 
 
+def seconds_until_next_kst_midnight() -> float:
+    now = datetime.datetime.now(KST)
+    midnight = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time(), tzinfo=KST)
+    return (midnight - now).total_seconds()
+
+
 def parse_iso_to_kst(iso: str) -> datetime.datetime:
     """Parse an ISO timestamp and return it as a KST-aware datetime."""
     if iso is None:
@@ -34,10 +40,15 @@ def parse_iso_to_kst(iso: str) -> datetime.datetime:
     return dt.astimezone(KST)
 
 
-def format_ts_kst(iso: str | None) -> str:
-    """Return a nicely formatted KST timestamp (YYYY-MM-DD HH:MM KST)."""
+def format_ts_kst(iso: str | datetime.datetime | None) -> str:
+    """Return a nicely formatted KST timestamp (YYYY-MM-DD HH:MM KST).
+
+    Accepts an ISO string or an already-decoded aware datetime.
+    """
     if not iso:
         return "-"
+    if isinstance(iso, datetime.datetime):
+        return iso.astimezone(KST).strftime("%Y-%m-%d %H:%M:%S KST")
     try:
         dt = parse_iso_to_kst(iso)
     except Exception:
@@ -59,29 +70,115 @@ def format_xp_progress(xp: int, level: int, next_level_xp: int) -> str:
     return f"Lv{level} — {xp} XP ({gained}/{total_needed} | {percent}%)"
 
 
-def format_leaderboard(rows: Iterable[Dict[str, Any]]) -> str:
-    """Rows should include id, username, xp, level; returns formatted text with medals for top 3."""
+def format_rank_delta(delta: Optional[int]) -> str:
+    """▲n / ▼n for positions gained or lost, ＝ for unchanged, 🆕 for None (not ranked before)."""
+    if delta is None:
+        return "🆕"
+    if delta > 0:
+        return f"▲{delta}"
+    if delta < 0:
+        return f"▼{-delta}"
+    return "＝"
+
+
+def format_leaderboard(rows: Iterable[Any], start: int = 1, deltas: Optional[dict] = None) -> str:
+    """Rows are `LeaderboardEntry`-like (id, username, xp, level); returns formatted text with medals for top 3.
+
+    `start` is the rank of the first row (for later pages). `deltas` maps user
+    ids to rank changes (see `format_rank_delta`); rows without one get no marker.
+    """
     medals = ["🥇", "🥈", "🥉"]
     lines: List[str] = []
     # calculate column widths
     items = list(rows)
-    name_len = max((len(str(r.get("username") or r.get("id"))) for r in items), default=7)
-    xp_len = max((len(str(r.get("xp", 0))) for r in items), default=3)
-    for i, row in enumerate(items, start=1):
-        name = (row.get("username") or row.get("id"))
-        xp = row.get("xp", 0)
-        lvl = row.get("level", 1)
+    name_len = max((len(str(r.username or r.id)) for r in items), default=7)
+    xp_len = max((len(str(r.xp)) for r in items), default=3)
+    for i, row in enumerate(items, start=start):
+        name = (row.username or row.id)
+        xp = row.xp
+        lvl = row.level
         medal = medals[i - 1] if i <= 3 else f"{i}."
-        lines.append(f"{medal} {str(name):{name_len}} — Lv{lvl:>2} — {xp:>{xp_len}} XP")
+        line = f"{medal} {str(name):{name_len}} — Lv{lvl:>2} — {xp:>{xp_len}} XP"
+        if deltas and row.id in deltas:
+            line += f" {format_rank_delta(deltas[row.id])}"
+        lines.append(line)
     return "\n".join(lines)
 
 
+def format_attendance_calendar(year: int, month: int, days: Iterable[int], today: datetime.date | None = None) -> str:
+    """Render a Monday-first month grid; attended days are marked with ✓, today with *."""
+    attended = set(days)
+    first = datetime.date(year, month, 1)
+    nxt = datetime.date(year + (month == 12), month % 12 + 1, 1)
+    cells = ["   "] * first.weekday()
+    for d in range(1, (nxt - first).days + 1):
+        if d in attended:
+            mark = "✓"
+        elif today is not None and today == datetime.date(year, month, d):
+            mark = "*"
+        else:
+            mark = " "
+        cells.append(f"{d:>2}{mark}")
+    lines = [" 월 화 수 목 금 토 일"]
+    for i in range(0, len(cells), 7):
+        lines.append("".join(cells[i:i + 7]).rstrip())
+    return "\n".join(lines)
+
+
+def format_xp_history(daily: Iterable[tuple[str, int]], hourly: List[int]) -> str:
+    """Render `/xp history`: a 24h sparkline followed by one line per KST day."""
+    blocks = "▁▂▃▄▅▆▇█"
+    peak = max(hourly, default=0)
+    spark = "".join(blocks[min(len(blocks) - 1, (v * len(blocks)) // (peak + 1))] if v else " " for v in hourly)
+    daily = list(daily)
+    lines = [
+        "📈 XP 기록",
+        f"최근 24시간: {sum(hourly)} XP",
+        f"[{spark}]",
+        f"최근 {len(daily)}일: {sum(v for _, v in daily)} XP",
+    ]
+    weekdays = "월화수목금토일"
+    for day, amount in reversed(daily):
+        d = datetime.date.fromisoformat(day)
+        lines.append(f"- {d.strftime('%m-%d')} ({weekdays[d.weekday()]}): {amount} XP")
+    return "\n".join(lines)
+
+
+def format_chat_stats(
+    day: datetime.date,
+    messages: int,
+    active_users: int,
+    attendances: int,
+    top: Iterable[tuple[int, Optional[str], int]],
+    title: str = "📊 채팅 통계",
+) -> str:
+    """Render `/stats` and the daily digest; `top` holds (user_id, username, messages)."""
+    lines = [
+        f"{title} ({day.isoformat()})",
+        f"💬 메시지: {messages:,}개",
+        f"👥 활동한 사용자: 약 {active_users:,}명",
+        f"📅 출석: {attendances:,}명",
+    ]
+    top = list(top)
+    if top:
+        lines.append("🗣️ 가장 활발한 사용자:")
+        for i, (uid, username, n) in enumerate(top, start=1):
+            # no "@" so the digest does not ping everyone it lists
+            lines.append(f"{i}. {username or f'ID:{uid}'} — {n:,}개")
+    return "\n".join(lines)
+
+
 __all__ = [
     "KST",
     "extract_ttl_from_args",
+    "seconds_until_next_kst_midnight",
     "parse_iso_to_kst",
     "format_ts_kst",
     "format_username",
     "format_xp_progress",
+    "format_rank_delta",
     "format_leaderboard",
+    "format_xp_history",
+    "format_attendance_calendar",
+    "format_chat_stats",
 ]
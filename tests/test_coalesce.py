@@ -0,0 +1,81 @@
+import asyncio
+from types import SimpleNamespace
+
+from telegram_bot.handlers import telegram_utils
+from telegram_bot.services import coalesce
+
+
+class _Message:
+    def __init__(self, message_id):
+        self.message_id = message_id
+        self.replies = []
+        self.deleted = False
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append((text, kwargs))
+        return _Message(100 + len(self.replies))
+
+    async def delete(self):
+        self.deleted = True
+
+
+def _update(message):
+    return SimpleNamespace(message=message, effective_chat=SimpleNamespace(id=-5, type="group"))
+
+
+def test_identical_request_points_at_the_first_reply(monkeypatch):
+    monkeypatch.setattr(coalesce, "_entries", {})
+    first, second, third = _Message(1), _Message(2), _Message(3)
+    sent_ids = []
+
+    async def main():
+        async def send():
+            reply = await first.reply_text("answer")
+            sent_ids.append(reply.message_id)
+            return reply.message_id
+
+        await telegram_utils.send_coalesced(_update(first), None, ("help",), send)
+        await telegram_utils.send_coalesced(_update(second), None, ("help",), send)
+        await telegram_utils.send_coalesced(_update(third), None, ("help",), send)
+
+    asyncio.run(main())
+
+    assert len(sent_ids) == 1
+    assert not second.deleted and not third.deleted
+    [(text, kwargs)] = second.replies
+    assert text == telegram_utils.COALESCED_TEXT
+    assert kwargs["reply_to_message_id"] == sent_ids[0]
+    # one pointer per window
+    assert third.replies == []
+
+
+def test_failed_reply_is_not_coalesced(monkeypatch):
+    monkeypatch.setattr(coalesce, "_entries", {})
+    calls = []
+
+    async def send():
+        calls.append(1)
+        return None
+
+    async def main():
+        assert await coalesce.run_once(-5, "k", send) is None
+        assert await coalesce.run_once(-5, "k", send) is None
+
+    asyncio.run(main())
+    assert len(calls) == 2
+
+
+def test_waiters_share_a_failed_reply(monkeypatch):
+    monkeypatch.setattr(coalesce, "_entries", {})
+    calls = []
+
+    async def send():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return None
+
+    async def main():
+        return await asyncio.gather(*(coalesce.run_once(-5, "k", send) for _ in range(5)))
+
+    assert asyncio.run(main()) == [None] * 5
+    assert len(calls) == 1
@@ -0,0 +1,91 @@
+import asyncio
+import itertools
+import threading
+import time
+
+import pytest
+
+from telegram_bot import db
+from telegram_bot.executor import DeadlineExceeded, LaneExecutor
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    ex = LaneExecutor("t", {db.INTERACTIVE: 2})
+    monkeypatch.setattr(db, "_executor", ex)
+    monkeypatch.setattr(db, "_hedge_stats", {"sent": 0, "won": 0})
+    monkeypatch.setenv("DB_HEDGE_AFTER_SEC", "0.05")
+    db._breaker.record_success()
+    yield ex
+    ex.shutdown(wait=False)
+
+
+def _slow_then_fast():
+    calls = itertools.count()
+
+    def fn():
+        if next(calls) == 0:
+            time.sleep(0.5)
+            return "slow"
+        return "fast"
+
+    return fn
+
+
+def test_hedging_survives_an_expired_queued_call(executor):
+    release = threading.Event()
+
+    async def main():
+        # fill both workers, then let a queued call hit its deadline
+        blockers = [asyncio.ensure_future(executor.run(release.wait, 5, lane=db.INTERACTIVE)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        with pytest.raises(DeadlineExceeded):
+            await executor.run(time.sleep, 0, lane=db.INTERACTIVE, deadline=0.05)
+        release.set()
+        await asyncio.gather(*blockers)
+        assert executor.queued(db.INTERACTIVE) == 0
+        return await db._run_hedged(_slow_then_fast())
+
+    assert asyncio.run(main()) == "fast"
+    assert db._hedge_stats == {"sent": 1, "won": 1}
+
+
+def test_no_hedge_without_an_idle_worker(executor):
+    release = threading.Event()
+
+    async def main():
+        blocker = asyncio.ensure_future(executor.run(release.wait, 5, lane=db.INTERACTIVE))
+        await asyncio.sleep(0.05)
+        try:
+            return await db._run_hedged(_slow_then_fast())
+        finally:
+            release.set()
+            await blocker
+
+    assert asyncio.run(main()) == "slow"
+    assert db._hedge_stats["sent"] == 0
+
+
+def test_hedged_pair_counts_as_one_breaker_failure(executor):
+    def fail():
+        time.sleep(0.1)
+        raise OSError("connection reset")
+
+    with pytest.raises(db.DatabaseUnavailable):
+        asyncio.run(db._run_hedged(fail))
+    assert db._hedge_stats["sent"] == 1
+    assert db._breaker.snapshot()["failures"] == 1
+
+
+def test_hedged_pair_with_one_success_records_no_failure(executor):
+    calls = itertools.count()
+
+    def fn():
+        if next(calls) == 0:
+            time.sleep(0.1)
+            raise OSError("connection reset")
+        time.sleep(0.2)
+        return "ok"
+
+    assert asyncio.run(db._run_hedged(fn)) == "ok"
+    assert db._breaker.snapshot()["failures"] == 0
@@ -0,0 +1,74 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from telegram_bot.executor import DeadlineExceeded, LaneExecutor
+
+
+def test_expired_queued_calls_release_counters():
+    ex = LaneExecutor("t", {"a": 1})
+    release = threading.Event()
+
+    async def main():
+        slow = asyncio.ensure_future(ex.run(release.wait, 5, lane="a", deadline=5))
+        await asyncio.sleep(0.05)
+        queued = [asyncio.ensure_future(ex.run(time.sleep, 0, lane="a", deadline=0.1)) for _ in range(4)]
+        results = await asyncio.gather(*queued, return_exceptions=True)
+        assert all(isinstance(r, DeadlineExceeded) for r in results)
+        assert ex.queued("a") == 0
+        release.set()
+        await slow
+
+    try:
+        asyncio.run(main())
+        stats = ex.stats()["a"]
+        assert stats["submitted"] == 5
+        assert stats["completed"] == 1
+        assert stats["timed_out"] == 4
+        assert stats["queued"] == 0
+        assert stats["running"] == 0
+    finally:
+        ex.shutdown()
+
+
+def test_cancelled_queued_call_releases_queue():
+    ex = LaneExecutor("t", {"a": 1})
+    release = threading.Event()
+
+    async def main():
+        slow = asyncio.ensure_future(ex.run(release.wait, 5, lane="a"))
+        await asyncio.sleep(0.05)
+        waiting = asyncio.ensure_future(ex.run(time.sleep, 0, lane="a"))
+        await asyncio.sleep(0.05)
+        assert ex.queued("a") == 1
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert ex.queued("a") == 0
+        release.set()
+        await slow
+
+    try:
+        asyncio.run(main())
+        assert ex.stats()["a"]["timed_out"] == 0
+    finally:
+        ex.shutdown()
+
+
+def test_timeout_raised_by_fn_is_not_a_deadline():
+    ex = LaneExecutor("t", {"a": 1})
+
+    def boom():
+        raise TimeoutError("socket")
+
+    try:
+        with pytest.raises(TimeoutError) as info:
+            asyncio.run(ex.run(boom, lane="a", deadline=5))
+        assert not isinstance(info.value, DeadlineExceeded)
+        stats = ex.stats()["a"]
+        assert stats["timed_out"] == 0
+        assert stats["failed"] == 1
+    finally:
+        ex.shutdown()
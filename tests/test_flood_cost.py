@@ -0,0 +1,27 @@
+from types import SimpleNamespace
+
+from telegram_bot.handlers import flood
+
+
+def _update(text=None, callback=None, inline=False):
+    message = SimpleNamespace(text=text, location=None) if text is not None else None
+    query = SimpleNamespace(data=callback) if callback is not None else None
+    return SimpleNamespace(
+        callback_query=query,
+        inline_query=SimpleNamespace(query="서") if inline else None,
+        message=message,
+    )
+
+
+def _cost(update):
+    return flood.update_cost(update, SimpleNamespace(user_data={}))
+
+
+def test_weather_all_costs_like_the_all_button():
+    assert _cost(_update("/weather all")) == _cost(_update(callback="All"))
+    assert _cost(_update("/weather@bot 전체")) == _cost(_update(callback="All"))
+    assert _cost(_update("/weather 서울")) == 2
+
+
+def test_inline_queries_are_charged():
+    assert _cost(_update(inline=True)) > 0
@@ -0,0 +1,48 @@
+import datetime
+import json
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+import maintenance  # noqa: E402
+
+
+class _RecordingCursor:
+    def __init__(self):
+        self.params = None
+
+    def execute(self, query, params=None):
+        self.params = params
+
+
+def _stored(position):
+    cur = _RecordingCursor()
+    maintenance.save_checkpoint(cur, "export:xp_rollups:/tmp/x.csv", position)
+    job, adapted = cur.params
+    # what psycopg2 sends to Postgres for the jsonb column, read back the way load_checkpoint does
+    return maintenance._decode_position(json.loads(adapted.dumps(adapted.adapted)))
+
+
+def test_checkpoint_with_timestamp_key_round_trips():
+    bucket = datetime.datetime(2024, 5, 1, 13, 0, 0, 123456, tzinfo=datetime.timezone.utc)
+    position = {"after": [42, "hour", bucket], "rows": 1000, "offset": 5120}
+
+    loaded = _stored(position)
+
+    assert loaded["rows"] == 1000
+    assert loaded["after"] == [42, "hour", bucket]
+
+
+def test_resumed_range_binds_the_stored_key():
+    bucket = datetime.datetime(2024, 5, 1, 13, tzinfo=datetime.timezone(datetime.timedelta(hours=9)))
+    loaded = _stored({"after": [7, "day", bucket], "rows": 2, "offset": 10})
+
+    _, params = maintenance._range_where(maintenance.TABLE_KEYS["xp_rollups"], loaded["after"], None)
+
+    assert params == [7, "day", bucket]
+
+
+def test_unsupported_values_still_fail_loudly():
+    with pytest.raises(TypeError):
+        _stored({"after": [object()]})
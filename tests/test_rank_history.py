@@ -0,0 +1,32 @@
+import datetime
+from array import array
+
+from telegram_bot.services import rank_history
+
+
+def _install(monkeypatch, pairs, complete):
+    monkeypatch.setattr(rank_history, "_day", None)
+    monkeypatch.setattr(rank_history, "_ranks", {})
+    monkeypatch.setattr(rank_history, "_complete", False)
+    rank_history._install(datetime.date(2024, 5, 1), array("q", pairs), complete)
+
+
+def test_rank_delta_below_a_truncated_snapshot_is_unknown(monkeypatch):
+    # users 1 and 2 held ranks 1 and 2 in a snapshot cut off after two users
+    _install(monkeypatch, [1, 500, 2, 400], complete=False)
+
+    assert rank_history.rank_delta(2, 1) == (True, 1)
+    assert rank_history.rank_delta(3, 2) == (True, None)
+    assert rank_history.rank_delta(4, 40) == (False, None)
+
+
+def test_rank_delta_in_a_complete_snapshot_marks_new_users(monkeypatch):
+    _install(monkeypatch, [1, 500, 2, 400], complete=True)
+
+    assert rank_history.rank_delta(4, 40) == (True, None)
+
+
+def test_rank_delta_without_a_snapshot(monkeypatch):
+    monkeypatch.setattr(rank_history, "_day", None)
+
+    assert rank_history.rank_delta(1, 1) == (False, None)
@@ -0,0 +1,25 @@
+import asyncio
+import datetime
+
+from telegram_bot.services import stats_service
+
+
+def test_old_and_future_days_are_not_kept_in_memory(monkeypatch):
+    today = datetime.date(2024, 5, 10)
+    reads = []
+
+    async def get_chat_daily_stats(chat_ids, days):
+        reads.append((tuple(chat_ids), tuple(days)))
+        return []
+
+    monkeypatch.setattr(stats_service, "today_kst", lambda: today)
+    monkeypatch.setattr(stats_service, "_days", {})
+    monkeypatch.setattr(stats_service.db, "get_chat_daily_stats", get_chat_daily_stats)
+
+    old = asyncio.run(stats_service.get_stats(-1, datetime.date(2023, 1, 1)))
+    future = asyncio.run(stats_service.get_stats(-1, datetime.date(2099, 1, 1)))
+
+    assert old.status == "empty"
+    assert future.status == "future"
+    assert reads == [((-1,), ("2023-01-01",))]
+    assert stats_service._days == {}
@@ -0,0 +1,23 @@
+from telegram_bot.services import weather_service
+
+
+def test_stale_observation_waits_a_full_cadence():
+    now = 1_700_000_000.0
+    # observed 15 minutes ago, so the next report was due 5 minutes ago
+    data = {"dt": int(now) - 900}
+
+    assert weather_service._current_expiry(data, now) == now + weather_service._CURRENT_CADENCE
+
+
+def test_fresh_observation_expires_at_the_next_report():
+    now = 1_700_000_000.0
+    data = {"dt": int(now) - 120}
+
+    assert weather_service._current_expiry(data, now) == now - 120 + weather_service._CURRENT_CADENCE
+
+
+def test_imminent_report_keeps_the_minimum_ttl():
+    now = 1_700_000_000.0
+    data = {"dt": int(now) - weather_service._CURRENT_CADENCE + 10}
+
+    assert weather_service._current_expiry(data, now) == now + weather_service._MIN_TTL
@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+from telegram_bot.services import weather_service
+
+
+class _Response:
+    status_code = 404
+
+    def json(self):
+        return {"cod": "404"}
+
+
+@pytest.fixture
+def api(monkeypatch):
+    calls = []
+
+    async def call_api(url):
+        calls.append(url)
+        return _Response()
+
+    monkeypatch.setattr(weather_service, "_call_api", call_api)
+    monkeypatch.setattr(weather_service, "_get_token", lambda: "t")
+    monkeypatch.setattr(weather_service, "_cache", {})
+    monkeypatch.setattr(weather_service, "_not_found", {})
+    return calls
+
+
+def test_unknown_city_is_not_looked_up_again(api):
+    async def main():
+        return [await weather_service.get_weather_raw("Seo") for _ in range(3)]
+
+    assert asyncio.run(main()) == [None, None, None]
+    assert len(api) == 1
+
+
+def test_not_found_expires(api, monkeypatch):
+    async def main():
+        await weather_service.get_weather_raw("Seo")
+        weather_service._not_found["seo"] = 0
+        await weather_service.get_weather_raw("Seo")
+
+    asyncio.run(main())
+    assert len(api) == 2
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from telegram_bot.services import leaderboard_service, xp_service
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    calls = {"events": [], "chat": []}
+    registered = {1}
+
+    async def add_xp(uid, amt):
+        if uid not in registered:
+            return None
+        return {"old_xp": 0, "new_xp": amt, "old_level": 1, "new_level": 1}
+
+    async def add_chat_xp(chat_id, uid, amt):
+        calls["chat"].append((chat_id, uid, amt))
+        return {"new_xp": amt}
+
+    async def record_xp_events(events):
+        calls["events"].extend(events)
+
+    for name in ("_pending", "_pending_chat", "_pending_events", "_pending_names", "_pending_last_chat"):
+        monkeypatch.setattr(xp_service, name, {})
+    monkeypatch.setattr(xp_service.db, "add_xp", add_xp)
+    monkeypatch.setattr(xp_service.db, "add_chat_xp", add_chat_xp)
+    monkeypatch.setattr(xp_service.db, "record_xp_events", record_xp_events)
+    monkeypatch.setattr(leaderboard_service, "note_global_xp_change", lambda: None)
+    monkeypatch.setattr(leaderboard_service, "apply_chat_xp", lambda *a: None)
+    return calls
+
+
+def test_events_are_only_logged_for_applied_xp(fake_db):
+    async def main():
+        await xp_service.queue_xp(1, 5, chat_id=-10)
+        await xp_service.queue_xp(2, 5, chat_id=-10)
+        await xp_service.flush_pending()
+
+    asyncio.run(main())
+
+    assert [e["user_id"] for e in fake_db["events"]] == [1]
+    assert xp_service._pending_events == {}
+
+
+def test_chat_ledger_skips_unregistered_users(fake_db):
+    async def main():
+        await xp_service.queue_xp(1, 5, chat_id=-10)
+        await xp_service.queue_xp(2, 5, chat_id=-10)
+        await xp_service.flush_pending()
+
+    asyncio.run(main())
+
+    assert fake_db["chat"] == [(-10, 1, 5)]
+    assert xp_service._pending_chat == {}
+
+
+def test_snapshot_keeps_the_announcement_chat(fake_db, monkeypatch):
+    published = []
+
+    async def add_xp(uid, amt):
+        return {"old_xp": 0, "new_xp": amt, "old_level": 1, "new_level": 2}
+
+    monkeypatch.setattr(xp_service.db, "add_xp", add_xp)
+    monkeypatch.setattr(xp_service.event_bus, "publish", published.append)
+
+    async def main():
+        await xp_service.queue_xp(1, 500, chat_id=-10)
+        snapshot = xp_service.export_pending()
+        for queue in (xp_service._pending, xp_service._pending_chat, xp_service._pending_events, xp_service._pending_last_chat):
+            queue.clear()
+        await xp_service.import_pending(snapshot)
+        await xp_service.flush_pending()
+
+    asyncio.run(main())
+
+    [event] = published
+    assert event.chat_id == -10